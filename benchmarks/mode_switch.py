@@ -0,0 +1,72 @@
+"""Time of switching between the launch and the edit mode.
+
+Builds the widgets of profiles of 10, 100 and 1,000 processes and toggles
+the mode a few times, as with Ctrl+E. Run from the root of the project:
+
+    python benchmarks/mode_switch.py [n_processes ...]
+
+Without a display, set QT_QPA_PLATFORM=offscreen.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyQt5.QtWidgets import QApplication
+
+from src.app_widget import AppWidget
+
+N_GROUPS = 10
+N_TOGGLES = 6
+
+
+def make_profile(n_processes: int) -> dict:
+    return {"groups": [{
+        "name": "group {}".format(group),
+        "processes": [{
+            "name": "process {}".format(i),
+            "dir": "~/",
+            "args": ["sleep", "60"],
+        } for i in range(group, n_processes, N_GROUPS)]
+    } for group in range(min(N_GROUPS, n_processes))]}
+
+
+def benchmark(app: QApplication, n_processes: int):
+    widget = AppWidget()
+    # Always the widget grid, never the tree of large profiles
+    widget.max_process_widgets = n_processes
+    start = time.perf_counter()
+    widget.create_groups_from_dict(make_profile(n_processes))
+    widget.show()
+    app.processEvents()
+    load_time = time.perf_counter() - start
+
+    # Time of toggle_edit itself, and with the layout and paint that follow
+    toggle_times = []
+    times = []
+    for _ in range(N_TOGGLES):
+        start = time.perf_counter()
+        widget.toggle_edit()
+        toggle_times.append(time.perf_counter() - start)
+        app.processEvents()
+        times.append(time.perf_counter() - start)
+
+    average = lambda values: sum(values) / len(values) * 1000
+    print("{:>6} processes: load {:8.1f} ms, first toggle {:8.1f} ms, next toggles "
+          "{:8.1f} ms ({:.1f} ms without layout and paint)".format(
+              n_processes, load_time * 1000, times[0] * 1000,
+              average(times[1:]), average(toggle_times[1:])))
+    widget.clear_groups()
+    widget.deleteLater()
+    app.processEvents()
+
+
+def main():
+    app = QApplication(sys.argv[:1])
+    for n_processes in [int(n) for n in sys.argv[1:]] or [10, 100, 1000]:
+        benchmark(app, n_processes)
+
+
+if __name__ == '__main__':
+    main()
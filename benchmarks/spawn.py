@@ -0,0 +1,105 @@
+"""Spawns per second from a launcher holding a lot of memory.
+
+Allocates 500 MB, like a large GUI, and launches ``true`` from 1, 10 and 100
+threads at the same time, like the launch pool does:
+
+- ``fork``: a process with limits applied by a preexec_fn, which makes
+  subprocess fork the whole launcher
+- ``vfork, limits``: the same process started stopped, see STOPPED_START in
+  process.py, which is how processes with limits are launched
+- ``vfork``: a process without limits
+- ``posix_spawn``: os.posix_spawn, for reference, as it can't set the
+  directory of the process
+
+Run from the root of the project:
+
+    python benchmarks/spawn.py [--memory 500] [--launches 200]
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import process as process_module
+from src.command import CommandSpec
+from src.process import DirectProcess
+from src.limits import ProcessLimits
+
+CONCURRENCY = (1, 10, 100)
+TRUE = "/bin/true"
+
+
+def make_processes(n: int, limits: bool) -> list:
+    processes = []
+    for i in range(n):
+        process = DirectProcess(name="true {}".format(i), command=CommandSpec([TRUE], "/tmp"))
+        if limits:
+            process.limits = ProcessLimits(nice=0)
+        processes.append(process)
+    return processes
+
+
+def spawns_per_second(launch, items: list, concurrency: int) -> float:
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        list(executor.map(launch, items))
+        return len(items) / (time.perf_counter() - start)
+
+
+def run_processes(n: int, concurrency: int, limits: bool, stopped_start=True) -> float:
+    process_module.USE_STOPPED_START = stopped_start and process_module.USE_PROCESS_GROUPS
+    processes = make_processes(n, limits)
+    try:
+        return spawns_per_second(lambda process: process.run(), processes, concurrency)
+    finally:
+        for process in processes:
+            process.popen.wait()
+
+
+def run_posix_spawn(n: int, concurrency: int) -> float:
+    environ = dict(os.environ)
+    pids = []
+    rate = spawns_per_second(
+        lambda _: pids.append(os.posix_spawn(TRUE, [TRUE], environ, setsid=True)),
+        range(n), concurrency)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--memory', type=int, default=500, help='MB held by the launcher')
+    parser.add_argument('--launches', type=int, default=200)
+    args = parser.parse_args()
+
+    ballast = bytearray(args.memory * 1024 * 1024)
+    # Touched, so that the pages are really mapped
+    for i in range(0, len(ballast), 4096):
+        ballast[i] = 1
+
+    stopped_start = process_module.USE_STOPPED_START
+    methods = [
+        ("fork", lambda n, c: run_processes(n, c, limits=True, stopped_start=False)),
+        ("vfork, limits", lambda n, c: run_processes(n, c, limits=True)),
+        ("vfork", lambda n, c: run_processes(n, c, limits=False)),
+    ]
+    if hasattr(os, 'posix_spawn'):
+        methods.append(("posix_spawn", run_posix_spawn))
+
+    print("Spawns/s of {} launches from a launcher of {} MB:".format(
+        args.launches, args.memory))
+    print("  {:<16}".format("") + "".join("{:>10}".format(
+        "{} thr.".format(c)) for c in CONCURRENCY))
+    for name, method in methods:
+        if name == "vfork, limits" and not stopped_start:
+            continue
+        rates = [method(args.launches, concurrency) for concurrency in CONCURRENCY]
+        print("  {:<16}".format(name) + "".join("{:>10.0f}".format(r) for r in rates))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Time of the start of the GUI, up to the first paint and until it's ready.
+
+Starts ``main.py --profile-startup`` a few times, without a profile and with
+each given profile, in a temporary home folder so that the configuration of
+the user isn't used, and prints the median time of every phase. Run from
+the root of the project:
+
+    python benchmarks/startup.py [--theme dark] [profile.json ...]
+
+Without a display, set QT_QPA_PLATFORM=offscreen.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+N_RUNS = 7
+LINE = re.compile(r"startup: (.+?)\s+([\d.]+) ms$")
+
+
+def run_once(home: str, profile: str or None) -> dict:
+    args = [sys.executable, os.path.join(ROOT, 'main.py'), '--profile-startup']
+    if profile:
+        args.append(os.path.abspath(profile))
+    env = dict(os.environ, HOME=home)
+    process = subprocess.Popen(args, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                               env=env, universal_newlines=True)
+    times = {}
+    try:
+        for line in process.stderr:
+            match = LINE.match(line.strip())
+            if match:
+                times[match.group(1)] = float(match.group(2))
+                if match.group(1) == "ready":
+                    break
+    finally:
+        process.kill()
+        process.wait()
+    return times
+
+
+def benchmark(profile: str or None, theme: str):
+    with tempfile.TemporaryDirectory() as home:
+        os.makedirs(os.path.join(home, '.process_launcher'))
+        with open(os.path.join(home, '.process_launcher', 'configuration.json'), 'w') as f:
+            json.dump({"theme": theme}, f)
+        runs = defaultdict(list)
+        for _ in range(N_RUNS):
+            for phase, duration in run_once(home, profile).items():
+                runs[phase].append(duration)
+
+    print("{} ({} theme), median of {} runs:".format(
+        profile or "no profile", theme, N_RUNS))
+    for phase, durations in runs.items():
+        print("  {:<24} {:8.1f} ms".format(phase, statistics.median(durations)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('profiles', nargs='*', help='profile JSON files')
+    parser.add_argument('--theme', default='default', choices=['default', 'dark-gray', 'dark'])
+    args = parser.parse_args()
+    for profile in [None] + args.profiles:
+        benchmark(profile, args.theme)
+
+
+if __name__ == '__main__':
+    main()
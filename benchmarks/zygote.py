@@ -0,0 +1,69 @@
+"""Time of launching a Python process, spawned or forked from a zygote.
+
+Launches ``python3 -m worker`` a few times, where ``worker`` imports a set
+of standard modules, and waits for it to exit, first spawning it and then
+forking it from a zygote that preloaded the same modules. Prints the median
+time from the launch to the exit. Run from the root of the project:
+
+    python benchmarks/zygote.py [--python python3] [--runs 20]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.command import CommandSpec
+from src.process import DirectProcess
+from src.zygote import ZygoteSpec, get_zygote, shutdown_zygotes
+
+IMPORTS = ("asyncio", "json", "decimal", "email.parser", "http.client", "xml.dom.minidom",
+           "logging.handlers", "unittest", "argparse", "sqlite3")
+
+WORKER = "import {}\n".format(", ".join(IMPORTS))
+
+
+def launch_times(process: DirectProcess, runs: int) -> list:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process.restart()
+        if process.popen.wait() != 0:
+            raise RuntimeError("The worker failed")
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--python', default='python3')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, 'worker.py'), 'w') as f:
+            f.write(WORKER)
+        process = DirectProcess(name="worker", command=CommandSpec(
+            [args.python, '-m', 'worker'], folder))
+        spawned = launch_times(process, args.runs)
+
+        process.zygote = get_zygote(ZygoteSpec(args.python, list(IMPORTS), folder))
+        start = time.perf_counter()
+        # The first launch starts the zygote
+        process.restart()
+        process.popen.wait()
+        first = (time.perf_counter() - start) * 1000
+        forked = launch_times(process, args.runs)
+        shutdown_zygotes()
+
+    print("python -m worker, median of {} launches until exit:".format(args.runs))
+    print("  {:<28} {:8.1f} ms".format("spawned", statistics.median(spawned)))
+    print("  {:<28} {:8.1f} ms".format("zygote, first launch", first))
+    print("  {:<28} {:8.1f} ms".format("forked from the zygote", statistics.median(forked)))
+
+
+if __name__ == '__main__':
+    main()
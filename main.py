@@ -1,6 +1,6 @@
 #!/usr/bin/python3
 
-from src.app_window import main
+from src.cli import main
 
 if __name__ == '__main__':
     main()
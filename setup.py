@@ -7,10 +7,10 @@ setup(name='process_launcher',
     package_dir={'process_launcher': 'src/'},
       entry_points={
           'console_scripts': [
-              'process_launcher = process_launcher.app_window:main'
+              'process_launcher = process_launcher.cli:main'
           ],
       },
       # data_files=[('.', ['img/*'])],
-      package_data={'process_launcher': ['img/fontawesome/*.svg', 'img/fontawesome/regular/*.svg', 'img/fontawesome/solid/*.svg', 'get_windowid.sh']},
+      package_data={'process_launcher': ['img/fontawesome/*.svg', 'img/fontawesome/regular/*.svg', 'img/fontawesome/solid/*.svg']},
       author='Borja Fourquet'
       )
@@ -1,16 +1,49 @@
+from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtWidgets import (QGridLayout, QWidget)
 
 from . import utils
 from .utils import AppMode
+from .launcher import LaunchPool
+from .supervisor import ChildSupervisor, RestartSupervisor
+from .log_store import LogStore
+from .resource_monitor import ResourceSampler
+from .process import stop_processes
 from .process_group_widget import ProcessGroup, empty_group_data
+from .environment import ProcessEnvironment
+from .zygote import ZygoteSpec
+from .profile_model import ProfileView
+
+DEFAULT_MAX_PROCESS_WIDGETS = 200
+"""Profiles with more processes are shown in a single ProfileView instead
+of a widget per process."""
 
 class AppWidget(QWidget):
     """docstring for AppWidget"""
 
+    # Index of an edited group, or None if groups were deleted
+    profile_changed = pyqtSignal(object)
+
     def __init__(self, window=None):
         super(AppWidget, self).__init__(window)
+        self._loading = False
         # TODO read this from settings
         self.n_columns = 3
+        self.launch_pool = LaunchPool(parent=self)
+        self.supervisor = ChildSupervisor(self)
+        self.log_store = LogStore()
+        self.launch_pool.launched.connect(self.supervisor.watch)
+        self.supervisor.exited.connect(self.on_process_exited)
+        self.restart_supervisor = RestartSupervisor(self.supervisor, self.launch_pool, self)
+        self.restart_supervisor.restart_requested.connect(self.on_restart_requested)
+        self.restart_supervisor.parked.connect(self.on_process_parked)
+        self.resource_sampler = ResourceSampler(parent=self)
+        self.launch_pool.launched.connect(self.resource_sampler.track)
+        self.resource_sampler.sampled.connect(self.on_resources_sampled)
+        self.resource_sampler.start()
+        self.group_widgets = []
+        self.profile_view = None
+        self.max_process_widgets = DEFAULT_MAX_PROCESS_WIDGETS
+        self.max_parallel_launches = None
 
         self.init_size()
         self._init_layout()
@@ -19,8 +52,14 @@ class AppWidget(QWidget):
 
     def clear_groups(self):
         """Removes all the widgets in this widget's layout."""
+        for group in self.group_widgets:
+            self._forget_group(group)
+        if self.profile_view:
+            self.profile_view.forget_all()
+            self.profile_view = None
         utils.clearLayout(self.widget_layout)
         self.group_widgets = []
+        self.on_group_changed(None)
 
     def init_size(self):
         self.setGeometry(300, 300, 900, 900)
@@ -34,55 +73,176 @@ class AppWidget(QWidget):
         for i, process_group in enumerate(self.group_widgets):
             process_group.group_number = i
             self.widget_layout.addWidget(
-                process_group, i / self.n_columns,
+                process_group, i // self.n_columns,
                 i % self.n_columns)
 
     def create_groups_from_dict(self, data: dict):
+        self._loading = True
+        try:
+            self._create_groups_from_dict(data)
+        finally:
+            self._loading = False
+
+    def _create_groups_from_dict(self, data: dict):
         self.clear_groups()
+        self.max_parallel_launches = data.get("max_parallel_launches")
+        self.launch_pool.set_max_in_flight(self.max_parallel_launches)
+        n_processes = sum(len(group_data["processes"]) for group_data in data["groups"])
+        if n_processes > self.max_process_widgets:
+            self.create_profile_view(data["groups"])
+            return
         for i, group_data in enumerate(data["groups"]):
             self.create_group_from_dict(group_data, i)
 
+    def create_profile_view(self, groups_data: list):
+        """Shows all the groups in a single tree, for large profiles."""
+        self.profile_view = ProfileView(self)
+        self.profile_view.load(groups_data)
+        self.profile_view.model.edited.connect(self.on_group_changed)
+        self.profile_view.change_mode(self.app_mode)
+        self.widget_layout.addWidget(self.profile_view, 0, 0, 1, self.n_columns)
+
     def create_group_from_dict(self, data: dict, index: int):
-        process_group = ProcessGroup(self, name=data["name"], group_number=len(self.group_widgets))
+        process_group = ProcessGroup(
+            self, name=data["name"], group_number=len(self.group_widgets),
+            max_parallel_launches=data.get("max_parallel_launches"),
+            environment=ProcessEnvironment.from_dict(data),
+            zygote=ZygoteSpec.from_dict(data))
         process_group.container.restore_processes(data["processes"])
         self.group_widgets.append(process_group)
         self.widget_layout.addWidget(
-            process_group, index / self.n_columns,
+            process_group, index // self.n_columns,
             index % self.n_columns)
 
         return process_group
 
     def add_empty_group_right(self):
         """Adds an empty group to the right of the rightmost existing group."""
+        if self.profile_view:
+            return self.profile_view.model.add_group()
         new_group = self.create_group_from_dict(empty_group_data, len(self.group_widgets))
         for n, group in enumerate(self.group_widgets):
             group.update_group_number(n)
+        self.on_group_changed(new_group)
 
         return new_group
 
     def delete_group(self, group):
         """Deletes a group from the app widget."""
         self.group_widgets.remove(group)
+        self._forget_group(group)
         group.deleteLater()
         self.adjust_groups_to_layout()
         for n, group in enumerate(self.group_widgets):
             group.update_group_number(n)
+        self.on_group_changed(None)
+
+    def on_group_changed(self, group):
+        """Emits profile_changed for an edited group, or None when groups
+        were deleted."""
+        if self._loading:
+            return
+        groups = self.profile_view.model.groups if self.profile_view else self.group_widgets
+        if group is None:
+            self.profile_changed.emit(None)
+        elif group in groups:
+            # Groups being built are not in the list yet
+            self.profile_changed.emit(groups.index(group))
+
+    def _forget_group(self, group):
+        """Stops tracking the processes of a group whose widgets are deleted."""
+        self.launch_pool.forget_group(group)
+        for process_widget in group.container.elements:
+            self.supervisor.unwatch(process_widget.process)
+            self.restart_supervisor.reset(process_widget.process)
+            self.resource_sampler.untrack(process_widget.process)
 
     def toJSON(self) -> dict:
         ret = {}
+        if self.max_parallel_launches:
+            ret["max_parallel_launches"] = self.max_parallel_launches
         ret["groups"] = []
         for group in self.group_widgets:
             ret["groups"].append(group.toJSON())
+        if self.profile_view:
+            ret["groups"] = self.profile_view.toJSON()
         return ret
 
-    def end_all(self):
-        for group in self.group_widgets:
+    def groups(self) -> list:
+        """The ProcessGroup widgets, or the GroupEntry of the profile view."""
+        if self.profile_view:
+            return list(self.profile_view.model.groups)
+        return list(self.group_widgets)
+
+    def group_processes(self, group) -> list:
+        """(name, process) pairs of a group of groups(), the process is None
+        if it was never launched from the profile view."""
+        if self.profile_view:
+            return [(entry.name, entry.process) for entry in group.entries]
+        return [(process.name, process) for process in group.processes]
+
+    def run_group(self, group):
+        """Launches a group without any dialog, e.g. for ctl.
+
+        Raises DependencyError if its ``depends_on`` can't be satisfied.
+        """
+        if self.profile_view:
+            self.profile_view.launch_group(group)
+        else:
+            group.container.launch_all()
+
+    def stop_group(self, group):
+        if self.profile_view:
+            self.profile_view.stop(group.entries)
+        else:
             group.container.kill_them_all()
+
+    def all_processes(self) -> list:
+        processes = [process for group in self.group_widgets for process in group.processes]
+        if self.profile_view:
+            processes.extend(self.profile_view.processes)
+        return processes
+
+    def on_process_exited(self, process):
+        if process.parent_widget is not None:
+            process.parent_widget.on_process_exited(process)
+        elif self.profile_view:
+            self.profile_view.on_process_exited(process)
+
+    def on_resources_sampled(self, samples: dict):
+        for process, sample in samples.items():
+            if process.parent_widget is not None:
+                process.parent_widget.update_resources(sample)
+        if self.profile_view:
+            self.profile_view.model.update_resources(samples)
+
+    def on_restart_requested(self, process):
+        if process.parent_widget is not None:
+            process.parent_widget.restart_automatically()
+        elif self.profile_view:
+            self.profile_view.on_restart_requested(process)
+
+    def on_process_parked(self, process):
+        if process.parent_widget is not None:
+            process.parent_widget.on_process_parked(process)
+        elif self.profile_view:
+            self.profile_view.on_process_parked(process)
+
+    def end_all(self):
+        """Stops every process, waiting for about one grace period."""
+        stop_processes(self.all_processes())
         self.clear_groups()
 
     def change_mode(self, mode: AppMode):
-        for group in self.group_widgets:
-            group.change_mode(mode)
+        # Repaint and lay out everything once, at the end
+        self.setUpdatesEnabled(False)
+        try:
+            for group in self.group_widgets:
+                group.change_mode(mode)
+            if self.profile_view:
+                self.profile_view.change_mode(mode)
+        finally:
+            self.setUpdatesEnabled(True)
 
         self.app_mode = mode
 
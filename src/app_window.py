@@ -2,60 +2,142 @@
 
 import sys
 import os
-import json
 import logging
 from functools import partial
 
-import qdarkstyle
-import qdarkgraystyle
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import QTimer, QObject, QEvent
 from PyQt5.QtWidgets import (QApplication, QMainWindow,
                              QAction, QFileDialog, QMessageBox)
 
 from .configuration import default_config_path, Configuration
-from .utils import AppMode, my_path  # , get_plaftorm
+from .profile import load_profile, save_profile
+from .zygote import shutdown_zygotes
+from .journal import ProfileJournal
+from .utils import AppMode  # , get_plaftorm
+from .icons import get_icon
 from .app_widget import AppWidget
+from .process import minimize_processes, restore_processes
+from .control_server import ControlServer
+from .startup import startup_timer
+
+startup_timer.mark("imports")
 
 logger = logging.getLogger('process_launcher')
 os.environ['QT_API'] = 'pyqt5'
 
+AUTOSAVE_DELAY = 2000
+"""Milliseconds without edits before the profile is saved automatically."""
+
+JOURNAL_DELAY = 300
+"""Milliseconds without edits before they are appended to the journal."""
+
+
+class _FirstPaintFilter(QObject):
+    """Calls a function once, right after the first paint of a widget."""
+
+    def __init__(self, widget, callback):
+        super(_FirstPaintFilter, self).__init__(widget)
+        self.callback = callback
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            obj.removeEventFilter(self)
+            # Queued, so that it runs once the paint itself is done
+            QTimer.singleShot(0, self.callback)
+        return False
+
 
 class AppWindow(QMainWindow):
     """docstring for AppWindow"""
 
     NO_SAVE_FILE = "No file selected"
 
-    def __init__(self, app, profile_filename=None):
+    def __init__(self, app, profile_filename=None, single_instance=True):
         super(AppWindow, self).__init__()
         self.app = app
+        # Listens for later invocations and process_launcher ctl, see control.py
+        self.control_server = ControlServer(self) if single_instance else None
 
         self.conf = Configuration(default_config_path)
         self.conf.read()
+        startup_timer.mark("configuration")
+
+        # Both are opt-in, in the configuration file
+        self.autosave = bool(self.conf.get("autosave"))
+        self.use_journal = bool(self.conf.get("journal"))
+        self.journal = None
+        self.unsaved_changes = False
+        # Uses variables or matrices, which are lost when it's saved
+        self.profile_templated = False
+        self._journal_pending = set()
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.setInterval(AUTOSAVE_DELAY)
+        self.autosave_timer.timeout.connect(self.save_profile)
+        self.journal_timer = QTimer(self)
+        self.journal_timer.setSingleShot(True)
+        self.journal_timer.setInterval(JOURNAL_DELAY)
+        self.journal_timer.timeout.connect(self.flush_journal)
 
         self.appWidget = AppWidget(self)
+        if self.conf.get("monitor_interval") is not None:
+            self.appWidget.resource_sampler.set_interval(self.conf.get("monitor_interval"))
+        if self.conf.get("max_process_widgets") is not None:
+            self.appWidget.max_process_widgets = self.conf.get("max_process_widgets")
+        self.appWidget.profile_changed.connect(self.on_profile_changed)
         self.setCentralWidget(self.appWidget)
+        startup_timer.mark("main widget")
 
         self.init_menubar()
+        startup_timer.mark("menus")
         self.select_profile_file(
             profile_filename or self.conf.get("last_profile"))
-        if self.selected_profile_path:
-            self.load_profile(self.selected_profile_path)
-
-        self.show()
 
-        # Restore the state from the config file
+        # Restore the state from the config file, before the first paint
+        # so that the window isn't shown with the default theme first
         self.change_theme(self.conf.get("theme"))
+        startup_timer.mark("theme")
+
+        # The profile and the icons of the menus are loaded after the first
+        # paint, the empty window shows up sooner
+        _FirstPaintFilter(self, self.finish_startup)
+        self.show()
+        startup_timer.mark("show")
 
         # TODO read this from settings
         # self.setWindowFlags(PyQt5.QtCore.Qt.WindowStaysOnTopHint)
 
+    def finish_startup(self):
+        """Work deferred until the window is painted for the first time."""
+        startup_timer.mark_first_paint()
+        for action, icon_name in self.menu_icons:
+            action.setIcon(get_icon(icon_name))
+        startup_timer.mark("menu icons")
+        if self.selected_profile_path:
+            self.load_profile(self.selected_profile_path)
+            startup_timer.mark("profile")
+        if self.control_server:
+            self.control_server.listen()
+            startup_timer.mark("control socket")
+        startup_timer.report()
+
     def select_profile_file(self, filename: str):
         """Changes the current reference to a profile JSON file."""
+        if self.journal and self.journal.profile_path != os.path.abspath(filename or ""):
+            self.journal.close()
+            self.journal = None
         self.selected_profile_path = filename
-        self.setWindowTitle(self.selected_profile_path or self.NO_SAVE_FILE)
+        self.update_title()
 
         if self.selected_profile_path:
             self.conf.store("last_profile", self.selected_profile_path)
+            if self.use_journal and self.journal is None:
+                self.journal = ProfileJournal(self.selected_profile_path)
+
+    def update_title(self):
+        title = self.selected_profile_path or self.NO_SAVE_FILE
+        self.setWindowTitle("*" + title if self.unsaved_changes else title)
 
     def init_menubar(self):
         self.fileMenu = self.menuBar().addMenu("File")
@@ -63,9 +145,7 @@ class AppWindow(QMainWindow):
         self.processesMenu = self.menuBar().addMenu("Processes")
         self.viewMenu = self.menuBar().addMenu("View")
 
-        my_path = os.path.abspath(os.path.dirname(__file__))
-        importProcesses = QAction(
-            QIcon(os.path.join(my_path, './img/fontawesome/regular/folder-open.svg')), 'Import...', self)
+        importProcesses = QAction('Import...', self)
         importProcesses.setShortcut('Ctrl+F')
         importProcesses.setStatusTip('Import processes from a JSON file')
         importProcesses.triggered.connect(self.browse_profile_json)
@@ -74,19 +154,19 @@ class AppWindow(QMainWindow):
         self.clearGroups.triggered.connect(self.appWidget.clear_groups)
         self.clearGroups.setEnabled(False)
 
-        # saveProfile = QAction(QIcon('./imgsave.png'), 'Save', self)
-        # saveProfile.setShortcut('Ctrl+S')
+        saveProfile = QAction('Save', self)
+        saveProfile.setShortcut('Ctrl+S')
+        saveProfile.triggered.connect(self.save_or_save_as)
 
-        saveAsProfile = QAction(
-            QIcon(os.path.join(my_path, './img/fontawesome/regular/save.svg')), 'Save As...', self)
+        saveAsProfile = QAction('Save As...', self)
         saveAsProfile.setShortcut('Ctrl+Shift+S')
         saveAsProfile.triggered.connect(self.profile_save_as)
 
         self.fileMenu.addAction(importProcesses)
+        self.fileMenu.addAction(saveProfile)
         self.fileMenu.addAction(saveAsProfile)
 
-        toggleEditMode = QAction(
-            QIcon(os.path.join(my_path, './img/fontawesome/regular/edit.svg')), 'Toggle edit mode', self)
+        toggleEditMode = QAction('Toggle edit mode', self)
         toggleEditMode.setShortcut('Ctrl+E')
         toggleEditMode.triggered.connect(self.toggle_edit)
 
@@ -105,18 +185,26 @@ class AppWindow(QMainWindow):
 
         self.newGroup.addAction(self.newEmtpyGroup)
 
-        minimizeAllProcesses = QAction(
-            QIcon(os.path.join(my_path,'./img/fontawesome/regular/window-minimize.svg')), 'Minimize all processes', self)
+        minimizeAllProcesses = QAction('Minimize all processes', self)
         minimizeAllProcesses.setShortcut('Ctrl+Down')
         minimizeAllProcesses.triggered.connect(self.minimize_all_processes)
         self.processesMenu.addAction(minimizeAllProcesses)
 
-        restoreAllProcesses = QAction(
-            QIcon(os.path.join(my_path, './img/fontawesome/regular/window-maximize.svg')), 'Restore all processes', self)
+        restoreAllProcesses = QAction('Restore all processes', self)
         restoreAllProcesses.setShortcut('Ctrl+Up')
         restoreAllProcesses.triggered.connect(self.restore_all_processes)
         self.processesMenu.addAction(restoreAllProcesses)
 
+        # Set in finish_startup, the menus are closed until then
+        self.menu_icons = [
+            (importProcesses, 'regular/folder-open.svg'),
+            (saveProfile, 'regular/save.svg'),
+            (saveAsProfile, 'regular/save.svg'),
+            (toggleEditMode, 'regular/edit.svg'),
+            (minimizeAllProcesses, 'regular/window-minimize.svg'),
+            (restoreAllProcesses, 'regular/window-maximize.svg'),
+        ]
+
         self.themeMenu = self.viewMenu.addMenu("Theme")
 
         defaultTheme = QAction('Default', self)
@@ -133,11 +221,86 @@ class AppWindow(QMainWindow):
         self.themeMenu.addAction(darkTheme)
 
     def load_profile(self, filename: str):
+        try:
+            self.open_profile(filename)
+        except (OSError, ValueError) as e:
+            # Every error of the profile at once, see ProfileError
+            QMessageBox.warning(self, "Could not load {}".format(filename), str(e))
+
+    def open_profile(self, filename: str):
+        """Like load_profile, but raises the errors, see profile.load_profile."""
         logger.info("Loading {}".format(filename))
-        with open(filename, 'r') as json_data:
-            d = json.load(json_data)
-            self.appWidget.create_groups_from_dict(d)
+        profile = load_profile(filename)
+        # The next launches import the preloaded modules again
+        shutdown_zygotes()
         self.select_profile_file(filename)
+        self.profile_templated = profile.templated
+        data = profile.toJSON()
+        recovered = self.journal.replay(data) if self.journal else None
+        self.appWidget.create_groups_from_dict(recovered or data)
+        self.unsaved_changes = recovered is not None
+        self.update_title()
+        if recovered is not None:
+            self.statusBar().showMessage("Recovered the unsaved edits of {}".format(filename))
+
+    def on_profile_changed(self, group_index):
+        """Called after every edit, with the index of the edited group, or
+        None when groups were deleted."""
+        if not self.unsaved_changes:
+            self.unsaved_changes = True
+            self.update_title()
+        if self.journal:
+            self._journal_pending.add(group_index)
+            self.journal_timer.start()
+        if self.autosave and self.selected_profile_path and not self.profile_templated:
+            self.autosave_timer.start()
+
+    def flush_journal(self):
+        """Appends the groups edited since the last flush to the journal."""
+        pending, self._journal_pending = self._journal_pending, set()
+        if not self.journal or not pending:
+            return
+        data = self.appWidget.toJSON()
+        try:
+            if None in pending:
+                self.journal.record_profile(data)
+            else:
+                for index in sorted(pending):
+                    self.journal.record_group(index, data["groups"][index])
+        except OSError as e:
+            logger.warning("Could not write the journal: {}".format(e))
+
+    def save_profile(self, filename=None) -> bool:
+        """Saves the profile atomically, to its file by default."""
+        filename = filename or self.selected_profile_path
+        if self.profile_templated and filename == self.selected_profile_path:
+            answer = QMessageBox.question(
+                self, "Save {}".format(filename),
+                "This profile uses variables or a matrix. Saving it replaces them with "
+                "every process, expanded. Save anyway?")
+            if answer != QMessageBox.Yes:
+                return False
+        self.autosave_timer.stop()
+        self.journal_timer.stop()
+        self._journal_pending.clear()
+        try:
+            save_profile(filename, self.appWidget.toJSON())
+        except OSError as e:
+            QMessageBox.warning(self, "Could not save {}".format(filename), str(e))
+            return False
+        if self.journal:
+            self.journal.clear()
+        self.unsaved_changes = False
+        self.profile_templated = False
+        self.select_profile_file(filename)
+        logger.info("Profile saved to {}".format(filename))
+        return True
+
+    def save_or_save_as(self):
+        if self.selected_profile_path:
+            self.save_profile()
+        else:
+            self.profile_save_as()
 
     def browse_profile_json(self):
         logger.info("Browsing files")
@@ -155,13 +318,8 @@ class AppWindow(QMainWindow):
         if not filename:
             # TODO: pop-up
             return
-        string_json = json.dumps(self.appWidget.toJSON(), indent=2)
-
-        with open(filename, "w") as text_file:
-            text_file.write(string_json)
-
-        self.select_profile_file(filename)
-        print("Profile succesfully saved to {}".format(filename))
+        if self.save_profile(filename):
+            print("Profile succesfully saved to {}".format(filename))
 
     def select_output_filename(self) -> str or None:
         options = QFileDialog.Options()
@@ -198,6 +356,10 @@ class AppWindow(QMainWindow):
             QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
         close = close.exec()
 
+        if close in (QMessageBox.Yes, QMessageBox.No):
+            self.finish_edits()
+            if self.control_server:
+                self.control_server.close()
         if close == QMessageBox.Yes:
             self.appWidget.end_all()
             event.accept()
@@ -206,31 +368,48 @@ class AppWindow(QMainWindow):
         else:
             event.ignore()
 
+    def finish_edits(self):
+        """Saves or journals the pending edits before closing."""
+        # Removing the groups when closing is not an edit
+        self.appWidget.profile_changed.disconnect(self.on_profile_changed)
+        if self.autosave_timer.isActive():
+            self.save_profile()
+        self.flush_journal()
+        if self.journal:
+            self.journal.close()
+        self.conf.flush()
+
+    def all_processes(self) -> list:
+        return self.appWidget.all_processes()
+
     def minimize_all_processes(self):
-        for group in self.appWidget.group_widgets:
-            group.minimize_all_processes()
+        minimize_processes(self.all_processes())
 
     def restore_all_processes(self):
-        for group in self.appWidget.group_widgets:
-            group.restore_all_processes()
+        restore_processes(self.all_processes())
 
     def change_theme(self, theme_name: str):
+        # The styles are imported only when chosen, they are slow to import
         if theme_name == "default":
             self.app.setStyleSheet("")
         elif theme_name == "dark-gray":
+            import qdarkgraystyle
             self.app.setStyleSheet(qdarkgraystyle.load_stylesheet())
         elif theme_name == "dark":
+            import qdarkstyle
             self.app.setStyleSheet(
                 qdarkstyle.load_stylesheet_from_environment())
 
         self.conf.store("theme", theme_name)
 
 
-def main():
+def main(single_instance=True):
     # print(get_platform())
     app = QApplication(sys.argv)
+    startup_timer.mark("QApplication")
 
-    window = AppWindow(app, sys.argv[1] if len(sys.argv) > 1 else None)
+    window = AppWindow(app, sys.argv[1] if len(sys.argv) > 1 else None,
+                       single_instance=single_instance)
     sys.exit(app.exec())
 
 
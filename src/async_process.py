@@ -0,0 +1,138 @@
+import os
+import asyncio
+from collections import deque
+
+from .event_loop import background_loop
+from .process import PopenProcess, USE_PROCESS_GROUPS
+
+DEFAULT_OUTPUT_LINES = 1000
+"""Lines of stdout and of stderr kept in memory for each process."""
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class AsyncioProcess(PopenProcess):
+    """Runs the command directly, capturing its output.
+
+    The process is spawned with ``asyncio.create_subprocess_exec`` on a
+    shared background event loop. stdout and stderr are read in chunks and
+    split into lines, the last ``max_lines`` of each are kept in ring buffers
+    and every new batch of lines is passed to ``output_listener(stream,
+    lines)``, on the thread of the event loop. If ``log`` is set to a
+    ProcessLog, the lines are stored there as well.
+
+    Python processes of a group with a zygote are forked from it instead,
+    see zygote.py, with their output read the same way.
+    """
+
+    reports_exit = True
+
+    def __init__(self, *args, max_lines=DEFAULT_OUTPUT_LINES, **kwargs):
+        self.max_lines = max_lines
+        self.output_listener = None
+        self.log = None
+        super(AsyncioProcess, self).__init__(*args, **kwargs)
+
+    def reset(self):
+        super(AsyncioProcess, self).reset()
+        self.stdout = deque(maxlen=self.max_lines)
+        self.stderr = deque(maxlen=self.max_lines)
+
+    @property
+    def window_id(self):
+        return None
+
+    def run(self, command=None):
+        command = command or self.command
+        zygote = self.zygote_for(command)
+        if zygote is not None:
+            self.popen = self._fork_from(zygote, command)
+            return
+        args, preexec_fn, apply_limits = self.prepare_launch(command)
+        future = asyncio.run_coroutine_threadsafe(
+            self._start(args, command, preexec_fn), background_loop())
+        # Spawning errors, e.g. a missing executable, are raised here
+        self.popen = future.result()
+        if apply_limits:
+            self.resume_with_limits(apply_limits)
+
+    async def _start(self, args, command, preexec_fn):
+        popen = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=command.cwd, env=command.environ(),
+            stdin=asyncio.subprocess.DEVNULL,
+            start_new_session=USE_PROCESS_GROUPS,
+            preexec_fn=preexec_fn,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+        asyncio.ensure_future(self._supervise(popen))
+        return popen
+
+    async def _supervise(self, popen):
+        await asyncio.gather(
+            self._pump(popen.stdout, "stdout", self.stdout),
+            self._pump(popen.stderr, "stderr", self.stderr))
+        await popen.wait()
+        if self.exit_listener:
+            self.exit_listener(self, popen)
+
+    def _fork_from(self, zygote, command):
+        """Blocks in the launching thread while the zygote starts, not in
+        the event loop."""
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        try:
+            with open(os.devnull, 'rb') as devnull:
+                child = zygote.spawn(command, (devnull.fileno(), stdout_write, stderr_write))
+        except BaseException:
+            os.close(stdout_read)
+            os.close(stderr_read)
+            raise
+        finally:
+            os.close(stdout_write)
+            os.close(stderr_write)
+        asyncio.run_coroutine_threadsafe(
+            self._supervise_child(child, stdout_read, stderr_read), background_loop())
+        return child
+
+    async def _supervise_child(self, child, stdout_fd: int, stderr_fd: int):
+        loop = asyncio.get_running_loop()
+        streams = []
+        for fd in (stdout_fd, stderr_fd):
+            stream = asyncio.StreamReader()
+            await loop.connect_read_pipe(
+                lambda stream=stream: asyncio.StreamReaderProtocol(stream),
+                open(fd, 'rb', buffering=0))
+            streams.append(stream)
+        await asyncio.gather(
+            self._pump(streams[0], "stdout", self.stdout),
+            self._pump(streams[1], "stderr", self.stderr))
+        await child.wait_async()
+        if self.exit_listener:
+            self.exit_listener(self, child)
+
+    async def _pump(self, stream: asyncio.StreamReader, name: str, buffer: deque):
+        partial_line = b""
+        while True:
+            chunk = await stream.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            lines = (partial_line + chunk).split(b"\n")
+            partial_line = lines.pop()
+            self._add_lines(name, buffer, lines)
+        if partial_line:
+            self._add_lines(name, buffer, [partial_line])
+
+    def _add_lines(self, name: str, buffer: deque, lines: list):
+        if not lines:
+            return
+        lines = [line.decode("utf-8", "replace") for line in lines]
+        buffer.extend(lines)
+        if self.log is not None:
+            self.log.write_lines(lines)
+        if self.output_listener:
+            self.output_listener(name, lines)
+
+    def poll(self) -> int or None:
+        # Reaped by the event loop, there is nothing to poll
+        return self.popen.returncode if self.popen else None
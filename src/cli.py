@@ -0,0 +1,117 @@
+"""Entry point of ``process_launcher``.
+
+``process_launcher [profile.json]`` opens the GUI, while
+``process_launcher run profile.json [--group NAME ...]`` runs a profile
+without it. Qt is only imported for the GUI.
+
+If a launcher is already running, ``process_launcher [profile.json]`` opens
+the profile in it instead, unless ``--new-instance`` is given, and
+``process_launcher ctl status|open|launch|stop|show`` controls it, see
+control.py.
+
+``process_launcher --profile-startup [profile.json]`` prints how long each
+phase of the start of the GUI took, see startup.py. It implies
+``--new-instance``.
+"""
+# First, to time the imports as well
+from .startup import startup_timer
+
+import os
+import sys
+import json
+import argparse
+
+
+def run_command(argv: list) -> int:
+    parser = argparse.ArgumentParser(
+        prog='process_launcher run',
+        description='Run the processes of a profile without the GUI')
+    parser.add_argument('profile', help='profile JSON file')
+    parser.add_argument('--group', '-g', action='append', dest='groups',
+                        metavar='NAME',
+                        help='only run this group, can be repeated')
+    args = parser.parse_args(argv)
+
+    from .headless import run_profile
+    return run_profile(args.profile, groups=args.groups)
+
+
+def ctl_command(argv: list) -> int:
+    parser = argparse.ArgumentParser(
+        prog='process_launcher ctl',
+        description='Control the running launcher')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+    commands.add_parser('status', help='print the status of every process, as JSON')
+    commands.add_parser('show', help='raise the window')
+    open_parser = commands.add_parser('open', help='open a profile')
+    open_parser.add_argument('profile', help='profile JSON file')
+    for name, help_text in (('launch', 'launch a group'), ('stop', 'stop a group')):
+        group_parser = commands.add_parser(name, help=help_text)
+        group_parser.add_argument('group', help='name of the group, or its index with --index')
+        group_parser.add_argument('--index', action='store_true',
+                                  help='the group is given by its index, from 0')
+    args = parser.parse_args(argv)
+
+    from .control import call, ControlError
+    if args.command == 'open':
+        method, params = 'open_profile', {"path": os.path.abspath(args.profile)}
+    elif args.command in ('launch', 'stop'):
+        method = args.command + '_group'
+        params = {"group": int(args.group) if args.index else args.group}
+    else:
+        method, params = args.command, {}
+    try:
+        result = call(method, params)
+    except OSError as e:
+        print("No launcher running: {}".format(e), file=sys.stderr)
+        return 1
+    except ControlError as e:
+        print(e.message, file=sys.stderr)
+        return 1
+    if result is not None:
+        print(json.dumps(result, indent=2))
+    return 0
+
+
+def open_in_running_instance(profile: str or None) -> bool:
+    """Sends the profile to the running launcher, if any."""
+    from .control import call, ControlError
+    try:
+        if profile:
+            call('open_profile', {"path": os.path.abspath(profile)})
+        else:
+            call('show')
+    except OSError:
+        return False
+    except ControlError as e:
+        print(e.message, file=sys.stderr)
+        sys.exit(1)
+    return True
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'run':
+        sys.exit(run_command(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'ctl':
+        sys.exit(ctl_command(sys.argv[2:]))
+
+    single_instance = True
+    if '--new-instance' in sys.argv:
+        sys.argv.remove('--new-instance')
+        single_instance = False
+    if '--profile-startup' in sys.argv:
+        sys.argv.remove('--profile-startup')
+        startup_timer.enabled = True
+        single_instance = False
+
+    if single_instance and open_in_running_instance(
+            sys.argv[1] if len(sys.argv) > 1 else None):
+        return
+
+    from .app_window import main as gui_main
+    gui_main(single_instance=single_instance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""The command of a process: its arguments, directory and environment.
+
+A CommandSpec is never modified. The widgets of a process replace it with a
+new one after every edit, and launches only read it, so launching doesn't
+touch the widgets and can run on any thread. The quoted command line given
+to terminals is built once per edit, on its first launch.
+
+The environment is a ProcessEnvironment, see environment.py, already merged
+with the one of the group.
+"""
+import os
+import shlex
+
+from .environment import ProcessEnvironment
+
+
+class CommandSpec(object):
+    """Immutable arguments, directory and environment of a process."""
+
+    __slots__ = ('args', 'directory', 'env', '_command_line')
+
+    def __init__(self, args=(), directory=None, env: ProcessEnvironment = None):
+        self.args = tuple(args)
+        self.directory = directory
+        self.env = env
+        self._command_line = None
+
+    def replace(self, **changes) -> 'CommandSpec':
+        """A copy with some of ``args``, ``directory`` and ``env`` changed."""
+        values = {"args": self.args, "directory": self.directory, "env": self.env}
+        values.update(changes)
+        return CommandSpec(**values)
+
+    @property
+    def command_line(self) -> str:
+        """The arguments quoted for a shell, e.g. for ``konsole -e``."""
+        if self._command_line is None:
+            self._command_line = shlex.join(self.args)
+        return self._command_line
+
+    @property
+    def cwd(self) -> str or None:
+        return os.path.expanduser(self.directory) if self.directory else None
+
+    def environ(self):
+        """Environment of the process, None to inherit the launcher's."""
+        if self.env is None:
+            return None
+        return self.env.environ(self.cwd)
+
+    def __repr__(self):
+        return "CommandSpec({!r}, directory={!r})".format(list(self.args), self.directory)
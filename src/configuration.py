@@ -1,35 +1,124 @@
 import json
 import os
+import atexit
+import threading
 from collections import defaultdict
+from contextlib import contextmanager
 
-from .utils import get_config_folder
+try:
+    import fcntl
+except ImportError:
+    # Windows: instances don't lock the file
+    fcntl = None
+
+from .utils import get_config_folder, write_atomically
 
 default_config_path = os.path.join(get_config_folder(), "configuration.json")
 
+FLUSH_DELAY = 0.5
+"""Seconds without new settings before they are written."""
+
+
 class Configuration(object):
-    """docstring for Configuration"""
-    def __init__(self, path=None):
+    """docstring for Configuration
+
+    ``store`` only marks a setting to be written. Settings stored within
+    ``FLUSH_DELAY`` seconds of each other are written together, from a timer
+    thread, and whatever is left is written at exit. Writes are atomic and
+    hold a lock on ``<path>.lock``, and only change the settings stored by
+    this instance, so several launchers can share the file.
+    """
+    def __init__(self, path=None, flush_delay=FLUSH_DELAY):
         super(Configuration, self).__init__()
         self.path = path or default_config_path
+        self.flush_delay = flush_delay
         self._conf = defaultdict(lambda: None)
+        self._changed = {}
+        self._read_key = None
+        self._lock = threading.RLock()
+        self._timer = None
+        atexit.register(self.flush)
 
-    def read(self):
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _file_key(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _read_file(self):
+        """Reads the file, unless it didn't change since the last read."""
+        key = self._file_key()
+        if key is None or key == self._read_key:
+            return
         try:
             with open(self.path, 'r') as f:
-                self._conf.update(json.load(f))
-        except IOError:
-            pass
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+        self._read_key = key
+        self._conf.update(data)
+        # Settings not written yet win over the file
+        self._conf.update(self._changed)
+
+    def read(self):
+        with self._lock:
+            self._read_file()
 
     def write(self):
-        with open(self.path, 'w') as f:
-            json.dump(self._conf, f)
+        """Writes the pending settings now."""
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._changed:
+                return
+            with self._file_lock():
+                # Keep what other instances wrote since our last read
+                self._read_file()
+                write_atomically(self.path, json.dumps(self._conf).encode("utf-8"))
+                self._read_key = self._file_key()
+            self._changed.clear()
 
     def get(self, name):
         return self._conf[name]
 
     def set(self, name, value):
-        self._conf[name] = value
+        with self._lock:
+            self._conf[name] = value
 
     def store(self, name, value):
-        self.set(name, value)
-        self.write()
+        """Sets a setting and schedules it to be written."""
+        with self._lock:
+            if self._conf.get(name) == value and name not in self._changed:
+                return
+            self._conf[name] = value
+            self._changed[name] = value
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.flush_delay, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except OSError:
+            # Tried again at the next store, or at exit
+            pass
@@ -0,0 +1,135 @@
+"""Control of a running launcher through a Unix domain socket.
+
+The first GUI instance listens on ``~/.process_launcher/control.sock``, see
+ControlServer in control_server.py. Later invocations send it their profile
+instead of starting another window, and scripts can drive it with
+``process_launcher ctl``.
+
+Requests and replies are JSON-RPC 2.0 objects, one per line, e.g.::
+
+    {"jsonrpc": "2.0", "id": 1, "method": "launch_group", "params": {"group": "servers"}}
+    {"jsonrpc": "2.0", "id": 1, "result": null}
+
+The methods are ``open_profile(path)``, ``launch_group(group)``,
+``stop_group(group)``, ``status()`` and ``show()``. Nothing in here imports
+Qt, so a client gets its reply in milliseconds.
+"""
+import os
+import sys
+import json
+import socket
+
+from .utils import get_config_folder
+
+SOCKET_NAME = 'control.sock'
+REPLY_TIMEOUT = 30.0
+"""Seconds to wait for a reply, opening a large profile takes a while."""
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+class ControlError(Exception):
+    """An error reply, or an error to reply with."""
+
+    def __init__(self, code: int, message: str):
+        super(ControlError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+    def toJSON(self) -> dict:
+        return {"code": self.code, "message": self.message}
+
+
+def get_control_socket_path() -> str:
+    return os.path.join(get_config_folder(), SOCKET_NAME)
+
+
+def is_supported() -> bool:
+    # QLocalServer uses named pipes on Windows
+    return hasattr(socket, 'AF_UNIX') and not sys.platform.startswith('win')
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message).encode("utf-8") + b"\n"
+
+
+class ControlClient(object):
+    """Connection to a running launcher.
+
+    Raises OSError, e.g. ConnectionRefusedError or FileNotFoundError, if no
+    launcher is listening.
+    """
+
+    def __init__(self, path=None, timeout=REPLY_TIMEOUT):
+        super(ControlClient, self).__init__()
+        self.path = path or get_control_socket_path()
+        self.timeout = timeout
+        self._socket = None
+        self._file = None
+        self._next_id = 1
+
+    def connect(self):
+        if not is_supported():
+            raise ConnectionRefusedError("Unix domain sockets are not supported here")
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.settimeout(self.timeout)
+            self._socket.connect(self.path)
+        except OSError:
+            self.close()
+            raise
+        self._file = self._socket.makefile('rb')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def call(self, method: str, params=None):
+        """Returns the result of a method, or raises ControlError."""
+        request_id = self._next_id
+        self._next_id += 1
+        self._socket.sendall(encode({
+            "jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}}))
+        line = self._file.readline()
+        if not line:
+            raise ConnectionResetError("The launcher closed the connection")
+        try:
+            reply = json.loads(line.decode("utf-8"))
+        except ValueError:
+            raise ControlError(PARSE_ERROR, "Invalid reply: {!r}".format(line))
+        if reply.get("error"):
+            raise ControlError(reply["error"].get("code", SERVER_ERROR),
+                               reply["error"].get("message", ""))
+        return reply.get("result")
+
+
+def call(method: str, params=None, socket_path=None):
+    """Calls a method of the running launcher, over a new connection."""
+    with ControlClient(socket_path) as client:
+        return client.call(method, params)
+
+
+def is_running(socket_path=None) -> bool:
+    """True if a launcher is listening on the socket."""
+    try:
+        with ControlClient(socket_path):
+            pass
+    except OSError:
+        return False
+    return True
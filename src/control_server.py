@@ -0,0 +1,159 @@
+"""Server side of control.py, in the GUI."""
+import os
+import json
+import inspect
+import logging
+
+from PyQt5.QtCore import QObject
+from PyQt5.QtNetwork import QLocalServer, QAbstractSocket
+
+from .control import (ControlError, get_control_socket_path, is_supported, is_running,
+                      encode, PARSE_ERROR, INVALID_REQUEST, METHOD_NOT_FOUND,
+                      INVALID_PARAMS, SERVER_ERROR)
+from .utils import ProcessStatus
+
+logger = logging.getLogger('process_launcher')
+
+
+def _process_status(name: str, process) -> dict:
+    """Status of a process, which is None if it never ran."""
+    ret = {"name": name, "status": "stopped", "pid": None}
+    if process is None:
+        return ret
+    if process.status == ProcessStatus.RUNNING:
+        ret["status"] = "running"
+        ret["pid"] = process.pid
+    elif process.return_code is not None:
+        ret["exit"] = process.describe_exit()
+    return ret
+
+
+class ControlServer(QObject):
+    """Replies to the requests of control.py clients, on the GUI thread."""
+
+    def __init__(self, window, path=None):
+        super(ControlServer, self).__init__(window)
+        self.window = window
+        self.path = path or get_control_socket_path()
+        self.server = QLocalServer(self)
+        # Anyone able to connect can launch processes
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self._on_new_connection)
+        self.methods = {
+            "open_profile": self.open_profile,
+            "launch_group": self.launch_group,
+            "stop_group": self.stop_group,
+            "status": self.status,
+            "show": self.show,
+        }
+
+    def listen(self) -> bool:
+        """False if another launcher already listens on the socket."""
+        if not is_supported():
+            return False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.server.listen(self.path):
+            return True
+        if self.server.serverError() == QAbstractSocket.AddressInUseError \
+                and not is_running(self.path):
+            # Left behind by a launcher that didn't exit cleanly
+            QLocalServer.removeServer(self.path)
+            if self.server.listen(self.path):
+                return True
+        logger.info("Not listening on {}: {}".format(self.path, self.server.errorString()))
+        return False
+
+    def close(self):
+        self.server.close()
+
+    def _on_new_connection(self):
+        while self.server.hasPendingConnections():
+            connection = self.server.nextPendingConnection()
+            connection.readyRead.connect(lambda c=connection: self._on_ready_read(c))
+            connection.disconnected.connect(connection.deleteLater)
+
+    def _on_ready_read(self, connection):
+        while connection.canReadLine():
+            reply = self.handle(bytes(connection.readLine()))
+            if reply is not None:
+                connection.write(encode(reply))
+
+    def handle(self, line: bytes) -> dict or None:
+        """Reply to a request, None for notifications, which have no id."""
+        request_id = None
+        try:
+            try:
+                request = json.loads(line.decode("utf-8"))
+            except ValueError as e:
+                raise ControlError(PARSE_ERROR, "Invalid JSON: {}".format(e))
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise ControlError(INVALID_REQUEST, "Expected an object with a method")
+            request_id = request.get("id")
+            result = self.call(request["method"], request.get("params"))
+            if request_id is None:
+                return None
+            return {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except ControlError as e:
+            return {"jsonrpc": "2.0", "id": request_id, "error": e.toJSON()}
+
+    def call(self, name: str, params):
+        method = self.methods.get(name)
+        if method is None:
+            raise ControlError(METHOD_NOT_FOUND, "Unknown method: {}".format(name))
+        args, kwargs = (params, {}) if isinstance(params, list) else ([], params or {})
+        try:
+            inspect.signature(method).bind(*args, **kwargs)
+        except TypeError as e:
+            raise ControlError(INVALID_PARAMS, "{}: {}".format(name, e))
+        try:
+            return method(*args, **kwargs)
+        except ControlError:
+            raise
+        except (OSError, ValueError) as e:
+            raise ControlError(SERVER_ERROR, str(e))
+        except Exception as e:
+            # Never out of a Qt slot, where PyQt would abort the GUI
+            logger.exception("Control request {} failed".format(name))
+            raise ControlError(SERVER_ERROR, "{}: {}".format(e.__class__.__name__, e))
+
+    def _find_group(self, group):
+        """A group by name, or by index."""
+        groups = self.window.appWidget.groups()
+        if isinstance(group, int) and not isinstance(group, bool):
+            if 0 <= group < len(groups):
+                return groups[group]
+        else:
+            for candidate in groups:
+                if candidate.name == group:
+                    return candidate
+        raise ControlError(INVALID_PARAMS, "No group {}".format(json.dumps(group)))
+
+    # Methods
+
+    def open_profile(self, path: str):
+        self.window.open_profile(path)
+        self.show()
+
+    def launch_group(self, group):
+        self.window.appWidget.run_group(self._find_group(group))
+
+    def stop_group(self, group):
+        self.window.appWidget.stop_group(self._find_group(group))
+
+    def status(self) -> dict:
+        app_widget = self.window.appWidget
+        return {
+            "profile": self.window.selected_profile_path,
+            "unsaved_changes": self.window.unsaved_changes,
+            "groups": [{
+                "name": group.name,
+                "processes": [_process_status(name, process)
+                              for name, process in app_widget.group_processes(group)],
+            } for group in app_widget.groups()],
+        }
+
+    def show(self):
+        if self.window.isMinimized():
+            self.window.showNormal()
+        self.window.raise_()
+        self.window.activateWindow()
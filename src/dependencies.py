@@ -0,0 +1,41 @@
+class DependencyError(ValueError):
+    """The ``depends_on`` fields of a group can't be satisfied."""
+
+
+def resolve_waves(dependencies: dict) -> list:
+    """Groups process names in launch waves.
+
+    ``dependencies`` maps each name to the names it depends on. Every name in
+    a wave only depends on names of previous waves, so a wave can be launched
+    in parallel once those are ready. Raises DependencyError on unknown names
+    and on cycles.
+    """
+    for name, depends_on in dependencies.items():
+        unknown = [d for d in depends_on if d not in dependencies]
+        if unknown:
+            raise DependencyError("{} depends on unknown process(es): {}".format(
+                name, ", ".join(unknown)))
+
+    remaining = {name: set(depends_on) for name, depends_on in dependencies.items()}
+    waves = []
+    while remaining:
+        wave = sorted(name for name, depends_on in remaining.items() if not depends_on)
+        if not wave:
+            raise DependencyError("Dependency cycle between: {}".format(
+                ", ".join(sorted(remaining))))
+        for name in wave:
+            del remaining[name]
+        for depends_on in remaining.values():
+            depends_on.difference_update(wave)
+        waves.append(wave)
+
+    return waves
+
+
+def dependents_of(dependencies: dict) -> dict:
+    """Inverts ``dependencies``: maps each name to the names depending on it."""
+    ret = {name: [] for name in dependencies}
+    for name, depends_on in dependencies.items():
+        for dependency in depends_on:
+            ret[dependency].append(name)
+    return ret
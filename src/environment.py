@@ -0,0 +1,202 @@
+"""Environment variables of a process.
+
+A group or a process of a profile can set ``env``, a map of variables (null
+unsets one), ``env_file``, one or a list of dotenv files, and ``clear_env``,
+to start from an empty environment instead of the one of the launcher::
+
+    {"env_file": ".env", "env": {"RUST_LOG": "debug", "DISPLAY": null}}
+
+The files are read in order, then ``env`` is applied, the ones of the group
+before the ones of the process. Relative files are relative to the ``dir``
+of the process.
+
+The environment of the launcher is copied once, on the first launch. A
+process only keeps the variables it changes, over that shared copy, and the
+dotenv files are parsed again only when they are modified.
+"""
+import os
+import re
+import threading
+from collections.abc import Mapping
+from types import MappingProxyType
+
+ENV_KEYS = ("env", "env_file", "clear_env")
+"""Keys of a group or of a process entry of a profile read by ProcessEnvironment."""
+
+_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*$")
+_LINE = re.compile(r"(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(.*)$")
+_DOUBLE_QUOTED = re.compile(r'"((?:[^"\\]|\\.)*)"\s*(?:#.*)?$')
+_SINGLE_QUOTED = re.compile(r"'([^']*)'\s*(?:#.*)?$")
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+_base_environment = None
+_env_files = {}
+_env_files_lock = threading.Lock()
+
+
+class EnvError(ValueError):
+    pass
+
+
+def base_environment() -> Mapping:
+    """The environment of the launcher, copied on the first call."""
+    global _base_environment
+    if _base_environment is None:
+        _base_environment = MappingProxyType(dict(os.environ))
+    return _base_environment
+
+
+def parse_env_file(text: str, path="") -> dict:
+    """Variables of a dotenv file: ``NAME=value`` lines, optionally after
+    ``export``, with ``#`` comments. Values can be quoted, and double quotes
+    understand ``\\n``, ``\\t``, ``\\"`` and ``\\\\``. Nothing is expanded.
+    """
+    variables = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = _LINE.match(line)
+        if match is None:
+            raise EnvError("{}:{}: expected NAME=value".format(path, number))
+        name, value = match.groups()
+        if value.startswith('"'):
+            quoted = _DOUBLE_QUOTED.match(value)
+            if quoted is None:
+                raise EnvError("{}:{}: unterminated quote".format(path, number))
+            value = re.sub(r"\\(.)", lambda m: _ESCAPES.get(m.group(1), m.group(1)),
+                           quoted.group(1))
+        elif value.startswith("'"):
+            quoted = _SINGLE_QUOTED.match(value)
+            if quoted is None:
+                raise EnvError("{}:{}: unterminated quote".format(path, number))
+            value = quoted.group(1)
+        else:
+            # A comment needs a space before it, a=b#c is b#c
+            value = re.sub(r"\s+#.*$", "", value)
+        variables[name] = value
+    return variables
+
+
+def read_env_file(path: str) -> Mapping:
+    """The variables of a dotenv file, parsed again only if it changed.
+
+    Raises OSError if it can't be read and EnvError if it isn't valid.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _env_files_lock:
+        cached = _env_files.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, encoding="utf-8") as f:
+        variables = MappingProxyType(parse_env_file(f.read(), path))
+    with _env_files_lock:
+        _env_files[path] = (key, variables)
+    return variables
+
+
+class Environment(Mapping):
+    """Variables set or unset over a base environment, which isn't copied."""
+
+    __slots__ = ('variables', 'removed', 'base')
+
+    def __init__(self, changes: dict, base: Mapping = None):
+        self.variables = {name: value for name, value in changes.items() if value is not None}
+        self.removed = frozenset(name for name, value in changes.items() if value is None)
+        self.base = base if base is not None else {}
+
+    def __getitem__(self, name: str) -> str:
+        if name in self.variables:
+            return self.variables[name]
+        if name in self.removed:
+            raise KeyError(name)
+        return self.base[name]
+
+    def __iter__(self):
+        yield from self.variables
+        for name in self.base:
+            if name not in self.variables and name not in self.removed:
+                yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def diff(self) -> dict:
+        """The changes to the base, None for the unset variables."""
+        ret = dict.fromkeys(name for name in self.removed if name in self.base)
+        ret.update((name, value) for name, value in self.variables.items()
+                   if self.base.get(name) != value)
+        return ret
+
+
+class ProcessEnvironment(object):
+    """The ``env``, ``env_file`` and ``clear_env`` of a group or a process.
+
+    Never modified once built, as launches read it from any thread.
+    """
+
+    __slots__ = ('env', 'env_files', 'clear_env')
+
+    def __init__(self, env=None, env_file=None, clear_env=None):
+        super(ProcessEnvironment, self).__init__()
+        if env is not None and not isinstance(env, dict):
+            raise EnvError("env: expected an object")
+        for name, value in (env or {}).items():
+            if not _NAME.match(name):
+                raise EnvError("env: invalid name '{}'".format(name))
+            if value is not None and not isinstance(value, (str, int, float)) \
+                    or isinstance(value, bool):
+                raise EnvError("env.{}: expected a string, a number or null".format(name))
+        env_files = [env_file] if isinstance(env_file, str) else env_file
+        if env_files is not None and (not isinstance(env_files, list) or not all(
+                isinstance(path, str) and path for path in env_files)):
+            raise EnvError("env_file: expected a path or a list of paths")
+        if clear_env is not None and not isinstance(clear_env, bool):
+            raise EnvError("clear_env: expected true or false")
+        # Numbers are kept as they are for toJSON
+        self.env = MappingProxyType(dict(env or {}))
+        self.env_files = tuple(env_files or ())
+        # None to use the one of the group
+        self.clear_env = clear_env
+
+    @classmethod
+    def from_dict(cls, data: dict or None):
+        """Settings found in a group or process entry, None if it has none."""
+        settings = {key: data[key] for key in ENV_KEYS if data and data.get(key) is not None}
+        return cls(**settings) if settings else None
+
+    def toJSON(self) -> dict:
+        ret = {}
+        if self.env:
+            ret["env"] = dict(self.env)
+        if self.env_files:
+            ret["env_file"] = self.env_files[0] if len(self.env_files) == 1 \
+                else list(self.env_files)
+        if self.clear_env is not None:
+            ret["clear_env"] = self.clear_env
+        return ret
+
+    def environ(self, cwd: str = None) -> Environment:
+        """Environment of the process. Raises OSError or EnvError if a dotenv
+        file can't be read."""
+        changes = {}
+        for path in self.env_files:
+            path = os.path.expanduser(path)
+            if cwd and not os.path.isabs(path):
+                path = os.path.join(cwd, path)
+            changes.update(read_env_file(path))
+        changes.update((name, value if value is None or isinstance(value, str) else str(value))
+                       for name, value in self.env.items())
+        return Environment(changes, None if self.clear_env else base_environment())
+
+
+def merge_environments(process: ProcessEnvironment or None,
+                       group: ProcessEnvironment or None) -> ProcessEnvironment or None:
+    """The settings of a process applied after the ones of its group."""
+    if process is None or group is None:
+        return process or group
+    return ProcessEnvironment(
+        env={**group.env, **process.env},
+        env_file=list(group.env_files + process.env_files),
+        clear_env=process.clear_env if process.clear_env is not None else group.clear_env)
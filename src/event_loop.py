@@ -0,0 +1,47 @@
+import os
+import sys
+import asyncio
+import threading
+import warnings
+
+_loop = None
+_lock = threading.Lock()
+
+
+def _install_child_watcher(loop):
+    """Waits for children with pidfds instead of a thread per child."""
+    if sys.version_info >= (3, 12) or not hasattr(asyncio, 'PidfdChildWatcher'):
+        # Newer versions already pick the best watcher by themselves
+        return
+    if not hasattr(os, 'pidfd_open'):
+        return
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        watcher = asyncio.PidfdChildWatcher()
+        watcher.attach_loop(loop)
+        asyncio.set_child_watcher(watcher)
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """Returns an event loop running on a daemon thread.
+
+    The GUI runs the Qt event loop on its main thread, so the asyncio
+    processes share this one.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                _install_child_watcher(loop)
+                started.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, name='process_launcher_asyncio',
+                             daemon=True).start()
+            started.wait()
+            _loop = loop
+    return _loop
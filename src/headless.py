@@ -0,0 +1,190 @@
+"""Runs the processes of a profile without the GUI.
+
+Nothing in here imports Qt, so it starts fast on build machines and over SSH.
+The children are supervised from a plain asyncio loop.
+"""
+import os
+import sys
+import signal
+import subprocess
+import asyncio
+
+from .dependencies import resolve_waves, DependencyError
+from .process import DirectProcess, stop_processes
+from .readiness import probe_from_dict
+from .limits import ProcessLimits
+from .environment import ProcessEnvironment, merge_environments
+from .command import CommandSpec
+from .zygote import ZygoteSpec, get_zygote
+from .profile import load_profile, ProfileError
+
+
+class _HeadlessEntry(object):
+
+    def __init__(self, group: str, data: dict, index: int,
+                 group_environment: ProcessEnvironment = None, zygote=None):
+        super(_HeadlessEntry, self).__init__()
+        self.group = group
+        environment = merge_environments(ProcessEnvironment.from_dict(data), group_environment)
+        self.process = DirectProcess(
+            name=data.get("name") or "process {}".format(index),
+            command=CommandSpec(data["args"], data.get("dir"), environment))
+        if data.get("stop_timeout") is not None:
+            self.process.stop_timeout = data["stop_timeout"]
+        self.process.limits = ProcessLimits.from_dict(data)
+        if data.get("zygote") is not False:
+            self.process.zygote = zygote
+        self.depends_on = list(data.get("depends_on") or [])
+        self.probe = probe_from_dict(data.get("ready_when"))
+        self.ready = asyncio.Event()
+        self.failed = False
+
+    @property
+    def name(self) -> str:
+        return self.process.name
+
+    @property
+    def label(self) -> str:
+        return "{}/{}".format(self.group, self.name)
+
+
+class HeadlessRunner(object):
+    """Launches the groups of a profile and waits until all processes exit.
+
+    Dependencies and readiness probes are honored like in the GUI. SIGINT and
+    SIGTERM stop every process tree: a SIGTERM first and a SIGKILL after the
+    ``stop_timeout`` of each process (or of the runner, if given), or right
+    away on a second signal.
+    """
+
+    def __init__(self, profile: dict, groups: list = None, out=None,
+                 stop_timeout=None):
+        super(HeadlessRunner, self).__init__()
+        self.profile = profile
+        self.group_names = groups
+        self.out = out or sys.stdout
+        self.stop_timeout = stop_timeout
+        self._entries = {}
+        self._stopping = False
+
+    def log(self, message: str):
+        print(message, file=self.out, flush=True)
+
+    def _load_entries(self):
+        groups = self.profile["groups"]
+        if self.group_names:
+            known = [group["name"] for group in groups]
+            unknown = [name for name in self.group_names if name not in known]
+            if unknown:
+                raise ValueError("Unknown group(s): {}".format(", ".join(unknown)))
+            groups = [group for group in groups if group["name"] in self.group_names]
+
+        for group in groups:
+            group_environment = ProcessEnvironment.from_dict(group)
+            zygote = get_zygote(ZygoteSpec.from_dict(group))
+            entries = [_HeadlessEntry(group["name"], data, i, group_environment, zygote)
+                       for i, data in enumerate(group["processes"])]
+            dependencies = {}
+            for entry in entries:
+                if entry.name in dependencies:
+                    raise DependencyError("Duplicate process name: {}".format(entry.label))
+                dependencies[entry.name] = entry.depends_on
+            resolve_waves(dependencies)
+            for entry in entries:
+                self._entries[(entry.group, entry.name)] = entry
+
+    async def run(self) -> int:
+        """Returns 0 if every process exited with code 0, 1 otherwise."""
+        self._load_entries()
+
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stop)
+
+        results = await asyncio.gather(*[
+            self._run_entry(entry) for entry in self._entries.values()
+        ])
+        return 0 if all(result == 0 for result in results) else 1
+
+    async def _run_entry(self, entry: _HeadlessEntry) -> int:
+        for name in entry.depends_on:
+            dependency = self._entries[(entry.group, name)]
+            await dependency.ready.wait()
+            if dependency.failed:
+                self.log("[{}] skipped, {} is not ready".format(entry.label, name))
+                return self._fail(entry)
+        if self._stopping:
+            return self._fail(entry)
+
+        try:
+            entry.process.run()
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            # ValueError: limits that can't be applied
+            self.log("[{}] could not be launched: {}".format(entry.label, e))
+            return self._fail(entry)
+        self.log("[{}] started with PID {}".format(entry.label, entry.process.pid))
+
+        exit_task = asyncio.ensure_future(self._wait_exit(entry.process))
+        if entry.probe:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, entry.probe.wait, entry.process, entry.process.directory)
+            except Exception as e:
+                self.log("[{}] {}".format(entry.label, e))
+                entry.failed = True
+        entry.ready.set()
+
+        await exit_task
+        self.log("[{}] {}".format(entry.label, entry.process.describe_exit()))
+        return 0 if entry.process.return_code == 0 and not entry.failed else 1
+
+    def _fail(self, entry: _HeadlessEntry) -> int:
+        entry.failed = True
+        entry.ready.set()
+        return 1
+
+    async def _wait_exit(self, process) -> int:
+        """Waits for a child to exit through a pidfd, without a thread."""
+        popen = process.popen
+        loop = asyncio.get_running_loop()
+        try:
+            pidfd = os.pidfd_open(popen.pid)
+        except (AttributeError, OSError):
+            return await loop.run_in_executor(None, popen.wait)
+
+        exited = loop.create_future()
+        loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await exited
+        finally:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+        return popen.wait()
+
+    def stop(self):
+        processes = [entry.process for entry in self._entries.values()]
+        if self._stopping:
+            self.log("Killing every process")
+            for process in processes:
+                process.kill()
+            return
+        self._stopping = True
+        self.log("Stopping every process, press Ctrl+C again to kill them")
+        asyncio.get_running_loop().run_in_executor(
+            None, stop_processes, processes, self.stop_timeout)
+
+
+def run_profile(path: str, groups: list = None) -> int:
+    try:
+        profile = load_profile(path)
+    except ProfileError as e:
+        print(e, file=sys.stderr)
+        return 2
+    except (OSError, ValueError) as e:
+        print("Could not read {}: {}".format(path, e), file=sys.stderr)
+        return 2
+    try:
+        return asyncio.run(HeadlessRunner(profile.toJSON(), groups=groups).run())
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
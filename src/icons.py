@@ -0,0 +1,32 @@
+"""Icons shared by the whole application.
+
+Parsing and rasterizing an SVG is much slower than creating a widget, so
+every icon is rendered once per size and the same QIcon is reused by every
+button and action showing it.
+"""
+import os
+
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QIcon
+
+from .utils import my_path
+
+ICONS_FOLDER = os.path.join(my_path, 'img', 'fontawesome')
+ICON_SIZE = QSize(24, 24)
+
+_icons = {}
+
+
+def get_icon(name: str, size: QSize = ICON_SIZE) -> QIcon:
+    """Icon from a path relative to img/fontawesome, e.g. "regular/save.svg"."""
+    key = (name, size.width(), size.height())
+    icon = _icons.get(key)
+    if icon is None:
+        icon = QIcon(QIcon(os.path.join(ICONS_FOLDER, name)).pixmap(size))
+        _icons[key] = icon
+    return icon
+
+
+def set_button_icon(button, name: str, size: QSize = ICON_SIZE):
+    button.setIcon(get_icon(name, size))
+    button.setIconSize(size)
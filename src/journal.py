@@ -0,0 +1,105 @@
+"""Append-only journal of the edits of a profile.
+
+Every edit appends the new content of the group it changed, so a change in
+a large profile doesn't rewrite the whole file. After a crash, the edits
+made since the last save are replayed on top of the profile. The journal
+is emptied whenever the profile is saved.
+"""
+import os
+import json
+import hashlib
+import logging
+
+from .utils import get_config_folder
+
+logger = logging.getLogger('process_launcher')
+
+
+def get_journals_folder() -> str:
+    return os.path.join(get_config_folder(), 'journals')
+
+
+def _file_key(path: str) -> dict:
+    stat = os.stat(path)
+    return {"profile": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+class ProfileJournal(object):
+    """Journal of a profile file, in ``~/.process_launcher/journals``.
+
+    The first line identifies the version of the profile the edits apply
+    to. Each other line is either ``{"group": index, "data": {...}}``, the
+    new content of a group (appended if the index is the number of groups),
+    or ``{"profile": {...}}``, the whole profile after groups were deleted.
+    """
+
+    def __init__(self, profile_path: str, folder: str = None):
+        super(ProfileJournal, self).__init__()
+        self.profile_path = os.path.abspath(profile_path)
+        name = hashlib.sha1(self.profile_path.encode("utf-8")).hexdigest()
+        self.path = os.path.join(folder or get_journals_folder(), name + '.jsonl')
+        self._file = None
+
+    def _append(self, entry: dict):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            header_needed = not os.path.exists(self.path)
+            self._file = open(self.path, 'a', buffering=1)
+            if header_needed:
+                self._file.write(json.dumps(_file_key(self.profile_path)) + "\n")
+        self._file.write(json.dumps(entry) + "\n")
+
+    def record_group(self, index: int, data: dict):
+        self._append({"group": index, "data": data})
+
+    def record_profile(self, data: dict):
+        self._append({"profile": data})
+
+    def replay(self, data: dict) -> dict or None:
+        """Applies the journal to the data of the profile.
+
+        Returns None if there is nothing to replay, or if the profile was
+        modified by something else after the journal was started.
+        """
+        try:
+            with open(self.path, 'r') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        try:
+            if not lines or json.loads(lines[0]) != _file_key(self.profile_path):
+                logger.info("Discarding the outdated journal {}".format(self.path))
+                self.clear()
+                return None
+        except (OSError, ValueError):
+            return None
+
+        data = dict(data, groups=list(data["groups"]))
+        replayed = 0
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line may have been cut by the crash
+                break
+            if "profile" in entry:
+                data = dict(entry["profile"], groups=list(entry["profile"]["groups"]))
+            elif entry["group"] < len(data["groups"]):
+                data["groups"][entry["group"]] = entry["data"]
+            else:
+                data["groups"].append(entry["data"])
+            replayed += 1
+        return data if replayed else None
+
+    def clear(self):
+        """Empties the journal, once the profile is saved."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
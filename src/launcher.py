@@ -0,0 +1,341 @@
+import logging
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from .dependencies import resolve_waves, dependents_of, DependencyError
+from .process import stop_processes
+
+logger = logging.getLogger('process_launcher')
+
+DEFAULT_MAX_PARALLEL_LAUNCHES = 8
+"""Maximum number of launches in flight for a whole profile."""
+
+MAX_READINESS_PROBES = 32
+"""Maximum number of readiness probes being waited for at the same time."""
+
+
+class _LaunchJob(object):
+    """A pending restart of a process, with a snapshot of its launch data."""
+
+    def __init__(self, process, group, callback):
+        super(_LaunchJob, self).__init__()
+        self.process = process
+        self.group = group
+        self.callback = callback
+        # Immutable, edits made while the launch is queued replace it
+        self.command = process.command
+        self.error = None
+
+
+class LaunchPool(QObject):
+    """Restarts processes on worker threads so the GUI stays responsive.
+
+    At most ``max_in_flight`` launches run at the same time for the whole
+    profile, and at most the limit set with ``set_group_limit`` for each
+    group. Results are delivered on the GUI thread through Qt signals.
+    """
+
+    launched = pyqtSignal(object)
+    failed = pyqtSignal(object, str)
+    _job_done = pyqtSignal(object)
+    _probe_done = pyqtSignal(object, object, str)
+
+    def __init__(self, max_in_flight=DEFAULT_MAX_PARALLEL_LAUNCHES, parent=None):
+        super(LaunchPool, self).__init__(parent)
+        self.max_in_flight = max_in_flight
+        self._executor = None
+        self._probe_executor = None
+        self._stop_executor = None
+        self._group_limits = {}
+        self._pending = defaultdict(deque)
+        self._in_flight = defaultdict(int)
+        self._total_in_flight = 0
+        self._queued = set()
+        self._running = set()
+        self._job_done.connect(self._on_job_done)
+        self._probe_done.connect(self._on_probe_done)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_in_flight,
+                thread_name_prefix='process_launcher')
+        return self._executor
+
+    def set_max_in_flight(self, max_in_flight: int):
+        max_in_flight = max_in_flight or DEFAULT_MAX_PARALLEL_LAUNCHES
+        if max_in_flight == self.max_in_flight:
+            return
+        self.max_in_flight = max_in_flight
+        if self._executor is not None:
+            # Running jobs finish on the old executor
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._dispatch()
+
+    def set_group_limit(self, group, limit: int or None):
+        """Limits the number of launches in flight for a group."""
+        if limit:
+            self._group_limits[group] = limit
+        else:
+            self._group_limits.pop(group, None)
+        self._dispatch()
+
+    def forget_group(self, group):
+        """Drops the pending launches and the limit of a deleted group."""
+        for job in self._pending.pop(group, ()):
+            self._queued.discard(job.process)
+        for job in self._running:
+            if job.group is group:
+                # Its widgets are gone, nobody is waiting for the result
+                job.callback = None
+        self._group_limits.pop(group, None)
+
+    def submit(self, process, group=None, callback=None) -> bool:
+        """Queues a restart of a process.
+
+        ``callback(process, error)`` is called on the GUI thread once the
+        process has been launched, with ``error`` set to None on success.
+        Returns False if the process was already queued or launching.
+        """
+        if process in self._queued:
+            return False
+        self._queued.add(process)
+        self._pending[group].append(_LaunchJob(process, group, callback))
+        self._dispatch()
+        return True
+
+    def attach(self, process, callback) -> bool:
+        """Also calls ``callback`` once a queued or launching process has
+        been launched, like ``submit`` does. Returns False if it isn't."""
+        if process not in self._queued:
+            return False
+        jobs = [job for jobs in self._pending.values() for job in jobs]
+        for job in jobs + list(self._running):
+            if job.process is process:
+                previous = job.callback
+
+                def callbacks(process, error):
+                    if previous:
+                        previous(process, error)
+                    callback(process, error)
+
+                job.callback = callbacks
+                return True
+        return False
+
+    def is_busy(self, process) -> bool:
+        return process in self._queued
+
+    def _group_has_room(self, group) -> bool:
+        limit = self._group_limits.get(group)
+        return not limit or self._in_flight[group] < limit
+
+    def _dispatch(self):
+        for group, jobs in list(self._pending.items()):
+            while (jobs and self._total_in_flight < self.max_in_flight
+                   and self._group_has_room(group)):
+                job = jobs.popleft()
+                self._in_flight[group] += 1
+                self._total_in_flight += 1
+                self._running.add(job)
+                self.executor.submit(self._run, job)
+            if not jobs:
+                del self._pending[group]
+
+    def _run(self, job: _LaunchJob):
+        """Runs on a worker thread."""
+        try:
+            job.process.restart(job.command)
+            # The first lookup of the window ID is slow, do it here as well
+            job.process.window_id
+        except Exception as e:
+            logger.exception("Could not launch {}".format(job.process.name))
+            job.error = str(e) or e.__class__.__name__
+        self._job_done.emit(job)
+
+    def _on_job_done(self, job: _LaunchJob):
+        self._in_flight[job.group] -= 1
+        self._total_in_flight -= 1
+        self._running.discard(job)
+        self._queued.discard(job.process)
+
+        if job.callback:
+            job.callback(job.process, job.error)
+        if job.error:
+            self.failed.emit(job.process, job.error)
+        else:
+            self.launched.emit(job.process)
+
+        self._dispatch()
+
+    def wait_ready(self, process, probe, directory=None, callback=None):
+        """Waits in the background for a readiness probe of a launched process.
+
+        ``callback(process, error)`` is called on the GUI thread, like in
+        ``submit``. Probes don't count towards the limits of launches in
+        flight, as they spend their time sleeping.
+        """
+        if self._probe_executor is None:
+            self._probe_executor = ThreadPoolExecutor(
+                max_workers=MAX_READINESS_PROBES,
+                thread_name_prefix='process_launcher_probe')
+        self._probe_executor.submit(self._wait_ready, process, probe, directory, callback)
+
+    def _wait_ready(self, process, probe, directory, callback):
+        """Runs on a worker thread."""
+        error = ""
+        try:
+            probe.wait(process, directory)
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+        self._probe_done.emit(process, callback, error)
+
+    def _on_probe_done(self, process, callback, error: str):
+        if callback:
+            callback(process, error or None)
+
+    def stop(self, processes):
+        """Stops processes in the background, see stop_processes.
+
+        They are marked as stopped on purpose right away, so that they are
+        not restarted while waiting for their grace period.
+        """
+        processes = list(processes)
+        for process in processes:
+            process.stop_requested = True
+        if self._stop_executor is None:
+            self._stop_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='process_launcher_stop')
+        self._stop_executor.submit(stop_processes, processes)
+
+    def shutdown(self):
+        self._pending.clear()
+        self._queued.clear()
+        for executor in (self._executor, self._probe_executor, self._stop_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self._executor = None
+        self._probe_executor = None
+        self._stop_executor = None
+
+
+class _ScheduledProcess(object):
+
+    def __init__(self, process, depends_on, probe, callback):
+        super(_ScheduledProcess, self).__init__()
+        self.process = process
+        self.depends_on = list(depends_on or [])
+        self.probe = probe
+        self.callback = callback
+        self.directory = process.directory
+        self.done = False
+
+
+class DependencyScheduler(object):
+    """Launches the processes of a group in the order of their ``depends_on``.
+
+    A process is submitted to the launch pool as soon as all the processes it
+    depends on are ready, i.e. launched and, if they have a ``ready_when``
+    probe, passing it. Independent processes are launched in parallel.
+    """
+
+    def __init__(self, launch_pool: LaunchPool, group=None):
+        super(DependencyScheduler, self).__init__()
+        self.launch_pool = launch_pool
+        self.group = group
+        self._added = []
+        # By name for the processes in a depends_on, by position otherwise
+        self._items = {}
+        self._keys = {}
+        self._waiting_for = {}
+        self._dependents = {}
+
+    def add(self, process, depends_on=None, probe=None, callback=None):
+        """Adds a process, referenced by its name in ``depends_on`` fields.
+
+        ``callback(process, error)`` is called once the process is launched,
+        or with an error if it is skipped because a dependency failed.
+        """
+        self._added.append(_ScheduledProcess(process, depends_on, probe, callback))
+
+    def start(self):
+        """Launches the processes without dependencies.
+
+        Raises DependencyError, before launching anything, on cycles, on
+        unknown names and on duplicate names of the processes with a
+        ``depends_on`` or referenced by one. Other processes may share names,
+        e.g. new empty processes.
+        """
+        referenced = {name for item in self._added for name in item.depends_on}
+        dependencies = {}
+        for i, item in enumerate(self._added):
+            key = i
+            if item.depends_on or item.process.name in referenced:
+                key = item.process.name
+                if key in dependencies:
+                    raise DependencyError("Duplicate process name: {}".format(key))
+                dependencies[key] = item.depends_on
+            self._items[key] = item
+            self._keys[item.process] = key
+        resolve_waves(dependencies)
+        self._dependents = dependents_of(dependencies)
+        self._waiting_for = {key: set(dependencies.get(key, ())) for key in self._items}
+
+        for key, waiting_for in self._waiting_for.items():
+            if not waiting_for:
+                self._launch(key)
+
+    def _launch(self, key):
+        item = self._items[key]
+        if self.launch_pool.submit(item.process, group=self.group,
+                                   callback=self._on_launched):
+            return
+        # Already being launched, e.g. by hand: wait for that launch instead
+        if not self.launch_pool.attach(item.process, self._on_launched):
+            error = "{} could not be launched".format(item.process.name)
+            if item.callback:
+                item.callback(item.process, error)
+            self._fail(key, error)
+
+    def _on_launched(self, process, error):
+        key = self._keys[process]
+        item = self._items[key]
+        if item.callback:
+            item.callback(process, error)
+        if error:
+            self._fail(key, error)
+        elif item.probe:
+            self.launch_pool.wait_ready(process, item.probe, item.directory,
+                                        callback=self._on_ready)
+        else:
+            self._ready(key)
+
+    def _on_ready(self, process, error):
+        if error:
+            logger.warning(error)
+            self._fail(self._keys[process], error)
+        else:
+            self._ready(self._keys[process])
+
+    def _ready(self, key):
+        self._items[key].done = True
+        for dependent in self._dependents.get(key, ()):
+            waiting_for = self._waiting_for[dependent]
+            waiting_for.discard(key)
+            if not waiting_for and not self._items[dependent].done:
+                self._launch(dependent)
+
+    def _fail(self, key, error: str):
+        """Skips everything that depends, directly or not, on a process."""
+        self._items[key].done = True
+        for dependent in self._dependents.get(key, ()):
+            item = self._items[dependent]
+            if item.done:
+                continue
+            if item.callback:
+                item.callback(item.process, "{} is not ready".format(key))
+            self._fail(dependent, error)
@@ -0,0 +1,233 @@
+"""Resource limits and CPU pinning of a process, applied before exec.
+
+Everything that can fail in the launcher (parsing, creating the cgroup) is
+done in ``prepare``. The function it returns only makes system calls. It
+applies the limits to the process given by its PID, which the launcher
+starts stopped, see process.py, or in the child between fork and exec.
+"""
+import os
+import re
+import ctypes
+import ctypes.util
+import platform
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+from .utils import safe_file_name
+
+LIMIT_KEYS = ("cpu_affinity", "numa_node", "nice", "ionice", "rlimits", "cgroup")
+"""Keys of a process entry of a profile read by ProcessLimits."""
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+CGROUP_FOLDER = "process_launcher"
+CGROUP_FILES = ("memory.max", "memory.high", "cpu.max", "cpu.weight")
+
+NUMA_NODE_CPULIST = "/sys/devices/system/node/node{}/cpulist"
+
+IONICE_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+_SYS_IOPRIO_SET = {"x86_64": 251, "i686": 289, "aarch64": 30, "armv7l": 314}
+
+RLIMIT_ALIASES = {"memory": "AS"}
+"""Names of ``rlimits`` that are not the name of a RLIMIT_* constant."""
+
+
+class LimitsError(ValueError):
+    pass
+
+
+def parse_cpu_list(cpus) -> set:
+    """CPUs from a list of numbers or from a string like "0-3,8"."""
+    if isinstance(cpus, str):
+        result = set()
+        for part in cpus.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            match = re.fullmatch(r"(\d+)(?:-(\d+))?", part)
+            if not match:
+                raise LimitsError("Invalid CPU list: {}".format(cpus))
+            first = int(match.group(1))
+            result.update(range(first, int(match.group(2) or first) + 1))
+        return result
+    return {int(cpu) for cpu in cpus}
+
+
+def numa_node_cpus(node: int) -> set:
+    try:
+        with open(NUMA_NODE_CPULIST.format(node)) as f:
+            return parse_cpu_list(f.read())
+    except OSError:
+        raise LimitsError("Unknown NUMA node: {}".format(node))
+
+
+def own_cgroup() -> str or None:
+    """Path of the cgroup v2 of this process, or None without cgroup v2."""
+    if not os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers")):
+        # Not mounted, or a legacy/hybrid hierarchy
+        return None
+    try:
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    return os.path.join(CGROUP_ROOT, line[3:].strip().lstrip("/"))
+    except OSError:
+        pass
+    return None
+
+
+def _write(path: str, value: str):
+    with open(path, "w") as f:
+        f.write(value)
+
+
+class ProcessLimits(object):
+    """Optional limits of a process entry of a profile, e.g.
+
+    ``{"cpu_affinity": "0-3", "nice": 10, "ionice": {"class": "idle"},
+    "rlimits": {"memory": 2147483648, "nofile": 1024},
+    "cgroup": {"memory.max": "512M", "cpu.max": "50000 100000"}}``.
+    """
+
+    def __init__(self, cpu_affinity=None, numa_node=None, nice=None, ionice=None,
+                 rlimits=None, cgroup=None):
+        super(ProcessLimits, self).__init__()
+        self.cpu_affinity = cpu_affinity
+        self.numa_node = numa_node
+        self.nice = nice
+        self.ionice = ionice
+        self.rlimits = dict(rlimits or {})
+        self.cgroup = dict(cgroup or {})
+        self._validate()
+
+    @classmethod
+    def from_dict(cls, data: dict or None):
+        """Limits found in a process entry, None if it has none."""
+        limits = {key: data[key] for key in LIMIT_KEYS if data and data.get(key) is not None}
+        return cls(**limits) if limits else None
+
+    def toJSON(self) -> dict:
+        ret = {}
+        for key in LIMIT_KEYS:
+            value = getattr(self, key)
+            if value is not None and value != {}:
+                ret[key] = value
+        return ret
+
+    def _validate(self):
+        if self.cpu_affinity is not None:
+            parse_cpu_list(self.cpu_affinity)
+        if self.ionice is not None:
+            self._ioprio()
+        for name, value in self.rlimits.items():
+            self._rlimit(name, value)
+        for name in self.cgroup:
+            if name not in CGROUP_FILES:
+                raise LimitsError("Unsupported cgroup setting: {}".format(name))
+
+    def cpus(self) -> set or None:
+        cpus = None
+        if self.cpu_affinity is not None:
+            cpus = parse_cpu_list(self.cpu_affinity)
+        if self.numa_node is not None:
+            node_cpus = numa_node_cpus(self.numa_node)
+            cpus = node_cpus if cpus is None else cpus & node_cpus
+        if cpus is not None and not cpus:
+            raise LimitsError("No CPU left for cpu_affinity {} on NUMA node {}".format(
+                self.cpu_affinity, self.numa_node))
+        return cpus
+
+    def _ioprio(self) -> int:
+        ionice = self.ionice
+        if isinstance(ionice, str):
+            ionice = {"class": ionice}
+        io_class = ionice.get("class", "best-effort")
+        if io_class not in IONICE_CLASSES:
+            raise LimitsError("Unknown ionice class: {}".format(io_class))
+        level = int(ionice.get("level", 4))
+        if not 0 <= level <= 7:
+            raise LimitsError("ionice level must be between 0 and 7: {}".format(level))
+        return IONICE_CLASSES[io_class] << _IOPRIO_CLASS_SHIFT | level
+
+    @staticmethod
+    def _rlimit(name: str, value) -> (int, tuple):
+        constant = "RLIMIT_{}".format(RLIMIT_ALIASES.get(name, name).upper())
+        if resource is None or not hasattr(resource, constant):
+            raise LimitsError("Unknown rlimit: {}".format(name))
+        if isinstance(value, (list, tuple)):
+            soft, hard = value
+        else:
+            soft = hard = value
+        to_limit = lambda v: resource.RLIM_INFINITY if v is None else int(v)
+        return getattr(resource, constant), (to_limit(soft), to_limit(hard))
+
+    def create_cgroup(self, name: str) -> str or None:
+        """Creates or updates the cgroup of a process, returns its path.
+
+        Cgroups are created in a ``process_launcher`` folder next to the
+        cgroup of the launcher, which must be writable, e.g. delegated by
+        systemd to the user session.
+        """
+        if not self.cgroup:
+            return None
+        cgroup = own_cgroup()
+        if cgroup is None:
+            raise LimitsError("cgroup limits need cgroup v2")
+        base = os.path.join(os.path.dirname(cgroup), CGROUP_FOLDER)
+        path = os.path.join(base, safe_file_name(name))
+        try:
+            os.makedirs(path, exist_ok=True)
+            controllers = {setting.split(".")[0] for setting in self.cgroup}
+            _write(os.path.join(base, "cgroup.subtree_control"),
+                   " ".join("+" + controller for controller in sorted(controllers)))
+            for setting, value in self.cgroup.items():
+                _write(os.path.join(path, setting), str(value))
+        except OSError as e:
+            raise LimitsError("Could not set up the cgroup {}: {}".format(path, e))
+        return path
+
+    def prepare(self, name: str):
+        """Returns the function ``apply_limits(pid=0)``, applying the limits
+        to a process, or to the calling one if ``pid`` is 0.
+
+        Raises LimitsError if the limits can't be applied.
+        """
+        cpus = self.cpus()
+        ioprio = self._ioprio() if self.ionice is not None else None
+        rlimits = [self._rlimit(limit, value) for limit, value in self.rlimits.items()]
+        cgroup_procs = self.create_cgroup(name)
+        if cgroup_procs:
+            cgroup_procs = os.path.join(cgroup_procs, "cgroup.procs")
+        nice = self.nice
+
+        ioprio_set = None
+        if ioprio is not None:
+            syscall_number = _SYS_IOPRIO_SET.get(platform.machine())
+            if syscall_number is None:
+                raise LimitsError("ionice is not supported on {}".format(platform.machine()))
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            ioprio_set = lambda pid: libc.syscall(syscall_number, _IOPRIO_WHO_PROCESS, pid,
+                                                  ioprio)
+
+        def apply_limits(pid=0):
+            # Maybe between fork and exec: no logging, no imports
+            if cgroup_procs:
+                _write(cgroup_procs, str(pid))
+            if cpus is not None:
+                os.sched_setaffinity(pid, cpus)
+            if nice is not None:
+                os.setpriority(os.PRIO_PROCESS, pid, nice)
+            if ioprio_set is not None and ioprio_set(pid) != 0:
+                raise OSError(ctypes.get_errno(), "ioprio_set failed")
+            for limit, values in rlimits:
+                if pid:
+                    resource.prlimit(pid, limit, values)
+                else:
+                    resource.setrlimit(limit, values)
+
+        return apply_limits
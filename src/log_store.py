@@ -0,0 +1,234 @@
+"""Bounded storage of the output of the processes.
+
+Each process gets a ring of its last lines in memory and a few rotating
+segment files on disk, under ``~/.process_launcher/logs/<group>/<process>/``.
+A segment is named after the offset of its first byte in the whole output,
+so offsets stay valid when old segments are deleted. Segments are read
+through mmap, so tails, seeks and searches only touch the pages they need.
+"""
+import os
+import re
+import mmap
+import threading
+from collections import deque
+
+from .utils import get_config_folder, safe_file_name
+
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_SEGMENTS = 8
+DEFAULT_MEMORY_LINES = 1000
+DEFAULT_SEARCH_BYTES = 16 * 1024 * 1024
+"""Bytes from the end of the output searched by default."""
+
+SEGMENT_SUFFIX = '.log'
+
+
+def get_logs_folder() -> str:
+    return os.path.join(get_config_folder(), 'logs')
+
+
+class _Segment(object):
+
+    def __init__(self, path: str, start: int):
+        super(_Segment, self).__init__()
+        self.path = path
+        self.start = start
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self._mmap = None
+        self._mmap_size = 0
+
+    @property
+    def end(self) -> int:
+        return self.start + self.size
+
+    def map(self):
+        """Maps the segment, again only if it has grown since the last time."""
+        if self.size == 0:
+            return None
+        if self._mmap is None or self._mmap_size != self.size:
+            self.unmap()
+            with open(self.path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mmap_size = len(self._mmap)
+        return self._mmap
+
+    def unmap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+class ProcessLog(object):
+    """Output of a single process. Thread safe."""
+
+    def __init__(self, directory: str, segment_size=DEFAULT_SEGMENT_SIZE,
+                 max_segments=DEFAULT_MAX_SEGMENTS, memory_lines=DEFAULT_MEMORY_LINES):
+        super(ProcessLog, self).__init__()
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.lines = deque(maxlen=memory_lines)
+        self._lock = threading.RLock()
+        self._file = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments = [
+            _Segment(os.path.join(directory, name), int(name[:-len(SEGMENT_SUFFIX)]))
+            for name in sorted(os.listdir(directory))
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        ]
+        if not self._segments:
+            self._new_segment(0)
+
+    @property
+    def start_offset(self) -> int:
+        """Offset of the oldest byte still stored."""
+        return self._segments[0].start
+
+    @property
+    def end_offset(self) -> int:
+        return self._segments[-1].end
+
+    def _new_segment(self, start: int):
+        path = os.path.join(self.directory, '{:020d}{}'.format(start, SEGMENT_SUFFIX))
+        self._segments.append(_Segment(path, start))
+        while len(self._segments) > self.max_segments:
+            old = self._segments.pop(0)
+            old.unmap()
+            try:
+                os.remove(old.path)
+            except OSError:
+                pass
+
+    def write_lines(self, lines: list):
+        self.lines.extend(lines)
+        self.append("".join(line + "\n" for line in lines).encode("utf-8"))
+
+    def append(self, data: bytes):
+        with self._lock:
+            while data:
+                segment = self._segments[-1]
+                if segment.size >= self.segment_size:
+                    self._close_file()
+                    self._new_segment(segment.end)
+                    segment = self._segments[-1]
+                if self._file is None:
+                    self._file = open(segment.path, 'ab', buffering=0)
+                chunk = data[:self.segment_size - segment.size]
+                self._file.write(chunk)
+                segment.size += len(chunk)
+                data = data[len(chunk):]
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read(self, offset: int, size: int) -> bytes:
+        """Reads up to ``size`` bytes starting at an offset of the whole output."""
+        with self._lock:
+            offset = max(offset, self.start_offset)
+            end = min(offset + size, self.end_offset)
+            chunks = []
+            for segment in self._segments:
+                if segment.end <= offset or segment.start >= end:
+                    continue
+                data = segment.map()
+                if data is not None:
+                    chunks.append(data[max(offset, segment.start) - segment.start:
+                                       min(end, segment.end) - segment.start])
+            return b"".join(chunks)
+
+    def follow(self, offset: int) -> (bytes, int):
+        """Returns what was written since ``offset`` and the offset to follow from."""
+        end = self.end_offset
+        return self.read(offset, end - offset), end
+
+    def tail(self, n_lines: int) -> list:
+        """Last lines of the output, from memory if possible."""
+        if n_lines <= len(self.lines):
+            return list(self.lines)[-n_lines:]
+
+        with self._lock:
+            # Walk the segments backwards until enough newlines are found
+            start = self.start_offset
+            newlines = 0
+            for segment in reversed(self._segments):
+                data = segment.map()
+                if data is None:
+                    continue
+                position = len(data)
+                if segment is self._segments[-1] and data[-1:] == b"\n":
+                    position -= 1
+                while newlines < n_lines:
+                    position = data.rfind(b"\n", 0, position)
+                    if position < 0:
+                        break
+                    newlines += 1
+                if newlines >= n_lines:
+                    start = segment.start + position + 1
+                    break
+            data = self.read(start, self.end_offset - start)
+        return data.decode("utf-8", "replace").splitlines()[-n_lines:]
+
+    def search(self, pattern: str, last_bytes=DEFAULT_SEARCH_BYTES,
+               max_results=1000) -> list:
+        """Lines matching a regex in the last ``last_bytes`` of the output.
+
+        Returns a list of ``(offset, line)``, oldest first. Lines crossing
+        a segment boundary are only searched in their first part.
+        """
+        regex = re.compile(pattern.encode("utf-8"))
+        results = []
+        with self._lock:
+            start = max(self.start_offset, self.end_offset - last_bytes)
+            for segment in self._segments:
+                if segment.end <= start:
+                    continue
+                data = segment.map()
+                if data is None:
+                    continue
+                position = max(0, start - segment.start)
+                for match in regex.finditer(data, position):
+                    line_start = data.rfind(b"\n", 0, match.start()) + 1
+                    line_end = data.find(b"\n", match.end())
+                    line_end = len(data) if line_end < 0 else line_end
+                    line = data[line_start:line_end].decode("utf-8", "replace")
+                    if results and results[-1][0] == segment.start + line_start:
+                        continue
+                    results.append((segment.start + line_start, line))
+                    if len(results) >= max_results:
+                        return results
+        return results
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+            for segment in self._segments:
+                segment.unmap()
+
+
+class LogStore(object):
+    """Logs of all the processes, keyed by group and process name."""
+
+    def __init__(self, folder: str = None, **log_options):
+        super(LogStore, self).__init__()
+        self.folder = folder or get_logs_folder()
+        self.log_options = log_options
+        self._logs = {}
+        self._lock = threading.Lock()
+
+    def get(self, group: str, name: str) -> ProcessLog:
+        key = (group, name)
+        with self._lock:
+            if key not in self._logs:
+                self._logs[key] = ProcessLog(
+                    os.path.join(self.folder, safe_file_name(group), safe_file_name(name)),
+                    **self.log_options)
+            return self._logs[key]
+
+    def close(self):
+        with self._lock:
+            for log in self._logs.values():
+                log.close()
+            self._logs.clear()
@@ -1,78 +1,247 @@
 
 import subprocess
 import os
+import time
+import errno
+import shutil
+import signal
+
+from . import proctree
+from .command import CommandSpec
+from .zygote import is_supported as is_zygote_supported
+from .utils import ProcessStatus, kill_command_windows, get_platform, SupportedPlatforms
 
-import shlex
+DEFAULT_STOP_TIMEOUT = 5.0
+"""Seconds between SIGTERM and SIGKILL when stopping a process."""
 
-from .utils import ProcessStatus, kill_command_windows, get_platform, SupportedPlatforms
+KILL_TIMEOUT = 1.0
+"""Seconds to wait for a process to die after SIGKILL."""
+
+STOP_POLL_INTERVAL = 0.05
+
+USE_PROCESS_GROUPS = os.name == 'posix'
+"""Each process is launched in its own session, and its whole tree is
+signalled when it's stopped."""
+
+STOPPED_START = ('/bin/sh', '-c', 'kill -STOP $$ && exec "$@"', 'sh')
+"""Prefix of the arguments of processes with limits: the shell stops itself
+and the launcher applies the limits to it before resuming it, and they are
+inherited by the command it then runs.
+
+Without a preexec_fn, subprocess spawns with vfork, which costs the same
+however much memory the launcher uses. A preexec_fn needs a fork, which
+copies the page tables of the launcher, e.g. 60 spawns/s instead of 1,000
+for a launcher of 500 MB, see benchmarks/spawn.py."""
+
+USE_STOPPED_START = USE_PROCESS_GROUPS and hasattr(os, 'waitid') \
+    and os.path.exists(STOPPED_START[0])
 
-get_window_script = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'get_windowid.sh')
 
 class PopenProcess(object):
-    """docstring for PopenProcess"""
+    """docstring for PopenProcess
+
+    The arguments and the directory are in ``command``, a CommandSpec that
+    the widgets replace when they are edited. Nothing here reads the widgets.
+    """
+
+    reports_exit = False
+    """True for processes that reap their children themselves and call
+    ``exit_listener(process, popen)`` when they exit."""
 
-    def __init__(self, args_table_widget, name=None, parent_widget=None):
+    runs_command = True
+    """False for processes that only start a terminal running the command,
+    which may hand it over to another terminal and exit right away."""
+
+    def __init__(self, name=None, parent_widget=None, args=None, directory=None,
+                 command=None):
         super(PopenProcess, self).__init__()
-        self.args_table_widget = args_table_widget
         self.name = name
         self.parent_widget = parent_widget
+        self.command = command or CommandSpec(args or [], directory)
+        self.exit_listener = None
+        self.restart_policy = None
+        self.stop_timeout = DEFAULT_STOP_TIMEOUT
+        # ProcessLimits applied to the process before exec
+        self.limits = None
+        # Zygote of the group, for the backends that can use one
+        self.zygote = None
         self.reset()
 
     def reset(self):
         self.popen = None
         self._window_id = None
+        # Set when stopped on purpose, so that it is not restarted
+        self.stop_requested = False
 
     @property
     def status(self) -> ProcessStatus:
-        if not self.popen or self.popen:
-            return ProcessStatus.STOPPED
-        return_code = self.popen.poll()
-        if not return_code:
-            return ProcessStatus.RUNNING
-        # TODO: switch the values of return_code (POSIX only)
-        else:
+        """Status of the process, as last seen by the ChildSupervisor."""
+        if not self.popen or self.return_code is not None:
             return ProcessStatus.STOPPED
+        return ProcessStatus.RUNNING
+
+    def poll(self) -> int or None:
+        """Reaps the process if it has exited, returning its return code."""
+        return self.popen.poll() if self.popen else None
+
+    @property
+    def return_code(self) -> int or None:
+        """None while running, negative if the process was killed by a signal."""
+        return self.popen.returncode if self.popen else None
+
+    @property
+    def exit_code(self) -> int or None:
+        return_code = self.return_code
+        return return_code if return_code is not None and return_code >= 0 else None
+
+    @property
+    def exit_signal(self) -> int or None:
+        return_code = self.return_code
+        return -return_code if return_code is not None and return_code < 0 else None
+
+    def describe_exit(self) -> str:
+        if self.exit_signal is not None:
+            try:
+                signal_name = signal.Signals(self.exit_signal).name
+            except ValueError:
+                signal_name = str(self.exit_signal)
+            return "killed by {}".format(signal_name)
+        elif self.exit_code is not None:
+            return "exited with code {}".format(self.exit_code)
+        return "running"
 
     @property
     def args(self) -> list:
-        return [
-            self.args_table_widget.item(i, 0).text()
-            for i in range(self.args_table_widget.rowCount())
-            if self.args_table_widget.item(i, 0)
-        ]
+        return list(self.command.args)
 
     @property
     def directory(self) -> str:
-        return self.parent_widget.directory_widget.text()
+        return self.command.directory
 
     @property
     def pid(self) -> int:
         return self.popen.pid if self.popen else None
         # subprocess.Popen().pid
 
-    def restart(self):
+    def restart(self, command=None):
         if self.popen:
             self.kill()
         self.reset()
-        self.run()
+        self.run(command)
+
+    def run(self, command=None):
+        """Launches the process.
 
-    def run(self):
+        ``command`` defaults to ``self.command``. The launch pool passes the
+        one of the moment the launch was queued.
+        """
         raise NotImplementedError("Method not implemented")
 
+    def zygote_for(self, command: CommandSpec):
+        """The zygote to fork the command from, None to spawn it.
+
+        Processes with limits are always spawned, see prepare_launch.
+        """
+        if self.zygote is None or self.limits is not None or not is_zygote_supported():
+            return None
+        return self.zygote if self.zygote.can_run(command) else None
+
+    def prepare_launch(self, command: CommandSpec, args=None) -> tuple:
+        """``(args, preexec_fn, apply_limits)`` to spawn ``args``, the ones of
+        the command by default, with the limits of the process.
+
+        If ``apply_limits`` is set, the process starts stopped, and
+        resume_with_limits must be called once it's spawned. Raises
+        LimitsError if they can't be applied, before anything is spawned.
+        """
+        args = list(command.args if args is None else args)
+        if self.limits is None:
+            return args, None, None
+        apply_limits = self.limits.prepare(self.name)
+        if not USE_STOPPED_START:
+            return args, apply_limits, None
+        _check_executable(args[0], command)
+        return list(STOPPED_START) + args, None, apply_limits
+
+    def resume_with_limits(self, apply_limits):
+        """Applies the limits to the process started by prepare_launch, then
+        resumes it. It is killed if they can't be applied."""
+        pid = self.popen.pid
+        try:
+            # WNOWAIT: the exit status, if any, is left for subprocess
+            state = os.waitid(os.P_PID, pid, os.WSTOPPED | os.WEXITED | os.WNOWAIT)
+            if state.si_code != os.CLD_STOPPED:
+                raise ChildProcessError("Process {} exited before starting".format(pid))
+            apply_limits(pid)
+        except BaseException:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+            raise
+        os.kill(pid, signal.SIGCONT)
+
+    def stop(self, timeout=None):
+        """Stops the process on purpose, e.g. from the stop button.
+
+        Blocks until its whole tree is gone, see stop_processes.
+        """
+        stop_processes([self], timeout)
+
+    def tree_pids(self) -> list:
+        """PIDs of the process and of all its descendants, the process first.
+
+        Empty once the process has exited, as its PID may be reused.
+        """
+        if not self.popen or self.poll() is not None:
+            return []
+        if not proctree.is_available():
+            return [self.pid]
+        return [self.pid] + proctree.descendants(self.pid)
+
+    def signal_tree(self, signum: int, pids: list = None):
+        """Sends a signal to the process and to all its descendants.
+
+        The process group of the process is signalled as a whole, and
+        descendants that moved to other groups, e.g. the shells of terminals,
+        one by one. ``pids`` must be collected before killing anything, as
+        orphans are adopted by init and can't be found anymore.
+        """
+        if not self.popen:
+            return
+        pids = self.tree_pids() if pids is None else pids
+        try:
+            # The process is the leader of its group, which may outlive it
+            os.killpg(self.pid, signum)
+        except OSError:
+            pass
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+
     def kill(self):
-        if self.popen:
+        if not self.popen:
+            return
+        if USE_PROCESS_GROUPS:
+            self.signal_tree(signal.SIGKILL)
+        else:
             self.popen.kill()
 
     def terminate(self):
         if self.popen:
-            self.popen.terminate()
+            if USE_PROCESS_GROUPS:
+                self.signal_tree(signal.SIGTERM)
+            else:
+                self.popen.terminate()
         self.popen = None
 
     def transform_to(self, cls):
         """Transform this process into an instance of another class."""
-        return cls(args_table_widget=self.args_table_widget,
-                   name=self.name,
-                   parent_widget=self.parent_widget)
+        return cls(name=self.name,
+                   parent_widget=self.parent_widget,
+                   command=self.command)
 
 
 class LinuxProcess(PopenProcess):
@@ -85,45 +254,85 @@ class LinuxProcess(PopenProcess):
         elif not self.pid:
             return None
 
-        command = shlex.split('bash {0} {1}'.format(get_window_script, self.pid))
-        process = subprocess.Popen(args=command,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   shell=False)
+        # Imported here, like the other X11 helpers, so that the headless
+        # mode doesn't pay for them
+        from .window_index import get_window_index
 
-        (output, _) = process.communicate()
-        process.wait()
-
-        output = output.decode("utf-8")
-        self._window_id = output.replace("\n", "")
+        # Misses are not stored here, the index caches them for a while
+        self._window_id = get_window_index().resolve(self.pid, self.command)
         return self._window_id
 
     def minimize(self):
-        if not self.window_id:
-            return
+        minimize_processes([self])
+
+    def restore(self):
+        restore_processes([self])
 
-        command = shlex.split(
-            'xdotool windowminimize {}'.format(self.window_id))
-        process = subprocess.Popen(args=command,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   shell=False)
 
-        (output, err) = process.communicate()
-        # process.wait()
+def _xdotool(action: str, window_id: int):
+    command = ['xdotool', action, str(window_id)]
+    process = subprocess.Popen(args=command,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               shell=False)
+
+    (output, err) = process.communicate()
+
+
+def _window_ids(processes) -> list:
+    return [
+        process.window_id for process in processes
+        if isinstance(process, LinuxProcess) and process.window_id
+    ]
 
-    def restore(self):
-        if not self.window_id:
-            return
 
-        command = shlex.split('xdotool windowmap {}'.format(self.window_id))
-        process = subprocess.Popen(args=command,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   shell=False)
+def minimize_processes(processes):
+    """Minimizes the windows of several processes in one batch."""
+    from .x11 import get_window_backend
 
-        (output, err) = process.communicate()
-        # process.wait()
+    window_ids = _window_ids(processes)
+    backend = get_window_backend()
+    if backend:
+        backend.minimize(window_ids)
+    else:
+        for window_id in window_ids:
+            _xdotool('windowminimize', window_id)
+
+
+def restore_processes(processes):
+    """Restores the windows of several processes in one batch."""
+    from .x11 import get_window_backend
+
+    window_ids = _window_ids(processes)
+    backend = get_window_backend()
+    if backend:
+        backend.restore(window_ids)
+    else:
+        for window_id in window_ids:
+            _xdotool('windowmap', window_id)
+
+
+class DirectProcess(PopenProcess):
+    """Runs the command directly, without a terminal emulator."""
+
+    @property
+    def window_id(self):
+        return None
+
+    def run(self, command=None):
+        command = command or self.command
+        zygote = self.zygote_for(command)
+        if zygote is not None:
+            # Inherits the standard streams, like below
+            self.popen = zygote.spawn(command, (0, 1, 2))
+            return
+        args, preexec_fn, apply_limits = self.prepare_launch(command)
+        self.popen = subprocess.Popen(
+            args=args, cwd=command.cwd, env=command.environ(),
+            shell=False, start_new_session=USE_PROCESS_GROUPS,
+            preexec_fn=preexec_fn)
+        if apply_limits:
+            self.resume_with_limits(apply_limits)
 
 
 class WindowsProcess(PopenProcess):
@@ -132,33 +341,105 @@ class WindowsProcess(PopenProcess):
         if self.popen:
             kill_command_windows(self.popen.pid)
 
+    @property
     def window_id(self):
-        pass
+        return None
 
 
 class KonsoleProcess(LinuxProcess):
-    def create_command(self) -> str:
-        command = "{}".format(self.args[0])
-        for argument in self.args[1:]:
-            command += " {}".format(argument)
-        return command
 
-    def run(self):
-        self.popen = subprocess.Popen(args=[
+    runs_command = False
+
+    def run(self, command=None):
+        command = command or self.command
+        # The limits of Konsole are inherited by the shell and the command
+        args, preexec_fn, apply_limits = self.prepare_launch(command, [
             'konsole',
-            '--workdir', self.directory,
+            '--workdir', command.directory,
             # Run the new instance of Konsole in a separate process.
             '--noclose',
             # '--separate',
-            '-e', '{}'.format(self.create_command())
-        ], shell=False)
+            # Quoted once per edit, see CommandSpec
+            '-e', command.command_line
+        ])
+        self.popen = subprocess.Popen(
+            args=args, shell=False, start_new_session=True, env=command.environ(),
+            preexec_fn=preexec_fn)
+        if apply_limits:
+            self.resume_with_limits(apply_limits)
 
 
 class CustomWindowsProcess(WindowsProcess):
-    def run(self):
+    def run(self, command=None):
+        command = command or self.command
         self.popen = subprocess.Popen(args=[
-            *self.args
-        ], shell=True)
+            *command.args
+        ], shell=True, env=command.environ())
+
+
+def _check_executable(program: str, command: CommandSpec):
+    """Raises FileNotFoundError like subprocess, as the shell of
+    STOPPED_START would only exit with 127."""
+    if os.sep in program:
+        path = os.path.join(command.cwd or '', os.path.expanduser(program))
+        found = os.access(path, os.X_OK) and not os.path.isdir(path)
+    else:
+        environ = command.environ()
+        found = shutil.which(program, path=(environ if environ is not None else os.environ).get(
+            'PATH', os.defpath)) is not None
+    if not found:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), program)
+
+
+def _is_alive(pid: int) -> bool:
+    stat = proctree.read_stat(pid)
+    return stat is not None and stat[0] != b'Z'
+
+
+def stop_processes(processes, timeout=None):
+    """Stops several processes and their descendants in parallel.
+
+    Every tree gets a SIGTERM first, and a SIGKILL if anything is still alive
+    after its grace period (``timeout``, or the ``stop_timeout`` of each
+    process). All of them are waited for at the same time, so this blocks
+    for about one grace period, however many processes there are.
+    """
+    processes = list(processes)
+    for process in processes:
+        process.stop_requested = True
+    if not USE_PROCESS_GROUPS or not proctree.is_available():
+        for process in processes:
+            process.kill()
+        return
+
+    start = time.monotonic()
+    trees = []
+    for process in processes:
+        pids = process.tree_pids()
+        process.signal_tree(signal.SIGTERM, pids)
+        if pids:
+            grace = process.stop_timeout if timeout is None else timeout
+            trees.append((process, pids, start + grace, False))
+
+    while trees:
+        now = time.monotonic()
+        remaining = []
+        for process, pids, deadline, killed in trees:
+            # Reap the direct child, or it will stay as a zombie
+            process.poll()
+            pids = [pid for pid in pids if _is_alive(pid)]
+            if not pids:
+                continue
+            if now >= deadline:
+                if killed:
+                    # Stuck in the kernel, don't wait for it forever
+                    continue
+                process.signal_tree(signal.SIGKILL, pids)
+                deadline, killed = now + KILL_TIMEOUT, True
+            remaining.append((process, pids, deadline, killed))
+        trees = remaining
+        if trees:
+            time.sleep(STOP_POLL_INTERVAL)
 
 
 CurrentPlatformProcess = KonsoleProcess if get_platform(
@@ -1,14 +1,18 @@
-import os
-
 import PyQt5.QtCore
-from PyQt5.QtCore import QSize, QObjectCleanupHandler
-from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import (QWidget, QGridLayout, QLabel,
+from PyQt5.QtGui import QKeySequence
+from PyQt5.QtWidgets import (QWidget, QGridLayout,
                              QHBoxLayout, QVBoxLayout, QPushButton,
-                             QLineEdit, QShortcut)
-
-from .process_widget import ProcessWidget
-from .utils import AppMode, my_path
+                             QLineEdit, QShortcut, QMessageBox)
+
+from .process_widget import ProcessWidget, empty_process_name
+from .process import minimize_processes, restore_processes
+from .launcher import DependencyScheduler
+from .dependencies import DependencyError
+from .limits import ProcessLimits
+from .environment import ProcessEnvironment
+from .zygote import ZygoteSpec, get_zygote
+from .utils import AppMode
+from .icons import set_button_icon
 
 empty_group_data = {
     "name": "",
@@ -19,16 +23,36 @@ empty_group_data = {
 class ProcessGroup(QWidget):
     """docstring for ProcessGroup"""
 
-    def __init__(self, window=None, name=None, group_number=-1):
+    def __init__(self, window=None, name=None, group_number=-1,
+                 max_parallel_launches=None, environment: ProcessEnvironment = None,
+                 zygote: ZygoteSpec = None):
         super(ProcessGroup, self).__init__(window)
         self.group_number = group_number
         self.app_mode = window.app_mode
         self.parent_widget = window
+        self.max_parallel_launches = max_parallel_launches
+        # Applied before the environment of each process
+        self.environment = environment
+        self.zygote_spec = zygote
+        # Started on the first launch of one of its processes
+        self.zygote = get_zygote(zygote)
+        self.launch_pool.set_group_limit(self, max_parallel_launches)
         self.container = _ProcessContainer(self)
         self.header = _ProcessGroupHeader(self, name)
         self._init_style()
         self._init_layout()
         self.n_columns = 2
+        # JSON of the group, built again only after it's edited
+        self._json = None
+        self.header.title.textChanged.connect(self.mark_changed)
+
+    @property
+    def launch_pool(self):
+        return self.parent_widget.launch_pool
+
+    @property
+    def name(self) -> str:
+        return self.header.name
 
     def add_element(self, element):
         # return
@@ -56,13 +80,27 @@ class ProcessGroup(QWidget):
         self.vbox.addLayout(self.hbox2)
         self.setLayout(self.vbox)
 
+    def mark_changed(self):
+        """Called whenever the group or one of its processes is edited."""
+        self._json = None
+        self.parent_widget.on_group_changed(self)
+
     def toJSON(self) -> dict:
+        if self._json is not None:
+            return self._json
         ret = {}
         ret["name"] = self.header.name
+        if self.max_parallel_launches:
+            ret["max_parallel_launches"] = self.max_parallel_launches
+        if self.environment:
+            ret.update(self.environment.toJSON())
+        if self.zygote_spec:
+            ret["zygote"] = self.zygote_spec.toJSON()
         ret["processes"] = []
         for process in self.container.elements:
             ret["processes"].append(process.toJSON())
 
+        self._json = ret
         return ret
 
     def change_mode(self, mode: AppMode):
@@ -75,16 +113,19 @@ class ProcessGroup(QWidget):
         self.header.create_shorcut_buttons()
 
     def add_empty_process(self):
-        process_widget = ProcessWidget.create_empty_process(self)
+        process_widget = ProcessWidget.create_empty_process(
+            self.container, empty_process_name(process.name for process in self.processes))
         self.add_element(process_widget)
 
+    @property
+    def processes(self) -> list:
+        return [widget.process for widget in self.container.elements]
+
     def minimize_all_processes(self):
-        for widget in self.container.elements:
-            widget.process.minimize()
+        minimize_processes(self.processes)
 
     def restore_all_processes(self):
-        for widget in self.container.elements:
-            widget.process.restore()
+        restore_processes(self.processes)
 
     def delete(self):
         """Delete this group."""
@@ -98,106 +139,88 @@ class _ProcessGroupHeader(QWidget):
         self.app_mode = window.app_mode
         self.parent_widget = window
 
-        # This will be overwritten later
-        self.title = QLabel(name or 'Group of processes')
-        self.title.setAlignment(PyQt5.QtCore.Qt.AlignHCenter)
+        # Read only in the launch mode
+        self.title = QLineEdit(name or 'Group of processes')
 
         self.launch_button = None
         self.stop_button = None
+        # Only created the first time the edit mode is shown
         self.delete_button = None
         self.add_process_button = None
-        self.create_variable_widgets(self.app_mode)
         self.create_shorcut_buttons()
 
         self.widget_layout = None
         self._init_layout()
+        self.change_mode(self.app_mode)
 
     @property
     def name(self):
         return self.title.text() if self.title else ""
 
     def _init_layout(self):
-        """
-        See:
-            https://stackoverflow.com/questions/10416582/replacing-layout-on-a-qwidget-with-another-layout?lq=1
-        """
-        if self.layout():
-            QObjectCleanupHandler().add(self.layout())
-
         self.widget_layout = QVBoxLayout()
         self.title_and_delete_layout = QHBoxLayout()
         self.title_and_delete_layout.addWidget(self.title)
-        if self.delete_button:
-            self.title_and_delete_layout.addWidget(self.delete_button)
-        if self.add_process_button:
-            self.title_and_delete_layout.addWidget(self.add_process_button)
         self.widget_layout.addLayout(self.title_and_delete_layout)
         self.widget_layout.addWidget(self.launch_button)
         self.widget_layout.addWidget(self.stop_button)
         self.setLayout(self.widget_layout)
 
-    def safe_delete(self, widgets):
-        for widget in widgets:
-            if widget:
-                widget.deleteLater()
+    def _create_edit_buttons(self):
+        self.delete_button = QPushButton(self)
+        set_button_icon(self.delete_button, 'regular/trash-alt.svg')
+        self.delete_button.clicked.connect(self.parent_widget.delete)
+        self.title_and_delete_layout.addWidget(self.delete_button)
 
-    def create_variable_widgets(self, mode):
-        self.safe_delete([self.delete_button, self.add_process_button])
-
-        if mode == AppMode.LAUNCH:
-            self.delete_button = None
-            self.add_process_button = None
-
-            old_title = self.title
-            self.title = QLabel(self.name)
-            self.title.setAlignment(PyQt5.QtCore.Qt.AlignHCenter)
-            old_title.deleteLater()
-        elif mode == AppMode.EDIT:
-            old_title = self.title
-            self.title = QLineEdit(self.name)
-            old_title.deleteLater()
-
-            self.delete_button = QPushButton(self)
-            self.delete_button.setIcon(QIcon(os.path.join(my_path, './img/fontawesome/regular/trash-alt.svg')))
-            self.delete_button.setIconSize(QSize(24, 24))
-            self.delete_button.clicked.connect(self.parent_widget.delete)
-
-            self.add_process_button = QPushButton(self)
-            self.add_process_button.setIcon(QIcon(os.path.join(my_path, './img/fontawesome/regular/plus-square.svg')))
-            self.add_process_button.setIconSize(QSize(24, 24))
-            self.add_process_button.clicked.connect(
-                self.parent_widget.add_empty_process)
+        self.add_process_button = QPushButton(self)
+        set_button_icon(self.add_process_button, 'regular/plus-square.svg')
+        self.add_process_button.clicked.connect(
+            self.parent_widget.add_empty_process)
+        self.title_and_delete_layout.addWidget(self.add_process_button)
 
     def create_shorcut_buttons(self):
-        self.safe_delete([self.launch_button, self.stop_button])
+        """Creates the launch and stop buttons, or updates their shortcuts
+        when the number of the group changes."""
+        launch_key = 'Alt+{}'.format(self.parent_widget.group_number + 1)
+        stop_key = 'Alt+Shift+{}'.format(self.parent_widget.group_number + 1)
+        if self.launch_button:
+            self.launch_shortcut.setKey(QKeySequence(launch_key))
+            self.stop_shortcut.setKey(QKeySequence(stop_key))
+            return
 
-        # These buttons need to be created again when other groups are deleted,
-        # in order to update the shortcut
         self.launch_button = QPushButton(self)
         self.launch_button.setText("Launch all")
         self.launch_button.clicked.connect(
             self.parent_widget.container.run_all)
 
-        alt_num_action = QShortcut(
-            'Alt+{}'.format(self.parent_widget.group_number + 1), self.launch_button)
-        alt_num_action.activated.connect(self.launch_button.click)
+        self.launch_shortcut = QShortcut(launch_key, self.launch_button)
+        self.launch_shortcut.activated.connect(self.launch_button.click)
 
         self.stop_button = QPushButton(self)
         self.stop_button.setText("Stop this group's processes")
         self.stop_button.clicked.connect(
             self.parent_widget.container.kill_them_all)
 
-        alt_shift_num_action = QShortcut(
-            'Alt+Shift+{}'.format(self.parent_widget.group_number + 1), self.stop_button)
-        alt_shift_num_action.activated.connect(self.stop_button.click)
+        self.stop_shortcut = QShortcut(stop_key, self.stop_button)
+        self.stop_shortcut.activated.connect(self.stop_button.click)
 
     def change_to_launch(self):
-        self.create_variable_widgets(self.app_mode)
-        self._init_layout()
+        self.title.setReadOnly(True)
+        self.title.setFrame(False)
+        self.title.setAlignment(PyQt5.QtCore.Qt.AlignHCenter)
+        # The buttons of the edit mode are kept, hidden
+        for button in (self.delete_button, self.add_process_button):
+            if button:
+                button.hide()
 
     def change_to_edit(self):
-        self.create_variable_widgets(self.app_mode)
-        self._init_layout()
+        self.title.setReadOnly(False)
+        self.title.setFrame(True)
+        self.title.setAlignment(PyQt5.QtCore.Qt.AlignLeft)
+        if self.delete_button is None:
+            self._create_edit_buttons()
+        self.delete_button.show()
+        self.add_process_button.show()
 
     def change_mode(self, mode: AppMode):
         self.app_mode = mode
@@ -220,33 +243,78 @@ class _ProcessContainer(QWidget):
         self.widget_layout = QGridLayout()
         self.setLayout(self.widget_layout)
 
+    @property
+    def launch_pool(self):
+        return self.parent_widget.launch_pool
+
+    @property
+    def log_store(self):
+        return self.parent_widget.parent_widget.log_store
+
+    @property
+    def restart_supervisor(self):
+        return self.parent_widget.parent_widget.restart_supervisor
+
     def adjust_processes_to_layout(self):
         for i, element in enumerate(self.elements):
-            self.widget_layout.addWidget(element, i / self.parent_widget.n_columns,
+            self.widget_layout.addWidget(element, i // self.parent_widget.n_columns,
                                          i % self.parent_widget.n_columns)
 
     def add_element(self, element):
-        self.widget_layout.addWidget(element, len(self.elements) / self.parent_widget.n_columns,
+        self.widget_layout.addWidget(element, len(self.elements) // self.parent_widget.n_columns,
                                      len(self.elements) % self.parent_widget.n_columns)
         self.elements.add(element)
+        self.parent_widget.mark_changed()
 
     def remove_element(self, element):
         self.elements.remove(element)
+        self.parent_widget.mark_changed()
+        self.parent_widget.parent_widget.supervisor.unwatch(element.process)
+        self.parent_widget.parent_widget.resource_sampler.untrack(element.process)
+        self.restart_supervisor.reset(element.process)
         element.deleteLater()
         self.adjust_processes_to_layout()
 
     def run_all(self):
+        """Launches every process, for "Launch all", see launch_all."""
+        try:
+            self.launch_all()
+        except DependencyError as e:
+            QMessageBox.warning(self, "Launch all", str(e))
+
+    def launch_all(self):
+        """Queues a restart of every process in the launch pool.
+
+        Processes with ``depends_on`` wait for their dependencies to be ready.
+        Raises DependencyError, before launching anything, if they can't.
+        """
+        scheduler = DependencyScheduler(self.launch_pool, group=self.parent_widget)
         for process_widget in self.elements:
-            process_widget.relaunch_process()  # REVIEW: or run?
+            scheduler.add(process_widget.process,
+                          depends_on=process_widget.depends_on,
+                          probe=process_widget.ready_probe,
+                          callback=process_widget.on_process_launched)
+        for process_widget in self.elements:
+            self.restart_supervisor.reset(process_widget.process)
+        scheduler.start()
 
     def kill_them_all(self):
-        for process_widget in self.elements:
-            process_widget.process.kill()  # REVIEW: or terminate?
+        """Stops the processes gracefully, without blocking the GUI."""
+        self.launch_pool.stop(widget.process for widget in self.elements)
 
     def restore_processes(self, data: list):
         """Data is normally a list in the JSON format."""
         for d in data:
-            p = ProcessWidget(self, d["args"], directory=d["dir"])
+            p = ProcessWidget(self, d["args"], directory=d["dir"],
+                              name=d.get("name"),
+                              depends_on=d.get("depends_on"),
+                              ready_when=d.get("ready_when"),
+                              backend=d.get("backend"),
+                              restart=d.get("restart"),
+                              stop_timeout=d.get("stop_timeout"),
+                              limits=ProcessLimits.from_dict(d),
+                              environment=ProcessEnvironment.from_dict(d),
+                              zygote=d.get("zygote"))
             self.add_element(p)
 
     def change_mode(self, mode: AppMode):
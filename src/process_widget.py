@@ -1,15 +1,24 @@
 
-import os
+import re
+import logging
 
-from PyQt5.QtCore import QSize, QObjectCleanupHandler
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtWidgets import (
     QWidget, QPushButton, QLabel, QHBoxLayout, QVBoxLayout,
     QTableWidget, QTableWidgetItem, QLineEdit, QAbstractItemView,
-    QMenu)
+    QMenu, QPlainTextEdit)
 
-from .utils import AppMode, browse_existing_directory, parse_dropped_file, my_path
-from .process import CurrentPlatformProcess
+from .utils import AppMode, ProcessStatus, browse_existing_directory, parse_dropped_file
+from .icons import set_button_icon
+from .process import CurrentPlatformProcess, DEFAULT_STOP_TIMEOUT
+from .command import CommandSpec
+from .environment import ProcessEnvironment, merge_environments
+from .async_process import AsyncioProcess
+from .readiness import probe_from_dict
+from .restart_policy import RestartPolicy
+from .profile import TERMINAL_BACKEND, ASYNCIO_BACKEND
+
+logger = logging.getLogger('process_launcher')
 
 DEFAULT_DIRECTORY = "~/"
 
@@ -23,80 +32,137 @@ empty_process_data = {
 }
 
 
+def empty_process_name(names) -> str:
+    """Name of a new empty process, not in ``names``, e.g. "empty process 2"."""
+    name = empty_process_data["name"]
+    names = set(names)
+    i = 2
+    while name in names:
+        name = "{} {}".format(empty_process_data["name"], i)
+        i += 1
+    return name
+
+PROCESS_BACKENDS = {
+    TERMINAL_BACKEND: CurrentPlatformProcess,
+    # Runs the command without a terminal, showing its output in the widget
+    ASYNCIO_BACKEND: AsyncioProcess,
+}
+
+
 class ProcessWidget(QWidget):
     """docstring for ProcessWidget"""
     n_processes = 0
 
+    # Emitted from the thread reading the output of the process
+    output_received = pyqtSignal(str, list)
+
     @classmethod
-    def create_empty_process(cls, window):
+    def create_empty_process(cls, window, name=None):
         d = empty_process_data
-        return cls(window, *d["args"], directory=d["dir"], name=d["name"])
+        return cls(window, *d["args"], directory=d["dir"], name=name or d["name"])
 
-    def __init__(self, window, *args, directory=None, name=None):
+    def __init__(self, window, *args, directory=None, name=None,
+                 depends_on=None, ready_when=None, backend=None, restart=None,
+                 stop_timeout=None, limits=None, environment: ProcessEnvironment = None,
+                 zygote=None):
         super(ProcessWidget, self).__init__(window)
         self.setAcceptDrops(True)
         self.app_mode = window.app_mode
         self.args = list(*args)
         self.parent_widget = window
+        # Only names coming from the profile are saved back to it
+        self.profile_name = name
+        self.depends_on = list(depends_on or [])
+        self.ready_probe = probe_from_dict(ready_when)
+        # Without the one of the group, which isn't saved with the process
+        self.environment = environment
         self._init_args_table(self.args)
 
-        self.directory_widget = QLabel(directory)
-        self.process = CurrentPlatformProcess(self.args_table_widget,
-                                              name=name or "process {}".format(
-                                                  ProcessWidget.n_processes), parent_widget=self)
+        # Read only in the launch mode
+        self.directory_widget = QLineEdit(directory)
+        self.directory_widget.setPlaceholderText("Current workdir")
+        self.backend = backend or TERMINAL_BACKEND
+        if self.backend not in PROCESS_BACKENDS:
+            raise ValueError("Unknown backend: {}".format(self.backend))
+        process_class = PROCESS_BACKENDS[self.backend]
+        self.process = process_class(
+            name=name or "process {}".format(ProcessWidget.n_processes),
+            parent_widget=self,
+            command=CommandSpec(self.args, directory,
+                                merge_environments(environment, self.group.environment)))
+        self.process.restart_policy = RestartPolicy.from_dict(restart)
+        if stop_timeout is not None:
+            self.process.stop_timeout = stop_timeout
+        self.process.limits = limits
+        # False to spawn it even if the group has a zygote
+        self.use_zygote = zygote
+        if zygote is not False:
+            self.process.zygote = self.group.zygote
+
+        self.log_widget = None
+        self.log_search_widget = None
+        if isinstance(self.process, AsyncioProcess):
+            self._init_log_widgets()
 
         self.restart_button = QPushButton(self)
-        self.restart_button.setIcon(QIcon(os.path.join(my_path, './img/fontawesome/redo.svg')))
-        self.restart_button.setIconSize(QSize(24, 24))
+        set_button_icon(self.restart_button, 'redo.svg')
         self.restart_button.clicked.connect(self.relaunch_process)
 
+        # CPU, memory, file descriptors and threads of the process tree
+        self.resources_label = QLabel(self)
+
+        # Only created the first time the edit mode is shown
         self.close_button = None
         self.browse_folder_button = None
-        self.process_id_label = None
+        self.process_id_label = QLabel(self.process_status_text())
 
+        self._init_layout()
         self.change_mode(self.app_mode)
 
-        ProcessWidget.n_processes += 1
-
-    def create_variable_widgets(self, mode):
-
-        if self.directory_widget:
-            directory_name = self.directory_widget.text()
-            self.directory_widget.deleteLater()
-
-        if self.process_id_label:
-            self.process_id_label.deleteLater()
-
-        if self.close_button:
-            self.close_button.deleteLater()
-
-        if self.browse_folder_button:
-            self.browse_folder_button.deleteLater()
-
-        self.process_id_label = QLabel(
-            str(self.process.pid) if self.process.pid else "stopped")
-
-        if mode == AppMode.EDIT:
-            self.directory_widget = QLineEdit(directory_name)
-            self.directory_widget.setPlaceholderText("Current workdir")
-
-            self.close_button = QPushButton(self)
-            self.close_button.setIcon(QIcon(os.path.join(my_path, './img/fontawesome/regular/window-close.svg')))
-            self.close_button.setIconSize(QSize(24, 24))
-            self.close_button.clicked.connect(self.close)
-
-            self.browse_folder_button = QPushButton(self)
-            self.browse_folder_button.setIcon(QIcon(os.path.join(my_path, './img/fontawesome/regular/folder-open.svg')))
-            self.browse_folder_button.setIconSize(QSize(24, 24))
-            self.browse_folder_button.clicked.connect(
-                self.browse_directory_name)
-
-        else:
+        # Edits of the arguments or of the directory replace the command of
+        # the process, and change the group
+        args_model = self.args_table_widget.model()
+        args_model.dataChanged.connect(self.on_command_edited)
+        args_model.rowsInserted.connect(self.on_command_edited)
+        args_model.rowsRemoved.connect(self.on_command_edited)
+        self.directory_widget.textChanged.connect(self.on_command_edited)
 
-            self.directory_widget = QLabel(directory_name)
+        ProcessWidget.n_processes += 1
 
-            self.close_button = None
-            self.browse_folder_button = None
+    def _create_edit_buttons(self):
+        self.browse_folder_button = QPushButton(self)
+        set_button_icon(self.browse_folder_button, 'regular/folder-open.svg')
+        self.browse_folder_button.clicked.connect(
+            self.browse_directory_name)
+        self.hbox1.addWidget(self.browse_folder_button)
+
+        self.close_button = QPushButton(self)
+        set_button_icon(self.close_button, 'regular/window-close.svg')
+        self.close_button.clicked.connect(self.close)
+        self.hbox1.addWidget(self.close_button)
+
+    def _init_log_widgets(self):
+        self.log_widget = QPlainTextEdit(self)
+        self.log_widget.setReadOnly(True)
+        self.log_widget.setMaximumBlockCount(self.process.max_lines)
+
+        self.log_search_widget = QLineEdit(self)
+        self.log_search_widget.setPlaceholderText("Search the output (regex)")
+        self.log_search_widget.returnPressed.connect(self.search_output)
+
+        self.process.log = self.parent_widget.log_store.get(
+            self.group.header.name, self.process.name)
+        self.log_widget.setPlainText("\n".join(
+            self.process.log.tail(self.process.max_lines)))
+        self.output_received.connect(self.append_output)
+        self.process.output_listener = self.output_received.emit
+
+    def process_status_text(self) -> str:
+        if not self.process.pid:
+            return "stopped"
+        elif self.process.status == ProcessStatus.RUNNING:
+            return "PID: {}".format(self.process.pid)
+        return self.process.describe_exit()
 
     def _init_args_table(self, *args):
         self.args_table_widget = QTableWidget()
@@ -104,30 +170,26 @@ class ProcessWidget(QWidget):
         self.args_table_widget.setColumnCount(1)
         for i, arg in enumerate(*args):
             self.args_table_widget.insertRow(i)
-            self.args_table_widget.setItem(0, i, QTableWidgetItem(arg))
+            self.args_table_widget.setItem(i, 0, QTableWidgetItem(arg))
 
     def _init_layout(self):
-        if self.layout():
-            QObjectCleanupHandler().add(self.layout())
-
         self.hbox1 = QHBoxLayout()
         self.hbox1.addWidget(self.directory_widget)
         self.hbox1.addWidget(self.process_id_label)
-        if self.browse_folder_button:
-            self.hbox1.addWidget(self.browse_folder_button)
-
-        if self.close_button:
-            self.hbox1.addWidget(self.close_button)
 
         self.hbox2 = QHBoxLayout()
         self.hbox2.addWidget(self.args_table_widget)
 
         self.hbox3 = QHBoxLayout()
         self.hbox3.addWidget(self.restart_button)
+        self.hbox3.addWidget(self.resources_label)
 
         self.vbox = QVBoxLayout()
         self.vbox.addLayout(self.hbox1)
         self.vbox.addLayout(self.hbox2)
+        if self.log_widget:
+            self.vbox.addWidget(self.log_search_widget)
+            self.vbox.addWidget(self.log_widget)
         self.vbox.addLayout(self.hbox3)
         self.setLayout(self.vbox)
 
@@ -188,54 +250,140 @@ class ProcessWidget(QWidget):
         arg = arg or " "
         pos = self.args_table_widget.rowCount() if pos is None else pos
         self.args_table_widget.insertRow(pos)
-        self.args_table_widget.setItem(0, pos, QTableWidgetItem(arg))
+        self.args_table_widget.setItem(pos, 0, QTableWidgetItem(arg))
 
     def close(self):
         self.parent_widget.remove_element(self)
 
+    @property
+    def group(self):
+        return self.parent_widget.parent_widget
+
+    def mark_changed(self, *args):
+        self.group.mark_changed()
+
+    def on_command_edited(self, *args):
+        """Reads the widgets once per edit, launches only read the command."""
+        self.process.command = self.process.command.replace(
+            args=[self.args_table_widget.item(i, 0).text()
+                  for i in range(self.args_table_widget.rowCount())
+                  if self.args_table_widget.item(i, 0)],
+            directory=self.directory_widget.text())
+        self.mark_changed()
+
     def relaunch_process(self):
-        self.process.restart()
-        print(self.process.pid)
-        print(self.process_id_label)
-        print('Window id: {}'.format(self.process.window_id))
+        """Queues a restart of the process in the launch pool.
+
+        Launching by hand clears the restart history of the process.
+        """
+        self.parent_widget.restart_supervisor.reset(self.process)
+        self._queue_launch()
+
+    def restart_automatically(self):
+        """Queues a restart requested by the restart policy."""
+        self._queue_launch()
+
+    def _queue_launch(self):
+        queued = self.parent_widget.launch_pool.submit(
+            self.process, group=self.group, callback=self.on_process_launched)
+        if queued and self.process_id_label:
+            self.process_id_label.setText("launching...")
+
+    def on_process_launched(self, process, error):
+        if error:
+            logger.warning("Could not launch {}: {}".format(process.name, error))
+        else:
+            logger.debug("{} launched, PID: {}, window ID: {}".format(
+                process.name, self.process.pid, self.process.window_id))
         if self.process_id_label:
-            self.process_id_label.setText("PID: {}".format(self.process.pid))
+            self.process_id_label.setText(
+                "failed" if error else "PID: {}".format(self.process.pid))
 
-    def update_process_references(self):
-        self.process.directory_widget = self.directory_widget
-        self.process.args_table_widget = self.args_table_widget
+    def on_process_exited(self, process):
+        logger.info("{} {}".format(process.name, process.describe_exit()))
+        self.resources_label.clear()
+        if self.process_id_label:
+            self.process_id_label.setText(process.describe_exit())
+
+    def append_output(self, stream: str, lines: list):
+        # Don't mix new output with the results of a search
+        if not self.log_search_widget.text():
+            self.log_widget.appendPlainText("\n".join(lines))
+
+    def search_output(self):
+        """Shows the lines matching the search, or the tail if it's empty."""
+        pattern = self.log_search_widget.text()
+        if not pattern:
+            lines = self.process.log.tail(self.process.max_lines)
+        else:
+            try:
+                lines = [line for _, line in self.process.log.search(pattern)]
+            except re.error as e:
+                lines = ["Invalid regex: {}".format(e)]
+        self.log_widget.setPlainText("\n".join(lines))
 
-    def change_to_launch(self):
+    def update_resources(self, sample):
+        """Shows the last ResourceSample of the process tree."""
+        self.resources_label.setText(sample.describe())
 
+    def on_process_parked(self, process):
+        if self.process_id_label:
+            self.process_id_label.setText(
+                "crash loop ({}), relaunch by hand".format(process.describe_exit()))
+
+    def change_to_launch(self):
         self.args_table_widget.setEditTriggers(
             QAbstractItemView.NoEditTriggers)
-
-        self.create_variable_widgets(self.app_mode)
-
-        self._init_layout()
+        self.directory_widget.setReadOnly(True)
+        self.directory_widget.setFrame(False)
+        # The buttons of the edit mode are kept, hidden
+        for button in (self.close_button, self.browse_folder_button):
+            if button:
+                button.hide()
 
     def change_to_edit(self):
         self.args_table_widget.setEditTriggers(
             QAbstractItemView.DoubleClicked | QAbstractItemView.SelectedClicked)
-
-        self.create_variable_widgets(self.app_mode)
-
-        self._init_layout()
+        self.directory_widget.setReadOnly(False)
+        self.directory_widget.setFrame(True)
+        if self.close_button is None:
+            self._create_edit_buttons()
+        self.close_button.show()
+        self.browse_folder_button.show()
 
     def change_mode(self, mode: AppMode):
+        """Toggles the editability of the widgets, which are kept."""
         self.app_mode = mode
         if mode == AppMode.LAUNCH:
             self.change_to_launch()
         elif mode == AppMode.EDIT:
             self.change_to_edit()
-        self.update_process_references()
 
     def toJSON(self) -> dict:
         ret = {}
+        if self.profile_name:
+            ret["name"] = self.profile_name
         ret["dir"] = self.process.directory
         ret["args"] = []
 
         for arg in self.process.args:
             ret["args"].append(arg)
 
+        if self.backend != TERMINAL_BACKEND:
+            ret["backend"] = self.backend
+        if self.process.restart_policy:
+            ret["restart"] = self.process.restart_policy.toJSON()
+        if self.process.stop_timeout != DEFAULT_STOP_TIMEOUT:
+            ret["stop_timeout"] = self.process.stop_timeout
+        if self.process.limits:
+            ret.update(self.process.limits.toJSON())
+        if self.depends_on:
+            ret["depends_on"] = self.depends_on
+        if self.ready_probe:
+            ret["ready_when"] = self.ready_probe.toJSON()
+        if self.environment:
+            ret.update(self.environment.toJSON())
+        if self.use_zygote is not None:
+            ret["zygote"] = self.use_zygote
+
         return ret
@@ -0,0 +1,92 @@
+"""Helpers to walk the process tree through /proc (Linux only)."""
+import os
+
+PROC = '/proc'
+
+
+def is_available() -> bool:
+    return os.path.isdir(PROC)
+
+
+def read_stat(pid: int) -> list or None:
+    """Fields of /proc/<pid>/stat after the command name, or None if gone.
+
+    The first returned field is the state, the second one the parent PID.
+    """
+    try:
+        with open(os.path.join(PROC, str(pid), 'stat'), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # The command name is between parentheses and may contain anything
+    return data[data.rfind(b')') + 2:].split()
+
+
+def parent_pid(pid: int) -> int or None:
+    fields = read_stat(pid)
+    return int(fields[1]) if fields else None
+
+
+def list_pids() -> list:
+    return [int(name) for name in os.listdir(PROC) if name.isdigit()]
+
+
+def read_stats() -> dict:
+    """Maps each PID to its fields, see read_stat, in a single pass over /proc."""
+    stats = {}
+    for pid in list_pids():
+        fields = read_stat(pid)
+        if fields is not None:
+            stats[pid] = fields
+    return stats
+
+
+def children_map(stats: dict = None) -> dict:
+    """Maps each PID to the list of its children, in a single pass over /proc."""
+    stats = read_stats() if stats is None else stats
+    children = {}
+    for pid, fields in stats.items():
+        children.setdefault(int(fields[1]), []).append(pid)
+    return children
+
+
+def ancestors(pid: int) -> list:
+    """Parents of a process, closest first, without init."""
+    ret = []
+    ppid = parent_pid(pid)
+    while ppid and ppid != 1 and ppid not in ret:
+        ret.append(ppid)
+        ppid = parent_pid(ppid)
+    return ret
+
+
+def read_cmdline(pid: int) -> list or None:
+    """Arguments of a process, or None if gone or if it's a kernel thread."""
+    try:
+        with open(os.path.join(PROC, str(pid), 'cmdline'), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data:
+        return None
+    return [arg.decode('utf-8', 'surrogateescape') for arg in data.split(b'\0')[:-1]]
+
+
+def read_cwd(pid: int) -> str or None:
+    try:
+        return os.readlink(os.path.join(PROC, str(pid), 'cwd'))
+    except OSError:
+        return None
+
+
+def descendants(pid: int, children: dict = None) -> list:
+    """Descendants of a process, closest first."""
+    children = children_map() if children is None else children
+    ret = []
+    pending = list(children.get(pid, []))
+    while pending:
+        child = pending.pop(0)
+        ret.append(child)
+        pending.extend(children.get(child, []))
+    return ret
+
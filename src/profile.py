@@ -0,0 +1,386 @@
+"""Loading and validation of profiles.
+
+A profile is parsed into Profile, Group and ProcessSpec objects, and every
+field is checked before anything is built from it, so that all the errors
+of a profile are reported at once. orjson is used if it is installed.
+
+Variables and matrices, see templating.py, are expanded here too, so a
+Profile only has plain processes.
+
+Parsed profiles are cached under ``~/.process_launcher/cache/profiles``,
+keyed by the path, modification time and size of the file, so opening an
+unchanged profile again skips parsing, expansion and validation.
+"""
+import os
+import json
+import pickle
+import hashlib
+import logging
+from collections import Counter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .utils import get_config_folder, write_atomically
+from .dependencies import resolve_waves, DependencyError
+from .limits import ProcessLimits, LIMIT_KEYS
+from .environment import ProcessEnvironment, ENV_KEYS
+from .zygote import ZygoteSpec
+from .readiness import probe_from_dict
+from .restart_policy import RestartPolicy
+from .templating import check_variables, expand_process, TemplateError
+
+logger = logging.getLogger('process_launcher')
+
+TERMINAL_BACKEND = "terminal"
+ASYNCIO_BACKEND = "asyncio"
+BACKENDS = (TERMINAL_BACKEND, ASYNCIO_BACKEND)
+
+CACHE_VERSION = 4
+"""Changed whenever the classes below change, to ignore older caches."""
+
+
+class ProfileError(ValueError):
+    """A profile is not valid. ``errors`` lists every problem found."""
+
+    def __init__(self, path: str, errors: list):
+        super(ProfileError, self).__init__("Invalid profile {}:\n  {}".format(
+            path or "", "\n  ".join(errors)))
+        self.path = path
+        self.errors = errors
+
+
+def loads(data: bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
+
+
+def dumps(data, indent=True) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(data, indent=2 if indent else None).encode("utf-8")
+
+
+def save_profile(path: str, data: dict):
+    """Saves the JSON of a profile atomically."""
+    write_atomically(path, dumps(data) + b"\n")
+
+
+def get_profile_cache_folder() -> str:
+    return os.path.join(get_config_folder(), 'cache', 'profiles')
+
+
+class _Errors(object):
+    """Collects the errors of a profile, with the path of each field."""
+
+    def __init__(self):
+        super(_Errors, self).__init__()
+        self.errors = []
+
+    def __len__(self) -> int:
+        return len(self.errors)
+
+    def add(self, where: str, message: str):
+        self.errors.append("{}: {}".format(where, message))
+
+    def check_type(self, data: dict, key: str, types, where: str, required=False) -> bool:
+        """True if the key is there and has the right type."""
+        types = types if isinstance(types, tuple) else (types,)
+        value = data.get(key)
+        if value is None:
+            if required:
+                self.add(where, "missing '{}'".format(key))
+            return False
+        # bool is a subclass of int, but true isn't a valid number of seconds
+        if not isinstance(value, types) or isinstance(value, bool) and bool not in types:
+            self.add("{}.{}".format(where, key), "expected {}, got {}".format(
+                " or ".join(t.__name__ for t in types), type(value).__name__))
+            return False
+        return True
+
+
+class ProcessSpec(object):
+    """A process entry of a profile."""
+
+    __slots__ = ('name', 'dir', 'args', 'description', 'backend', 'restart',
+                 'stop_timeout', 'depends_on', 'ready_when', 'zygote', 'limits',
+                 'environment', 'extra')
+
+    KEYS = ('name', 'dir', 'args', 'description', 'backend', 'restart',
+            'stop_timeout', 'depends_on', 'ready_when', 'zygote')
+
+    def __init__(self, args, dir=None, name=None, description=None, backend=None,
+                 restart=None, stop_timeout=None, depends_on=None, ready_when=None,
+                 zygote=None, limits=None, environment=None, extra=None):
+        self.args = list(args)
+        self.dir = dir
+        self.name = name
+        self.description = description
+        self.backend = backend
+        self.restart = restart
+        self.stop_timeout = stop_timeout
+        self.depends_on = list(depends_on or [])
+        self.ready_when = ready_when
+        # False to spawn the process even if its group has a zygote
+        self.zygote = zygote
+        self.limits = dict(limits or {})
+        self.environment = dict(environment or {})
+        # Keys unknown to this version, kept when the profile is saved
+        self.extra = dict(extra or {})
+
+    @classmethod
+    def from_dict(cls, data, where: str, errors: _Errors):
+        if not isinstance(data, dict):
+            errors.add(where, "expected an object")
+            return None
+        n_errors = len(errors)
+        if errors.check_type(data, "args", list, where, required=True):
+            if not data["args"]:
+                errors.add(where + ".args", "empty")
+            elif not all(isinstance(arg, str) for arg in data["args"]):
+                errors.add(where + ".args", "every argument must be a string")
+        for key in ("dir", "name", "description"):
+            errors.check_type(data, key, str, where)
+        if errors.check_type(data, "backend", str, where) and data["backend"] not in BACKENDS:
+            errors.add(where + ".backend", "one of {}".format(", ".join(BACKENDS)))
+        errors.check_type(data, "stop_timeout", (int, float), where)
+        errors.check_type(data, "zygote", bool, where)
+        for key in ("nice", "numa_node"):
+            errors.check_type(data, key, int, where)
+        if errors.check_type(data, "depends_on", list, where):
+            if not all(isinstance(name, str) for name in data["depends_on"]):
+                errors.add(where + ".depends_on", "every name must be a string")
+
+        # The objects built from these fields do their own checks
+        checks = (
+            ("restart", lambda: RestartPolicy.from_dict(data.get("restart"))),
+            ("ready_when", lambda: probe_from_dict(data.get("ready_when"))),
+            ("limits", lambda: ProcessLimits.from_dict(data)),
+        )
+        for key, check in checks:
+            try:
+                check()
+            except (ValueError, TypeError) as e:
+                errors.add("{}.{}".format(where, key), str(e))
+        try:
+            ProcessEnvironment.from_dict(data)
+        except ValueError as e:
+            # The message starts with the key
+            errors.add(where, str(e))
+        if len(errors) > n_errors:
+            return None
+
+        limits = {key: data[key] for key in LIMIT_KEYS if data.get(key) is not None}
+        environment = {key: data[key] for key in ENV_KEYS if data.get(key) is not None}
+        extra = {key: value for key, value in data.items()
+                 if key not in cls.KEYS and key not in LIMIT_KEYS and key not in ENV_KEYS}
+        return cls(**{key: data.get(key) for key in cls.KEYS}, limits=limits,
+                   environment=environment, extra=extra)
+
+    def toJSON(self) -> dict:
+        ret = {}
+        if self.name:
+            ret["name"] = self.name
+        ret["dir"] = self.dir
+        ret["args"] = list(self.args)
+        for key in ('description', 'backend', 'restart', 'stop_timeout', 'ready_when',
+                    'zygote'):
+            if getattr(self, key) is not None:
+                ret[key] = getattr(self, key)
+        if self.depends_on:
+            ret["depends_on"] = list(self.depends_on)
+        ret.update(self.limits)
+        ret.update(self.environment)
+        ret.update(self.extra)
+        return ret
+
+
+class Group(object):
+    """A group of processes of a profile."""
+
+    __slots__ = ('name', 'max_parallel_launches', 'processes', 'environment', 'zygote')
+
+    def __init__(self, name: str, processes: list, max_parallel_launches=None,
+                 environment=None, zygote=None):
+        self.name = name
+        self.processes = processes
+        self.max_parallel_launches = max_parallel_launches
+        # env, env_file and clear_env, applied before the ones of each process
+        self.environment = dict(environment or {})
+        self.zygote = zygote
+
+    @classmethod
+    def from_dict(cls, data, where: str, errors: _Errors, variables=None):
+        """``variables`` are the ones of the profile."""
+        if not isinstance(data, dict):
+            errors.add(where, "expected an object")
+            return None
+        n_errors = len(errors)
+        errors.check_type(data, "name", str, where, required=True)
+        try:
+            variables = dict(variables or {}, **check_variables(
+                data.get("variables"), where + ".variables"))
+        except TemplateError as e:
+            errors.add(where, str(e))
+            variables = dict(variables or {})
+        if errors.check_type(data, "max_parallel_launches", int, where) \
+                and data["max_parallel_launches"] < 1:
+            errors.add(where + ".max_parallel_launches", "must be at least 1")
+        for check in (ProcessEnvironment.from_dict, ZygoteSpec.from_dict):
+            try:
+                check(data)
+            except ValueError as e:
+                errors.add(where, str(e))
+        processes = []
+        if errors.check_type(data, "processes", list, where, required=True):
+            for i, process_data in enumerate(data["processes"]):
+                process_where = "{}.processes[{}]".format(where, i)
+                if not isinstance(process_data, dict):
+                    errors.add(process_where, "expected an object")
+                    continue
+                try:
+                    instances = expand_process(process_data, variables)
+                except TemplateError as e:
+                    errors.add(process_where, str(e))
+                    continue
+                for j, instance in enumerate(instances):
+                    processes.append(ProcessSpec.from_dict(
+                        instance, process_where + ("[{}]".format(j) if "matrix" in process_data
+                                                   else ""), errors))
+        if len(errors) > n_errors:
+            return None
+
+        names = Counter(process.name for process in processes if process.name)
+        duplicates = sorted(name for name, count in names.items() if count > 1)
+        if duplicates:
+            errors.add(where, "duplicated process names: {}".format(", ".join(duplicates)))
+            return None
+        try:
+            resolve_waves({
+                process.name: process.depends_on for process in processes if process.name
+            })
+        except DependencyError as e:
+            errors.add(where, str(e))
+            return None
+        unnamed = [i for i, process in enumerate(processes) if process.depends_on and not process.name]
+        for i in unnamed:
+            errors.add("{}.processes[{}]".format(where, i), "depends_on needs a name")
+        if unnamed:
+            return None
+        return cls(data["name"], processes, data.get("max_parallel_launches"),
+                   {key: data[key] for key in ENV_KEYS if data.get(key) is not None},
+                   data.get("zygote"))
+
+    def toJSON(self) -> dict:
+        ret = {}
+        ret["name"] = self.name
+        if self.max_parallel_launches:
+            ret["max_parallel_launches"] = self.max_parallel_launches
+        ret.update(self.environment)
+        if self.zygote is not None:
+            ret["zygote"] = self.zygote
+        ret["processes"] = [process.toJSON() for process in self.processes]
+        return ret
+
+
+class Profile(object):
+    """A whole profile: groups of processes and global settings."""
+
+    __slots__ = ('groups', 'max_parallel_launches', 'path', 'templated')
+
+    def __init__(self, groups: list, max_parallel_launches=None, path=None, templated=False):
+        self.groups = groups
+        self.max_parallel_launches = max_parallel_launches
+        self.path = path
+        # Saving it writes the expanded processes, not the variables and matrices
+        self.templated = templated
+
+    @classmethod
+    def from_dict(cls, data, path=None):
+        """Raises ProfileError with every problem of the profile."""
+        errors = _Errors()
+        if not isinstance(data, dict):
+            raise ProfileError(path, ["expected an object with a list of groups"])
+        if errors.check_type(data, "max_parallel_launches", int, "profile") \
+                and data["max_parallel_launches"] < 1:
+            errors.add("profile.max_parallel_launches", "must be at least 1")
+        try:
+            variables = check_variables(data.get("variables"))
+        except TemplateError as e:
+            errors.add("profile", str(e))
+            variables = {}
+        groups = []
+        if errors.check_type(data, "groups", list, "profile", required=True):
+            groups = [Group.from_dict(group_data, "groups[{}]".format(i), errors, variables)
+                      for i, group_data in enumerate(data["groups"])]
+        if errors:
+            raise ProfileError(path, errors.errors)
+        templated = "variables" in data or any(
+            "variables" in group_data or any(
+                isinstance(process_data, dict) and "matrix" in process_data
+                for process_data in group_data["processes"])
+            for group_data in data["groups"])
+        return cls(groups, data.get("max_parallel_launches"), path, templated)
+
+    def toJSON(self) -> dict:
+        ret = {}
+        if self.max_parallel_launches:
+            ret["max_parallel_launches"] = self.max_parallel_launches
+        ret["groups"] = [group.toJSON() for group in self.groups]
+        return ret
+
+    @property
+    def n_processes(self) -> int:
+        return sum(len(group.processes) for group in self.groups)
+
+
+def _cache_path(path: str) -> str:
+    name = hashlib.sha1(path.encode("utf-8")).hexdigest()
+    return os.path.join(get_profile_cache_folder(), name + '.pickle')
+
+
+def _read_cache(path: str, key: tuple):
+    try:
+        with open(_cache_path(path), 'rb') as f:
+            cached_key, profile = pickle.load(f)
+    except Exception:
+        # Only an optimisation, e.g. it was pickled under another package
+        # name by another entry point: read the profile instead
+        logger.debug("Could not read the cache of the profile {}".format(path), exc_info=True)
+        return None
+    return profile if cached_key == key else None
+
+
+def _write_cache(path: str, key: tuple, profile: Profile):
+    cache_path = _cache_path(path)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        write_atomically(cache_path, pickle.dumps((key, profile), protocol=pickle.HIGHEST_PROTOCOL))
+    except (OSError, pickle.PickleError) as e:
+        logger.warning("Could not cache the profile {}: {}".format(path, e))
+
+
+def load_profile(path: str, use_cache=True) -> Profile:
+    """Reads and validates a profile.
+
+    Raises OSError if it can't be read, ValueError if it isn't JSON and
+    ProfileError if it isn't a valid profile.
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        key = (CACHE_VERSION, path, stat.st_mtime_ns, stat.st_size)
+        if use_cache:
+            profile = _read_cache(path, key)
+            if profile is not None:
+                logger.debug("Profile {} read from the cache".format(path))
+                return profile
+        data = f.read()
+
+    profile = Profile.from_dict(loads(data), path)
+    if use_cache:
+        _write_cache(path, key, profile)
+    return profile
@@ -0,0 +1,505 @@
+"""Model/view of a profile, for profiles too large for a widget per process.
+
+The groups and processes are kept as plain data in a ProfileModel and shown
+by a QTreeView, which only paints the visible rows. Editors only exist while
+a cell is being edited, and the PopenProcess of an entry is only created
+when it is launched for the first time.
+"""
+import shlex
+
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import (QWidget, QTreeView, QVBoxLayout, QMenu,
+                             QStyledItemDelegate, QAbstractItemView, QMessageBox)
+
+from .utils import AppMode
+from .process_widget import (PROCESS_BACKENDS, TERMINAL_BACKEND, empty_process_data,
+                             empty_process_name)
+from .async_process import AsyncioProcess
+from .readiness import probe_from_dict
+from .restart_policy import RestartPolicy
+from .limits import ProcessLimits
+from .environment import ProcessEnvironment, merge_environments
+from .command import CommandSpec
+from .zygote import ZygoteSpec, get_zygote
+from .launcher import DependencyScheduler
+from .dependencies import DependencyError
+
+NAME_COLUMN = 0
+DIRECTORY_COLUMN = 1
+COMMAND_COLUMN = 2
+STATUS_COLUMN = 3
+COLUMNS = ("Name", "Directory", "Command", "Status")
+
+STATUS_COLORS = {
+    "running": QColor(46, 160, 67),
+    "failed": QColor(207, 34, 46),
+}
+
+
+class ProcessEntry(object):
+    """A process of a profile, as plain data."""
+
+    def __init__(self, group, data: dict, index: int):
+        super(ProcessEntry, self).__init__()
+        self.group = group
+        self.data = dict(data)
+        self.default_name = "process {}".format(index)
+        self.depends_on = list(data.get("depends_on") or [])
+        self.ready_probe = probe_from_dict(data.get("ready_when"))
+        self.restart_policy = RestartPolicy.from_dict(data.get("restart"))
+        self.limits = ProcessLimits.from_dict(data)
+        self.environment = ProcessEnvironment.from_dict(data)
+        self.backend = data.get("backend") or TERMINAL_BACKEND
+        if self.backend not in PROCESS_BACKENDS:
+            raise ValueError("Unknown backend: {}".format(self.backend))
+        self.process = None
+        self.status = "stopped"
+        self.state = None
+        self.resources = ""
+
+    @property
+    def name(self) -> str:
+        return self.data.get("name") or self.default_name
+
+    @property
+    def args(self) -> list:
+        return list(self.data.get("args") or [])
+
+    @property
+    def directory(self) -> str:
+        return self.data.get("dir")
+
+    def get_process(self, log_store=None):
+        """The process of the entry, created on its first launch."""
+        if self.process is None:
+            self.process = PROCESS_BACKENDS[self.backend](
+                name=self.name, command=CommandSpec(
+                    self.args, self.directory,
+                    merge_environments(self.environment, self.group.environment)))
+            self.process.restart_policy = self.restart_policy
+            self.process.limits = self.limits
+            if self.data.get("zygote") is not False:
+                self.process.zygote = self.group.zygote
+            if self.data.get("stop_timeout") is not None:
+                self.process.stop_timeout = self.data["stop_timeout"]
+            if isinstance(self.process, AsyncioProcess) and log_store is not None:
+                self.process.log = log_store.get(self.group.name, self.name)
+        else:
+            self.process.name = self.name
+            self.process.command = self.process.command.replace(
+                args=self.args, directory=self.directory)
+        return self.process
+
+    def toJSON(self) -> dict:
+        return dict(self.data)
+
+
+class GroupEntry(object):
+    """A group of a profile, as plain data. Also the key of the group in the
+    LaunchPool."""
+
+    def __init__(self, data: dict):
+        super(GroupEntry, self).__init__()
+        self.name = data["name"]
+        self.max_parallel_launches = data.get("max_parallel_launches")
+        self.environment = ProcessEnvironment.from_dict(data)
+        self.zygote_spec = ZygoteSpec.from_dict(data)
+        self.zygote = get_zygote(self.zygote_spec)
+        self.entries = [ProcessEntry(self, d, i) for i, d in enumerate(data["processes"])]
+
+    def toJSON(self) -> dict:
+        ret = {}
+        ret["name"] = self.name
+        if self.max_parallel_launches:
+            ret["max_parallel_launches"] = self.max_parallel_launches
+        if self.environment:
+            ret.update(self.environment.toJSON())
+        if self.zygote_spec:
+            ret["zygote"] = self.zygote_spec.toJSON()
+        ret["processes"] = [entry.toJSON() for entry in self.entries]
+        return ret
+
+
+class ProfileModel(QAbstractItemModel):
+    """Groups as top level rows, with their processes as children.
+
+    The internal pointer of an index is its GroupEntry or ProcessEntry.
+    """
+
+    # A GroupEntry that was edited, or None if groups were deleted
+    edited = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super(ProfileModel, self).__init__(parent)
+        self.groups = []
+        self.editable = False
+
+    def load(self, groups_data: list):
+        self.beginResetModel()
+        self.groups = [GroupEntry(data) for data in groups_data]
+        self.endResetModel()
+
+    def clear(self):
+        self.load([])
+
+    def toJSON(self) -> list:
+        return [group.toJSON() for group in self.groups]
+
+    def entries(self) -> list:
+        return [entry for group in self.groups for entry in group.entries]
+
+    def set_editable(self, editable: bool):
+        self.editable = editable
+
+    # Structure
+
+    def index(self, row: int, column: int, parent=QModelIndex()) -> QModelIndex:
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, self.groups[row])
+        return self.createIndex(row, column, parent.internalPointer().entries[row])
+
+    def parent(self, index: QModelIndex) -> QModelIndex:
+        if not index.isValid():
+            return QModelIndex()
+        item = index.internalPointer()
+        if isinstance(item, GroupEntry):
+            return QModelIndex()
+        return self.createIndex(self.groups.index(item.group), 0, item.group)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if not parent.isValid():
+            return len(self.groups)
+        item = parent.internalPointer()
+        if isinstance(item, GroupEntry) and parent.column() == 0:
+            return len(item.entries)
+        return 0
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return len(COLUMNS)
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def index_of(self, entry, column=NAME_COLUMN) -> QModelIndex:
+        group = entry.group
+        return self.createIndex(group.entries.index(entry), column, entry)
+
+    # Data
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = index.internalPointer()
+        column = index.column()
+        if isinstance(item, GroupEntry):
+            if role in (Qt.DisplayRole, Qt.EditRole) and column == NAME_COLUMN:
+                return item.name
+            return None
+
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            if column == NAME_COLUMN:
+                return item.name
+            elif column == DIRECTORY_COLUMN:
+                return item.directory
+            elif column == COMMAND_COLUMN:
+                return " ".join(shlex.quote(arg) for arg in item.args)
+            elif column == STATUS_COLUMN and role == Qt.DisplayRole:
+                if item.resources:
+                    return "{} | {}".format(item.status, item.resources)
+                return item.status
+        elif role == Qt.ForegroundRole and column == STATUS_COLUMN:
+            return STATUS_COLORS.get(item.state)
+        elif role == Qt.ToolTipRole and column == COMMAND_COLUMN:
+            return "\n".join(item.args)
+        return None
+
+    def flags(self, index: QModelIndex):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        item = index.internalPointer()
+        editable_columns = (NAME_COLUMN,) if isinstance(item, GroupEntry) else (
+            NAME_COLUMN, DIRECTORY_COLUMN, COMMAND_COLUMN)
+        if self.editable and index.column() in editable_columns:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index: QModelIndex, value, role=Qt.EditRole) -> bool:
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        item = index.internalPointer()
+        column = index.column()
+        if isinstance(item, GroupEntry):
+            item.name = value
+        elif column == NAME_COLUMN:
+            item.data["name"] = value
+        elif column == DIRECTORY_COLUMN:
+            item.data["dir"] = value
+        elif column == COMMAND_COLUMN:
+            try:
+                item.data["args"] = shlex.split(value)
+            except ValueError:
+                return False
+        else:
+            return False
+        self.dataChanged.emit(index, index)
+        self.edited.emit(item if isinstance(item, GroupEntry) else item.group)
+        return True
+
+    # Editing
+
+    def add_group(self, name="") -> GroupEntry:
+        group = GroupEntry({"name": name, "processes": []})
+        self.beginInsertRows(QModelIndex(), len(self.groups), len(self.groups))
+        self.groups.append(group)
+        self.endInsertRows()
+        self.edited.emit(group)
+        return group
+
+    def remove_group(self, group: GroupEntry):
+        row = self.groups.index(group)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.groups.pop(row)
+        self.endRemoveRows()
+        self.edited.emit(None)
+
+    def add_process(self, group: GroupEntry, data=None) -> ProcessEntry:
+        parent = self.createIndex(self.groups.index(group), 0, group)
+        row = len(group.entries)
+        self.beginInsertRows(parent, row, row)
+        if data is None:
+            data = dict(empty_process_data, name=empty_process_name(
+                entry.name for entry in group.entries))
+        entry = ProcessEntry(group, data, row)
+        group.entries.append(entry)
+        self.endInsertRows()
+        self.edited.emit(group)
+        return entry
+
+    def remove_process(self, entry: ProcessEntry):
+        group = entry.group
+        parent = self.createIndex(self.groups.index(group), 0, group)
+        row = group.entries.index(entry)
+        self.beginRemoveRows(parent, row, row)
+        group.entries.pop(row)
+        self.endRemoveRows()
+        self.edited.emit(group)
+
+    # Status
+
+    def set_status(self, entry: ProcessEntry, status: str, state=None):
+        entry.status = status
+        entry.state = state
+        if state != "running":
+            entry.resources = ""
+        index = self.index_of(entry, STATUS_COLUMN)
+        self.dataChanged.emit(index, index)
+
+    def update_resources(self, samples: dict):
+        """Shows a tick of the ResourceSampler, with one update per group."""
+        changed = set()
+        for entry in self.entries():
+            if entry.process is not None and entry.process in samples:
+                entry.resources = samples[entry.process].describe()
+                changed.add(entry.group)
+        for group in changed:
+            parent = self.createIndex(self.groups.index(group), 0, group)
+            self.dataChanged.emit(
+                self.index(0, STATUS_COLUMN, parent),
+                self.index(len(group.entries) - 1, STATUS_COLUMN, parent))
+
+
+class StatusDelegate(QStyledItemDelegate):
+    """Paints the status column, elided instead of wrapped."""
+
+    def initStyleOption(self, option, index):
+        super(StatusDelegate, self).initStyleOption(option, index)
+        option.textElideMode = Qt.ElideRight
+        option.features &= ~option.WrapText
+
+
+class ProfileView(QWidget):
+    """Shows a whole profile in a single tree, one row per process.
+
+    Used instead of a ProcessGroup per group when a profile has too many
+    processes for a widget each. The processes are launched, stopped and
+    restarted through the same LaunchPool and supervisors.
+    """
+
+    def __init__(self, window):
+        super(ProfileView, self).__init__(window)
+        self.parent_widget = window
+        self.model = ProfileModel(self)
+        self._entries = {}
+
+        self.tree = QTreeView(self)
+        # Lets the view skip measuring every row
+        self.tree.setUniformRowHeights(True)
+        self.tree.setModel(self.model)
+        self.tree.setItemDelegateForColumn(STATUS_COLUMN, StatusDelegate(self.tree))
+        self.tree.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.tree.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed)
+        self.tree.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.tree.customContextMenuRequested.connect(self.show_context_menu)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.tree)
+        self.setLayout(layout)
+
+    @property
+    def launch_pool(self):
+        return self.parent_widget.launch_pool
+
+    @property
+    def restart_supervisor(self):
+        return self.parent_widget.restart_supervisor
+
+    def load(self, groups_data: list):
+        self.forget_all()
+        self.model.load(groups_data)
+        for group in self.model.groups:
+            self.launch_pool.set_group_limit(group, group.max_parallel_launches)
+        self.tree.expandAll()
+
+    def forget_all(self):
+        for group in self.model.groups:
+            self._forget_group(group)
+        self.model.clear()
+
+    def _forget_group(self, group: GroupEntry):
+        self.launch_pool.forget_group(group)
+        for entry in group.entries:
+            self._forget_entry(entry)
+
+    def _forget_entry(self, entry: ProcessEntry):
+        if entry.process is not None:
+            self.parent_widget.supervisor.unwatch(entry.process)
+            self.parent_widget.resource_sampler.untrack(entry.process)
+            self.restart_supervisor.reset(entry.process)
+            self._entries.pop(entry.process, None)
+
+    def toJSON(self) -> list:
+        return self.model.toJSON()
+
+    @property
+    def processes(self) -> list:
+        return [entry.process for entry in self.model.entries() if entry.process is not None]
+
+    def change_mode(self, mode: AppMode):
+        self.model.set_editable(mode == AppMode.EDIT)
+
+    def _process(self, entry: ProcessEntry):
+        process = entry.get_process(self.parent_widget.log_store)
+        self._entries[process] = entry
+        return process
+
+    # Actions
+
+    def selected_entries(self) -> list:
+        """Selected processes, and all the processes of the selected groups."""
+        entries = []
+        for index in self.tree.selectionModel().selectedRows():
+            item = index.internalPointer()
+            if isinstance(item, GroupEntry):
+                entries.extend(e for e in item.entries if e not in entries)
+            elif item not in entries:
+                entries.append(item)
+        return entries
+
+    def show_context_menu(self, position):
+        index = self.tree.indexAt(position)
+        item = index.internalPointer() if index.isValid() else None
+        menu = QMenu(self)
+        if self.model.editable:
+            menu.addAction("Add group", self.model.add_group)
+            if item is not None:
+                group = item if isinstance(item, GroupEntry) else item.group
+                menu.addAction("Add process", lambda: self.model.add_process(group))
+                menu.addAction("Delete group", lambda: self.delete_group(group))
+            if isinstance(item, ProcessEntry):
+                menu.addAction("Delete process", lambda: self.delete_process(item))
+        else:
+            menu.addAction("Launch selected", lambda: self.launch(self.selected_entries()))
+            menu.addAction("Stop selected", lambda: self.stop(self.selected_entries()))
+            if item is not None:
+                group = item if isinstance(item, GroupEntry) else item.group
+                menu.addAction("Launch group", lambda: self.run_group(group))
+                menu.addAction("Stop group", lambda: self.stop(group.entries))
+        menu.exec_(self.tree.viewport().mapToGlobal(position))
+
+    def delete_group(self, group: GroupEntry):
+        self._forget_group(group)
+        self.model.remove_group(group)
+
+    def delete_process(self, entry: ProcessEntry):
+        self._forget_entry(entry)
+        self.model.remove_process(entry)
+
+    def launch(self, entries: list):
+        for entry in entries:
+            process = self._process(entry)
+            self.restart_supervisor.reset(process)
+            self._queue_launch(entry, process)
+
+    def _queue_launch(self, entry: ProcessEntry, process):
+        if self.launch_pool.submit(process, group=entry.group, callback=self.on_process_launched):
+            self.model.set_status(entry, "launching...")
+
+    def run_group(self, group: GroupEntry):
+        """Launches a whole group, like "Launch all" of a ProcessGroup."""
+        try:
+            self.launch_group(group)
+        except DependencyError as e:
+            QMessageBox.warning(self, "Launch group", str(e))
+
+    def launch_group(self, group: GroupEntry):
+        """Raises DependencyError, before launching anything, if the
+        ``depends_on`` of the group can't be satisfied."""
+        scheduler = DependencyScheduler(self.launch_pool, group=group)
+        processes = []
+        for entry in group.entries:
+            process = self._process(entry)
+            processes.append(process)
+            scheduler.add(process, depends_on=entry.depends_on,
+                          probe=entry.ready_probe, callback=self.on_process_launched)
+        for process in processes:
+            self.restart_supervisor.reset(process)
+        scheduler.start()
+
+    def stop(self, entries: list):
+        self.launch_pool.stop(entry.process for entry in entries if entry.process is not None)
+
+    # Events of the launch pool and of the supervisors
+
+    def on_process_launched(self, process, error):
+        entry = self._entries.get(process)
+        if entry is None:
+            return
+        if error:
+            self.model.set_status(entry, "failed: {}".format(error), "failed")
+        else:
+            self.model.set_status(entry, "PID: {}".format(process.pid), "running")
+
+    def on_process_exited(self, process):
+        entry = self._entries.get(process)
+        if entry is not None:
+            failed = process.return_code != 0 and not process.stop_requested
+            self.model.set_status(entry, process.describe_exit(), "failed" if failed else None)
+
+    def on_restart_requested(self, process):
+        entry = self._entries.get(process)
+        if entry is not None:
+            self._queue_launch(entry, process)
+
+    def on_process_parked(self, process):
+        entry = self._entries.get(process)
+        if entry is not None:
+            self.model.set_status(
+                entry, "crash loop ({}), relaunch by hand".format(process.describe_exit()),
+                "failed")
@@ -0,0 +1,234 @@
+import os
+import re
+import socket
+import time
+
+DEFAULT_READY_TIMEOUT = 60.0
+"""Seconds to wait for a process to be ready before giving up."""
+
+DEFAULT_PROBE_INTERVAL = 0.1
+
+
+class ReadinessError(Exception):
+    """A process didn't become ready."""
+
+
+class ReadinessProbe(object):
+    """Checks whether a launched process is ready to be used by others.
+
+    Probes are built from the ``ready_when`` field of a process entry, e.g.
+    ``{"port": 5432}`` or ``{"log": "server.log", "pattern": "started"}``,
+    and are waited for on worker threads, never on the GUI thread.
+    """
+
+    key = None
+
+    def __init__(self, timeout=None, interval=None):
+        super(ReadinessProbe, self).__init__()
+        self.timeout = DEFAULT_READY_TIMEOUT if timeout is None else timeout
+        self.interval = DEFAULT_PROBE_INTERVAL if interval is None else interval
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        raise NotImplementedError("Method not implemented")
+
+    def check(self, process, directory: str) -> bool:
+        raise NotImplementedError("Method not implemented")
+
+    def toJSON(self) -> dict:
+        ret = {}
+        if self.timeout != DEFAULT_READY_TIMEOUT:
+            ret["timeout"] = self.timeout
+        return ret
+
+    def describe(self) -> str:
+        return self.key
+
+    def wait(self, process, directory: str = None):
+        """Blocks until the process is ready.
+
+        Raises ReadinessError on timeout or if the process exits before
+        being ready, unless it only started a terminal running the command,
+        see PopenProcess.runs_command.
+        """
+        check = self._checker(process, directory)
+        exit_fails = getattr(process, "runs_command", True)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if check():
+                return
+            return_code = process.poll()
+            if return_code is not None and exit_fails:
+                # It may have become ready right before exiting, e.g. the
+                # exit of ExitProbe
+                if check():
+                    return
+                raise ReadinessError("{} exited with code {} before {}".format(
+                    process.name, return_code, self.describe()))
+            if time.monotonic() >= deadline:
+                raise ReadinessError("{} timed out after {}s waiting for {}".format(
+                    process.name, self.timeout, self.describe()))
+            time.sleep(self.interval)
+
+    def _checker(self, process, directory: str):
+        """The check of a single wait, which may keep state between calls."""
+        return lambda: self.check(process, directory)
+
+    @staticmethod
+    def _resolve_path(path: str, directory: str) -> str:
+        path = os.path.expanduser(path)
+        if directory and not os.path.isabs(path):
+            path = os.path.join(os.path.expanduser(directory), path)
+        return path
+
+
+class PortProbe(ReadinessProbe):
+    """Ready when a TCP port accepts connections."""
+
+    key = "port"
+
+    def __init__(self, port: int, host="localhost", **kwargs):
+        super(PortProbe, self).__init__(**kwargs)
+        self.port = int(port)
+        self.host = host
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["port"], host=data.get("host", "localhost"),
+                   timeout=data.get("timeout"))
+
+    def check(self, process, directory: str) -> bool:
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.interval):
+                return True
+        except OSError:
+            return False
+
+    def describe(self) -> str:
+        return "port {}:{}".format(self.host, self.port)
+
+    def toJSON(self) -> dict:
+        ret = {"port": self.port}
+        if self.host != "localhost":
+            ret["host"] = self.host
+        ret.update(super(PortProbe, self).toJSON())
+        return ret
+
+
+class LogProbe(ReadinessProbe):
+    """Ready when a line of a log file matches a regular expression."""
+
+    key = "log"
+
+    def __init__(self, path: str, pattern: str, **kwargs):
+        super(LogProbe, self).__init__(**kwargs)
+        self.path = path
+        self.pattern = pattern
+        self._regex = re.compile(pattern.encode("utf-8"), re.MULTILINE)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["log"], data["pattern"], timeout=data.get("timeout"))
+
+    def check(self, process, directory: str) -> bool:
+        return self._checker(process, directory)()
+
+    def _checker(self, process, directory: str):
+        # Local to each wait, as waits of the same probe can run at the same
+        # time, e.g. for the instances of a matrix
+        offset = 0
+        tail = b""
+        path = self._resolve_path(self.path, directory)
+
+        def check() -> bool:
+            nonlocal offset, tail
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+            except OSError:
+                return False
+            # Only read what was appended since the last check, keeping the
+            # incomplete last line around in case it is still being written
+            offset += len(data)
+            lines, _, tail = (tail + data).rpartition(b"\n")
+            return bool(self._regex.search(lines) or self._regex.search(tail))
+
+        return check
+
+    def describe(self) -> str:
+        return "/{}/ in {}".format(self.pattern, self.path)
+
+    def toJSON(self) -> dict:
+        ret = {"log": self.path, "pattern": self.pattern}
+        ret.update(super(LogProbe, self).toJSON())
+        return ret
+
+
+class FileProbe(ReadinessProbe):
+    """Ready when a file exists."""
+
+    key = "file"
+
+    def __init__(self, path: str, **kwargs):
+        super(FileProbe, self).__init__(**kwargs)
+        self.path = path
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["file"], timeout=data.get("timeout"))
+
+    def check(self, process, directory: str) -> bool:
+        return os.path.exists(self._resolve_path(self.path, directory))
+
+    def describe(self) -> str:
+        return "file {}".format(self.path)
+
+    def toJSON(self) -> dict:
+        ret = {"file": self.path}
+        ret.update(super(FileProbe, self).toJSON())
+        return ret
+
+
+class ExitProbe(ReadinessProbe):
+    """Ready when the process exits with the expected code, e.g. migrations."""
+
+    key = "exit_code"
+
+    def __init__(self, exit_code=0, **kwargs):
+        super(ExitProbe, self).__init__(**kwargs)
+        self.exit_code = int(exit_code)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["exit_code"], timeout=data.get("timeout"))
+
+    def check(self, process, directory: str) -> bool:
+        return_code = process.poll()
+        if return_code is None:
+            return False
+        if return_code != self.exit_code:
+            raise ReadinessError("{} exited with code {}, expected {}".format(
+                process.name, return_code, self.exit_code))
+        return True
+
+    def describe(self) -> str:
+        return "exit code {}".format(self.exit_code)
+
+    def toJSON(self) -> dict:
+        ret = {"exit_code": self.exit_code}
+        ret.update(super(ExitProbe, self).toJSON())
+        return ret
+
+
+PROBES = (PortProbe, LogProbe, FileProbe, ExitProbe)
+
+
+def probe_from_dict(data: dict or None) -> ReadinessProbe or None:
+    """Builds the probe of a ``ready_when`` field."""
+    if not data:
+        return None
+    for cls in PROBES:
+        if cls.key in data:
+            return cls.from_dict(data)
+    raise ValueError("Unknown ready_when condition: {}".format(data))
@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from . import proctree
+
+logger = logging.getLogger('process_launcher')
+
+DEFAULT_MONITOR_INTERVAL = 2.0
+"""Seconds between two samples of the resources used by the processes."""
+
+TREE_REFRESH_TICKS = 5
+"""The whole /proc is only scanned for new descendants every few ticks."""
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Fields of /proc/<pid>/stat after the command name, see proctree.read_stat
+_UTIME = 11
+_STIME = 12
+_NUM_THREADS = 17
+
+
+class ResourceSample(object):
+    """Resources used by a process and all its descendants."""
+
+    __slots__ = ('cpu_percent', 'rss', 'n_fds', 'n_threads', 'n_processes')
+
+    def __init__(self):
+        self.cpu_percent = 0.0
+        self.rss = 0
+        self.n_fds = 0
+        self.n_threads = 0
+        self.n_processes = 0
+
+    def describe(self) -> str:
+        return "CPU {:.1f}% | {:.1f} MB | {} fds | {} threads".format(
+            self.cpu_percent, self.rss / (1024 * 1024), self.n_fds, self.n_threads)
+
+
+class _ProcFiles(object):
+    """Open handles to the /proc files of a PID, re-read with pread."""
+
+    def __init__(self, pid: int):
+        super(_ProcFiles, self).__init__()
+        self.pid = pid
+        path = os.path.join(proctree.PROC, str(pid))
+        self.fd_path = os.path.join(path, 'fd')
+        self.stat = os.open(os.path.join(path, 'stat'), os.O_RDONLY)
+        try:
+            self.statm = os.open(os.path.join(path, 'statm'), os.O_RDONLY)
+        except OSError:
+            os.close(self.stat)
+            raise
+        self.cpu_ticks = None
+
+    def read(self, sample: ResourceSample, elapsed: float):
+        """Adds the usage of this PID to a sample. Raises OSError once gone."""
+        stat = os.pread(self.stat, 4096, 0)
+        fields = stat[stat.rfind(b')') + 2:].split()
+        cpu_ticks = int(fields[_UTIME]) + int(fields[_STIME])
+        if self.cpu_ticks is not None and elapsed > 0:
+            sample.cpu_percent += 100.0 * (cpu_ticks - self.cpu_ticks) / _CLOCK_TICKS / elapsed
+        self.cpu_ticks = cpu_ticks
+        sample.n_threads += int(fields[_NUM_THREADS])
+
+        sample.rss += int(os.pread(self.statm, 256, 0).split()[1]) * _PAGE_SIZE
+        try:
+            sample.n_fds += len(os.listdir(self.fd_path))
+        except PermissionError:
+            pass
+        sample.n_processes += 1
+
+    def close(self):
+        os.close(self.stat)
+        os.close(self.statm)
+
+
+class ResourceSampler(QObject):
+    """Samples CPU, memory, file descriptors and threads of the processes.
+
+    Every ``interval`` seconds, a background thread reads /proc for every
+    tracked process tree in one pass, reusing open file handles, and emits a
+    single ``sampled`` signal with a dict of process to ResourceSample.
+    """
+
+    sampled = pyqtSignal(dict)
+
+    def __init__(self, interval=DEFAULT_MONITOR_INTERVAL, parent=None):
+        super(ResourceSampler, self).__init__(parent)
+        self.interval = interval
+        self._processes = set()
+        self._lock = threading.Lock()
+        # Event of the running thread, None once it's told to stop
+        self._wakeup = None
+        self._thread = None
+        self._files = {}
+        self._trees = {}
+        self._ticks = 0
+        self._last_time = None
+
+    def track(self, process):
+        with self._lock:
+            self._processes.add(process)
+
+    def untrack(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def set_interval(self, interval: float):
+        """Changes the interval, a falsy one stops sampling."""
+        self.interval = interval
+        if not interval:
+            self.stop()
+        elif self._wakeup is not None:
+            self._wakeup.set()
+        else:
+            self.start()
+
+    def start(self):
+        if self._wakeup is not None or not self.interval or not proctree.is_available():
+            return
+        if self._thread is not None:
+            # Stopped but maybe still sampling, it owns the open files until
+            # it exits, which it does as soon as it wakes up
+            self._thread.join()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._wakeup,),
+                                        name='process_launcher_monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        wakeup, self._wakeup = self._wakeup, None
+        if wakeup is not None:
+            wakeup.set()
+
+    def _run(self, wakeup: threading.Event):
+        while self._wakeup is wakeup:
+            try:
+                samples = self.sample()
+            except Exception:
+                logger.exception("Could not sample the processes")
+                samples = {}
+            if samples:
+                self.sampled.emit(samples)
+            wakeup.wait(self.interval)
+            wakeup.clear()
+        for files in self._files.values():
+            files.close()
+        self._files.clear()
+
+    def _tree_pids(self, processes: list) -> dict:
+        """PIDs of each process tree, rescanning /proc every few ticks only."""
+        refresh = self._ticks % TREE_REFRESH_TICKS == 0
+        children = proctree.children_map() if refresh else None
+        trees = {}
+        for process in processes:
+            pid = process.pid
+            if pid is None or process.return_code is not None:
+                continue
+            previous = self._trees.get(process)
+            if refresh or previous is None or previous[0] != pid:
+                if children is None:
+                    children = proctree.children_map()
+                trees[process] = [pid] + proctree.descendants(pid, children)
+            else:
+                trees[process] = previous
+        self._trees = trees
+        return trees
+
+    def sample(self) -> dict:
+        """Reads /proc once for every tracked process tree."""
+        with self._lock:
+            processes = list(self._processes)
+        now = time.monotonic()
+        elapsed = now - self._last_time if self._last_time is not None else 0
+        self._last_time = now
+
+        samples = {}
+        alive = set()
+        for process, pids in self._tree_pids(processes).items():
+            sample = ResourceSample()
+            for pid in pids:
+                files = self._files.get(pid)
+                try:
+                    if files is None:
+                        files = self._files[pid] = _ProcFiles(pid)
+                    files.read(sample, elapsed)
+                except (OSError, ValueError, IndexError):
+                    continue
+                alive.add(pid)
+            samples[process] = sample
+
+        for pid in list(self._files):
+            if pid not in alive:
+                self._files.pop(pid).close()
+        self._ticks += 1
+        return samples
@@ -0,0 +1,59 @@
+import random
+
+NEVER = "never"
+ON_FAILURE = "on-failure"
+ALWAYS = "always"
+
+POLICIES = (NEVER, ON_FAILURE, ALWAYS)
+
+
+class RestartPolicy(object):
+    """When and how fast a process is restarted after it exits.
+
+    Built from the ``restart`` field of a process entry, e.g.
+    ``{"policy": "on-failure", "max_restarts": 5, "window": 60}``. A process
+    restarted ``max_restarts`` times within ``window`` seconds is considered
+    to be crash looping and is not restarted again.
+    """
+
+    def __init__(self, policy=NEVER, max_restarts=5, window=60.0,
+                 backoff=1.0, max_backoff=60.0):
+        super(RestartPolicy, self).__init__()
+        if policy not in POLICIES:
+            raise ValueError("Unknown restart policy: {}".format(policy))
+        self.policy = policy
+        self.max_restarts = max_restarts
+        self.window = window
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    @classmethod
+    def from_dict(cls, data: dict or None):
+        if not data:
+            return None
+        return cls(**data)
+
+    def toJSON(self) -> dict:
+        return {
+            "policy": self.policy,
+            "max_restarts": self.max_restarts,
+            "window": self.window,
+            "backoff": self.backoff,
+            "max_backoff": self.max_backoff,
+        }
+
+    def should_restart(self, return_code: int) -> bool:
+        if self.policy == ALWAYS:
+            return True
+        elif self.policy == ON_FAILURE:
+            return return_code != 0
+        return False
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before a restart: exponential backoff with jitter.
+
+        Half of the delay is random, so processes failing together don't
+        restart together.
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
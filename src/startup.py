@@ -0,0 +1,52 @@
+"""Timing of the start of the GUI.
+
+``process_launcher --profile-startup [profile.json]`` prints how long each
+phase of the start took, up to the first paint of the window and then the
+work deferred after it, e.g. loading the profile. Phases are always
+recorded, it's only a few calls to perf_counter, and only printed with the
+flag. This module must not import Qt, it's imported before it to time the
+imports as well.
+"""
+import sys
+import time
+
+_import_time = time.perf_counter()
+
+
+class StartupTimer(object):
+    """Records the time of the phases of the start, in order."""
+
+    def __init__(self, start=None):
+        super(StartupTimer, self).__init__()
+        self.start = start if start is not None else _import_time
+        self.enabled = False
+        self.phases = []
+        self.first_paint = None
+        self._last = self.start
+
+    def mark(self, phase: str):
+        """Ends a phase, which started at the end of the previous one."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def mark_first_paint(self):
+        self.mark("first paint")
+        self.first_paint = self._last - self.start
+
+    def report(self, stream=None):
+        """Prints the phases, if enabled, once the deferred work is done."""
+        if not self.enabled:
+            return
+        stream = stream or sys.stderr
+        for phase, duration in self.phases:
+            stream.write("startup: {:<24} {:8.1f} ms\n".format(phase, duration * 1000))
+        if self.first_paint is not None:
+            stream.write("startup: time to first paint  {:8.1f} ms\n".format(
+                self.first_paint * 1000))
+        stream.write("startup: ready                {:8.1f} ms\n".format(
+            (self._last - self.start) * 1000))
+        stream.flush()
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,255 @@
+import os
+import time
+import signal
+import socket
+import logging
+from collections import deque
+
+from PyQt5.QtCore import QObject, QSocketNotifier, QTimer, pyqtSignal
+
+logger = logging.getLogger('process_launcher')
+
+FALLBACK_POLL_INTERVAL_MS = 1000
+"""Polling interval on platforms without pidfd_open nor SIGCHLD."""
+
+
+class _WatchedChild(object):
+
+    def __init__(self, process, popen):
+        super(_WatchedChild, self).__init__()
+        self.process = process
+        self.popen = popen
+        self.pidfd = None
+        self.notifier = None
+
+    def close(self):
+        if self.notifier is not None:
+            self.notifier.setEnabled(False)
+            self.notifier.deleteLater()
+            self.notifier = None
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+
+
+class ChildSupervisor(QObject):
+    """Learns about the exit of launched processes as soon as it happens.
+
+    Each child gets a pidfd watched by a QSocketNotifier, so exits are
+    delivered by the Qt event loop with no polling and no timers. Where
+    pidfd_open isn't available, a single SIGCHLD handler wakes the event loop
+    through a socket instead. Processes that reap their own children, like
+    the asyncio ones, report their exit through ``exit_listener``.
+    ``exited`` is emitted on the GUI thread once the child has been reaped,
+    with its exit code or signal already stored in the process.
+    """
+
+    exited = pyqtSignal(object)
+    _exit_reported = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super(ChildSupervisor, self).__init__(parent)
+        self._children = {}
+        # Children without a pidfd, checked on every SIGCHLD
+        self._signalled = set()
+        self._wakeup_sockets = None
+        self._wakeup_notifier = None
+        self._fallback_timer = None
+        self._exit_reported.connect(self._on_exit_reported)
+
+    def watch(self, process):
+        """Starts watching the current child of a process.
+
+        Must be called on the GUI thread, after every launch.
+        """
+        popen = process.popen
+        if popen is None:
+            return
+        old_child = self._children.get(process)
+        if old_child is not None:
+            if old_child.popen is popen:
+                return
+            self._forget(old_child)
+
+        child = _WatchedChild(process, popen)
+        self._children[process] = child
+        if process.reports_exit:
+            # Called from the thread of the process, it may have exited already
+            process.exit_listener = self._exit_reported.emit
+            if popen.returncode is not None:
+                self._on_child_exited(child)
+            return
+
+        try:
+            child.pidfd = os.pidfd_open(popen.pid)
+        except ProcessLookupError:
+            # Already reaped by someone else
+            self._on_child_exited(child)
+            return
+        except (AttributeError, OSError):
+            # No pidfd_open (old kernel, non Linux) or out of descriptors
+            self._watch_with_signal(child)
+            return
+
+        child.notifier = QSocketNotifier(child.pidfd, QSocketNotifier.Read, self)
+        child.notifier.activated.connect(lambda _fd, child=child: self._on_child_exited(child))
+
+    def unwatch(self, process):
+        child = self._children.get(process)
+        if child is not None:
+            self._forget(child)
+
+    def _forget(self, child: _WatchedChild):
+        child.close()
+        self._signalled.discard(child)
+        if self._children.get(child.process) is child:
+            del self._children[child.process]
+
+    def _on_exit_reported(self, process, popen):
+        child = self._children.get(process)
+        if child is not None and child.popen is popen:
+            self._on_child_exited(child)
+
+    def _on_child_exited(self, child: _WatchedChild):
+        if self._children.get(child.process) is not child:
+            return
+        if child.process.reports_exit:
+            if child.popen.returncode is None:
+                return
+        elif child.popen.poll() is None:
+            return
+        self._forget(child)
+        # Restarted in the meantime, the new child is watched on its own
+        if child.process.popen is child.popen:
+            self.exited.emit(child.process)
+
+    def _watch_with_signal(self, child: _WatchedChild):
+        self._signalled.add(child)
+        if self._wakeup_notifier is not None or self._fallback_timer is not None:
+            return
+
+        if hasattr(signal, 'SIGCHLD'):
+            self._wakeup_sockets = socket.socketpair()
+            for s in self._wakeup_sockets:
+                s.setblocking(False)
+            signal.set_wakeup_fd(self._wakeup_sockets[1].fileno(),
+                                 warn_on_full_buffer=False)
+            # A Python handler is needed for the wakeup fd to be written
+            signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+            self._wakeup_notifier = QSocketNotifier(
+                self._wakeup_sockets[0].fileno(), QSocketNotifier.Read, self)
+            self._wakeup_notifier.activated.connect(self._on_wakeup)
+        else:
+            self._fallback_timer = QTimer(self)
+            self._fallback_timer.timeout.connect(self._poll_signalled)
+            self._fallback_timer.start(FALLBACK_POLL_INTERVAL_MS)
+
+    def _on_wakeup(self, _fd):
+        try:
+            while self._wakeup_sockets[0].recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        self._poll_signalled()
+
+    def _poll_signalled(self):
+        for child in list(self._signalled):
+            self._on_child_exited(child)
+
+    def shutdown(self):
+        for child in list(self._children.values()):
+            self._forget(child)
+
+
+class _RestartState(object):
+
+    def __init__(self):
+        super(_RestartState, self).__init__()
+        self.started_at = None
+        self.restarts = deque()
+        self.attempt = 0
+        self.parked = False
+        self.timer = None
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer.deleteLater()
+            self.timer = None
+
+
+class RestartSupervisor(QObject):
+    """Restarts exited processes according to their ``restart_policy``.
+
+    Restarts are delayed with exponential backoff and jitter, and go through
+    the launch pool like any other launch. A process restarted too many
+    times within the window of its policy is parked: it is not restarted
+    again until it is launched by hand, and ``parked`` is emitted.
+    """
+
+    restart_requested = pyqtSignal(object)
+    parked = pyqtSignal(object)
+
+    def __init__(self, child_supervisor: ChildSupervisor, launch_pool, parent=None):
+        super(RestartSupervisor, self).__init__(parent)
+        self._states = {}
+        child_supervisor.exited.connect(self._on_exited)
+        launch_pool.launched.connect(self._on_launched)
+
+    def _state(self, process) -> _RestartState:
+        if process not in self._states:
+            self._states[process] = _RestartState()
+        return self._states[process]
+
+    def reset(self, process):
+        """Forgets the restart history, e.g. when launched by hand."""
+        state = self._states.pop(process, None)
+        if state is not None:
+            state.cancel()
+
+    def is_parked(self, process) -> bool:
+        state = self._states.get(process)
+        return state is not None and state.parked
+
+    def _on_launched(self, process):
+        self._state(process).started_at = time.monotonic()
+
+    def _on_exited(self, process):
+        policy = process.restart_policy
+        if (policy is None or process.stop_requested
+                or not policy.should_restart(process.return_code)):
+            return
+
+        state = self._state(process)
+        now = time.monotonic()
+        if state.started_at is not None and now - state.started_at >= policy.window:
+            # It was up for a while, start backing off from scratch
+            state.attempt = 0
+        while state.restarts and now - state.restarts[0] > policy.window:
+            state.restarts.popleft()
+
+        if len(state.restarts) >= policy.max_restarts:
+            logger.warning("{} is crash looping, not restarting it".format(process.name))
+            state.parked = True
+            self.parked.emit(process)
+            return
+
+        delay = policy.delay(state.attempt)
+        state.attempt += 1
+        state.restarts.append(now)
+        state.cancel()
+        state.timer = QTimer(self)
+        state.timer.setSingleShot(True)
+        state.timer.timeout.connect(lambda process=process: self._restart(process))
+        state.timer.start(int(delay * 1000))
+        logger.info("Restarting {} in {:.1f}s".format(process.name, delay))
+
+    def _restart(self, process):
+        state = self._states.get(process)
+        if state is None:
+            return
+        state.cancel()
+        # Stopped by hand while waiting
+        if process.stop_requested:
+            return
+        self.restart_requested.emit(process)
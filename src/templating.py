@@ -0,0 +1,200 @@
+"""Variables and matrices of profiles.
+
+Strings of a process can use ``${NAME}`` placeholders, replaced by the
+``variables`` of the profile or of its group, or by the values of the
+``matrix`` of the process, which makes an instance of the process for every
+combination of its values::
+
+    "variables": {"HOST": "localhost"},
+    ...
+    {"name": "shard ${SHARD}", "args": ["server", "--port", "${PORT}"],
+     "matrix": {"SHARD": [0, 1], "PORT": {"range": [8000, 8002]}}}
+
+A string that is only a placeholder takes the value with its type, so
+``"ready_when": {"port": "${PORT}"}`` gives a number, except in the
+``name``, ``dir``, ``args`` and ``description`` of a process, which are
+always strings. Unknown placeholders are left as
+they are, like shell variables, and ``$${NAME}`` is a literal ``${NAME}``.
+
+Every process is compiled once into functions rendering only the fields
+with placeholders, which are then called for each instance. The values
+without placeholders are shared by the instances.
+"""
+import re
+import itertools
+
+MAX_MATRIX_SIZE = 10000
+"""Maximum number of instances of a process, to catch mistakes."""
+
+_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*$")
+_PLACEHOLDER = re.compile(r"\$(\$?)\{([A-Za-z_][A-Za-z0-9_]*)\}")
+_SCALARS = (str, int, float, bool)
+_STRING_KEYS = ('name', 'dir', 'args', 'description')
+
+
+class TemplateError(ValueError):
+    """Invalid ``variables`` or ``matrix``."""
+
+
+class _Strings(dict):
+    """The variables of an instance as strings, for str.format_map."""
+
+    def __missing__(self, name: str) -> str:
+        return "${" + name + "}"
+
+
+class _Template(object):
+    """A string with placeholders, turned once into a format string."""
+
+    __slots__ = ('text', 'format', 'name')
+
+    def __init__(self, text: str):
+        self.text = text
+        parts = []
+        names = []
+        last = 0
+        for match in _PLACEHOLDER.finditer(text):
+            parts.append(_escape(text[last:match.start()]))
+            if match.group(1):
+                # Escaped: $${NAME}
+                parts.append(_escape(match.group(0)[1:]))
+            else:
+                parts.append("{" + match.group(2) + "}")
+                names.append(match.group(2))
+            last = match.end()
+        parts.append(_escape(text[last:]))
+        self.format = "".join(parts)
+        # Set if the string is only a placeholder
+        self.name = names[0] if self.format == "{" + "".join(names) + "}" else None
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def _to_string(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _compile(value, typed=True):
+    """A function ``render(variables, strings)`` returning the value for the
+    variables of an instance, or None if there are no placeholders in it.
+
+    Values without placeholders are not copied, the instances share them.
+    """
+    if isinstance(value, str):
+        if "${" not in value:
+            return None
+        template = _Template(value)
+        format_map, name = template.format.format_map, template.name
+        if typed and name is not None:
+            # Keeps the type of the value
+            return lambda variables, strings: (
+                variables[name] if name in variables else format_map(strings))
+        return lambda variables, strings: format_map(strings)
+
+    if isinstance(value, dict):
+        renderers = [(key, _compile(item, typed)) for key, item in value.items()]
+    elif isinstance(value, list):
+        renderers = [(i, _compile(item, typed)) for i, item in enumerate(value)]
+    else:
+        return None
+    renderers = [(key, render) for key, render in renderers if render is not None]
+    if not renderers:
+        return None
+
+    def render(variables, strings):
+        ret = value.copy()
+        for key, render_item in renderers:
+            ret[key] = render_item(variables, strings)
+        return ret
+    return render
+
+
+def _compile_process(data: dict):
+    """Like _compile, for the fields of a process."""
+    renderers = [(key, _compile(value, key not in _STRING_KEYS))
+                 for key, value in data.items()]
+    renderers = [(key, render) for key, render in renderers if render is not None]
+    if not renderers:
+        return None
+
+    def render(variables):
+        strings = _Strings((name, _to_string(value)) for name, value in variables.items())
+        ret = dict(data)
+        for key, render_item in renderers:
+            ret[key] = render_item(variables, strings)
+        return ret
+    return render
+
+
+def check_variables(variables, where="variables") -> dict:
+    """Raises TemplateError unless it maps names to strings or numbers."""
+    if variables is None:
+        return {}
+    if not isinstance(variables, dict):
+        raise TemplateError("{}: expected an object".format(where))
+    for name, value in variables.items():
+        if not _NAME.match(name):
+            raise TemplateError("{}: invalid name '{}'".format(where, name))
+        if not isinstance(value, _SCALARS):
+            raise TemplateError("{}.{}: expected a string or a number".format(where, name))
+    return variables
+
+
+def _matrix_values(name: str, values) -> list:
+    if isinstance(values, dict) and set(values) == {"range"}:
+        bounds = values["range"]
+        if not isinstance(bounds, list) or not 2 <= len(bounds) <= 3 \
+                or not all(isinstance(n, int) and not isinstance(n, bool) for n in bounds):
+            raise TemplateError("matrix.{}: range must be [start, stop] or "
+                                "[start, stop, step], of integers".format(name))
+        if len(bounds) == 3 and bounds[2] == 0:
+            raise TemplateError("matrix.{}: the step of range can't be 0".format(name))
+        values = list(range(*bounds))
+    if not isinstance(values, list) or not all(isinstance(v, _SCALARS) for v in values):
+        raise TemplateError("matrix.{}: expected a list of strings or numbers, "
+                            "or {{\"range\": [start, stop]}}".format(name))
+    if not values:
+        raise TemplateError("matrix.{}: empty".format(name))
+    return values
+
+
+def expand_matrix(matrix) -> list:
+    """The variables of every instance of a ``matrix``, in order."""
+    names = list(matrix)
+    for name in names:
+        if not _NAME.match(name):
+            raise TemplateError("matrix: invalid name '{}'".format(name))
+    values = [_matrix_values(name, matrix[name]) for name in names]
+    size = 1
+    for name_values in values:
+        size *= len(name_values)
+    if size > MAX_MATRIX_SIZE:
+        raise TemplateError("matrix: {} instances, the maximum is {}".format(
+            size, MAX_MATRIX_SIZE))
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def expand_process(data: dict, variables: dict) -> list:
+    """The instances of a process of a profile, with their placeholders
+    replaced. ``data`` itself is returned if there is nothing to replace.
+
+    Raises TemplateError on an invalid ``matrix``.
+    """
+    if "matrix" not in data:
+        render = _compile_process(data) if variables else None
+        return [render(variables) if render else data]
+
+    matrix = data["matrix"]
+    if not isinstance(matrix, dict):
+        raise TemplateError("matrix: expected an object")
+    instances = expand_matrix(matrix)
+    render = _compile_process({key: value for key, value in data.items() if key != "matrix"})
+    if render is None:
+        # The instances would all be the same
+        raise TemplateError("matrix: the process doesn't use ${{{}}}".format(
+            "}, ${".join(matrix)))
+    return [render(dict(variables, **instance)) for instance in instances]
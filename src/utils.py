@@ -1,11 +1,11 @@
 import sys
 import os
+import re
 import subprocess
+import tempfile
 from enum import Enum
 from pathlib import Path
 
-from PyQt5.QtWidgets import (QFileDialog)
-
 class AppMode(Enum):
     LAUNCH = 0
     EDIT = 1
@@ -53,6 +53,8 @@ def clearLayout(layout):
             clearLayout(child.layout())
 
 def browse_existing_directory(widget, dialog_text) -> str:
+    # Imported here so that the headless mode doesn't load Qt
+    from PyQt5.QtWidgets import QFileDialog
     options = QFileDialog.Options()
     options |= QFileDialog.DontUseNativeDialog
     filename = str(QFileDialog.getExistingDirectory(widget, dialog_text, options=options))
@@ -77,4 +79,43 @@ def parse_dropped_file(text: str) -> str:
     return text
 
 
+def safe_file_name(name: str) -> str:
+    """A name, e.g. of a process, usable as a file name."""
+    return re.sub(r'[^\w.-]', '_', name or '_') or '_'
+
+
 my_path = os.path.abspath(os.path.dirname(__file__))
+
+# Read once, as it can only be read by changing it
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def write_atomically(path: str, data: bytes):
+    """Writes a file through a temporary file and os.replace.
+
+    Readers, and the file after a crash, only ever see the old or the new
+    content, never a truncated one.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(
+        prefix=".{}.".format(os.path.basename(path)), suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except OSError:
+            # A new file, like open() would create it instead of the 0600
+            # of mkstemp
+            mode = 0o666 & ~_UMASK
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
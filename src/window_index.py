@@ -0,0 +1,168 @@
+import os
+import time
+import logging
+import subprocess
+import threading
+
+from . import proctree
+from .x11 import get_window_backend
+
+logger = logging.getLogger('process_launcher')
+
+NEGATIVE_CACHE_TTL = 5.0
+"""Seconds during which a PID without a window is not looked up again."""
+
+
+class WmctrlWindowSource(object):
+    """Reads the PID of every window with a single ``wmctrl -lp`` call.
+
+    Used when libX11 can't be loaded. It can't tell when windows change, so
+    the index is re-read on misses only, once the negative cache expired.
+    """
+
+    tracks_changes = False
+
+    def refresh(self) -> dict:
+        try:
+            output = subprocess.run(['wmctrl', '-lp'], stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL).stdout
+        except OSError as e:
+            logger.info("wmctrl not available: {}".format(e))
+            return {}
+
+        index = {}
+        for line in output.decode("utf-8", "replace").splitlines():
+            # <window id> <desktop> <pid> <host> <title>
+            fields = line.split(None, 3)
+            if len(fields) >= 3 and fields[2].isdigit():
+                index.setdefault(int(fields[2]), []).append(int(fields[0], 16))
+        return index
+
+    def poll_changes(self) -> bool:
+        return False
+
+
+# Fields of /proc/<pid>/stat after the command name, see proctree.read_stat
+_SESSION = 3
+_START_TIME = 19
+
+
+class WindowIndex(object):
+    """Finds the window of a launched process.
+
+    The window may belong to the process itself or to any process of its
+    session, e.g. the terminal or the GUI started by a script, which is
+    found by walking /proc. A terminal may also hand the command over to an
+    instance that was already running, and exit: the window is then the one
+    of the closest ancestor of the process running the command, once the
+    launched process has exited. PIDs without a window are remembered, so
+    failed lookups don't cost anything, until the source reports new
+    windows, or for ``negative_ttl`` seconds if it can't.
+    """
+
+    def __init__(self, source, negative_ttl=NEGATIVE_CACHE_TTL):
+        super(WindowIndex, self).__init__()
+        self.source = source
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._index = None
+        self._misses = {}
+
+    def _refresh(self, changed=False):
+        """``changed`` is set when the source reported new or destroyed
+        windows, which may belong to processes that had none."""
+        self._index = self.source.refresh()
+        if changed and self.source.tracks_changes:
+            self._misses.clear()
+        else:
+            now = time.monotonic()
+            self._misses = {pid: expiry for pid, expiry in self._misses.items() if expiry > now}
+
+    def _window_of(self, pids) -> int or None:
+        for pid in pids:
+            windows = self._index.get(pid)
+            if windows:
+                return windows[0]
+        return None
+
+    def _find(self, pid: int, command=None) -> int or None:
+        windows = self._index.get(pid)
+        if windows:
+            return windows[0]
+        if not self._index:
+            return None
+        stats = proctree.read_stats()
+        alive = pid in stats and stats[pid][0] != b'Z'
+        # Descendants first, then the processes that left the tree but not
+        # the session, e.g. daemonized ones
+        candidates = proctree.descendants(pid, proctree.children_map(stats)) if alive else []
+        candidates += [other for other, fields in stats.items()
+                       if int(fields[_SESSION]) == pid and other != pid
+                       and other not in candidates]
+        window = self._window_of(candidates)
+        if window is None and not alive and command is not None and command.args:
+            # Only once the launched process has exited, e.g. a terminal
+            # that handed the command over
+            window = self._find_hand_off(pid, stats, command)
+        return window
+
+    def _find_hand_off(self, pid: int, stats: dict, command) -> int or None:
+        """The window hosting ``command`` outside of the tree of the
+        launched process ``pid``, the newest one if it runs more than once.
+
+        Never the window of the launcher, which is an ancestor of the
+        terminals it launched, nor of its own ancestors.
+        """
+        launcher = [os.getpid()] + proctree.ancestors(os.getpid())
+        args = list(command.args)
+        cwd = os.path.realpath(command.cwd) if command.cwd else None
+        hosts = [host for host in stats if host != pid and host not in launcher
+                 and proctree.read_cmdline(host) == args]
+        hosts.sort(key=lambda host: int(stats[host][_START_TIME]), reverse=True)
+        for host in hosts:
+            if cwd is not None and proctree.read_cwd(host) not in (cwd, None):
+                continue
+            # Up to, but without, the launcher
+            chain = [host]
+            for ancestor in proctree.ancestors(host):
+                if ancestor in launcher:
+                    break
+                chain.append(ancestor)
+            window = self._window_of(chain)
+            if window is not None:
+                return window
+        return None
+
+    def resolve(self, pid: int, command=None) -> int or None:
+        """The window of a launched process, or None.
+
+        ``command``, a CommandSpec, is the command run in the window, used
+        to find it once the launched process has handed it over.
+        """
+        with self._lock:
+            if self._index is None or self.source.poll_changes():
+                self._refresh(changed=True)
+
+            now = time.monotonic()
+            if self._misses.get(pid, 0) > now:
+                return None
+
+            window = self._find(pid, command)
+            if window is None and not self.source.tracks_changes:
+                self._refresh()
+                window = self._find(pid, command)
+
+            if window is None:
+                self._misses[pid] = now + self.negative_ttl
+            return window
+
+
+_window_index = None
+
+
+def get_window_index() -> WindowIndex:
+    """Returns the shared index, backed by libX11 or else by wmctrl."""
+    global _window_index
+    if _window_index is None:
+        _window_index = WindowIndex(get_window_backend() or WmctrlWindowSource())
+    return _window_index
@@ -0,0 +1,234 @@
+"""In-process access to the X11 windows of the launched processes.
+
+Talks to libX11 through ctypes, so looking up a window or minimizing a
+hundred of them doesn't fork wmctrl or xdotool. Works against any display,
+e.g. ``X11WindowBackend(":99")`` for an Xvfb server.
+"""
+import os
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+logger = logging.getLogger('process_launcher')
+
+Success = 0
+AnyPropertyType = 0
+XA_CARDINAL = 6
+XA_WINDOW = 33
+PropertyNotify = 28
+PropertyChangeMask = 1 << 22
+
+
+class X11Error(Exception):
+    """libX11 or the X server are not available."""
+
+
+class _Display(ctypes.Structure):
+    pass
+
+
+_DisplayPointer = ctypes.POINTER(_Display)
+_Window = ctypes.c_ulong
+_Atom = ctypes.c_ulong
+
+
+class _XPropertyEvent(ctypes.Structure):
+    _fields_ = [
+        ('type', ctypes.c_int),
+        ('serial', ctypes.c_ulong),
+        ('send_event', ctypes.c_int),
+        ('display', _DisplayPointer),
+        ('window', _Window),
+        ('atom', _Atom),
+        ('time', ctypes.c_ulong),
+        ('state', ctypes.c_int),
+    ]
+
+
+class _XEvent(ctypes.Union):
+    _fields_ = [
+        ('type', ctypes.c_int),
+        ('xproperty', _XPropertyEvent),
+        ('pad', ctypes.c_long * 24),
+    ]
+
+
+_ErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, _DisplayPointer, ctypes.c_void_p)
+
+_xlib = None
+
+
+def _load_xlib():
+    global _xlib
+    if _xlib is not None:
+        return _xlib
+
+    path = ctypes.util.find_library('X11')
+    if not path:
+        raise X11Error("libX11 not found")
+    xlib = ctypes.cdll.LoadLibrary(path)
+
+    xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    xlib.XOpenDisplay.restype = _DisplayPointer
+    xlib.XCloseDisplay.argtypes = [_DisplayPointer]
+    xlib.XDefaultRootWindow.argtypes = [_DisplayPointer]
+    xlib.XDefaultRootWindow.restype = _Window
+    xlib.XDefaultScreen.argtypes = [_DisplayPointer]
+    xlib.XInternAtom.argtypes = [_DisplayPointer, ctypes.c_char_p, ctypes.c_int]
+    xlib.XInternAtom.restype = _Atom
+    xlib.XGetWindowProperty.argtypes = [
+        _DisplayPointer, _Window, _Atom, ctypes.c_long, ctypes.c_long,
+        ctypes.c_int, _Atom, ctypes.POINTER(_Atom), ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_ulong),
+        ctypes.POINTER(ctypes.c_void_p)]
+    xlib.XFree.argtypes = [ctypes.c_void_p]
+    xlib.XIconifyWindow.argtypes = [_DisplayPointer, _Window, ctypes.c_int]
+    xlib.XMapWindow.argtypes = [_DisplayPointer, _Window]
+    xlib.XFlush.argtypes = [_DisplayPointer]
+    xlib.XSync.argtypes = [_DisplayPointer, ctypes.c_int]
+    xlib.XSelectInput.argtypes = [_DisplayPointer, _Window, ctypes.c_long]
+    xlib.XPending.argtypes = [_DisplayPointer]
+    xlib.XNextEvent.argtypes = [_DisplayPointer, ctypes.POINTER(_XEvent)]
+    xlib.XSetErrorHandler.argtypes = [_ErrorHandler]
+    xlib.XSetErrorHandler.restype = _ErrorHandler
+
+    _xlib = xlib
+    return _xlib
+
+
+@_ErrorHandler
+def _ignore_x11_errors(display, event):
+    # The default handler exits the whole application on errors such as
+    # BadWindow, which happen whenever a window is closed while we use it
+    return 0
+
+
+class X11WindowBackend(object):
+    """Reads ``_NET_CLIENT_LIST`` and ``_NET_WM_PID`` to map PIDs to windows.
+
+    The PID to window index is built once and then updated from the
+    PropertyNotify events of the root window, so only windows created since
+    the last read are queried. Calls are serialized with a lock, as the index
+    is looked up from the launch threads.
+    """
+
+    tracks_changes = True
+
+    def __init__(self, display_name: str = None):
+        super(X11WindowBackend, self).__init__()
+        self.xlib = _load_xlib()
+        display_name = display_name or os.environ.get('DISPLAY')
+        if not display_name:
+            raise X11Error("No X11 display")
+        self.display = self.xlib.XOpenDisplay(display_name.encode('utf-8'))
+        if not self.display:
+            raise X11Error("Could not open display {}".format(display_name))
+        self.xlib.XSetErrorHandler(_ignore_x11_errors)
+
+        self.root = self.xlib.XDefaultRootWindow(self.display)
+        self.screen = self.xlib.XDefaultScreen(self.display)
+        self._client_list_atom = self.xlib.XInternAtom(self.display, b'_NET_CLIENT_LIST', 0)
+        self._pid_atom = self.xlib.XInternAtom(self.display, b'_NET_WM_PID', 0)
+        # Get notified when windows are created or destroyed
+        self.xlib.XSelectInput(self.display, self.root, PropertyChangeMask)
+        self.xlib.XFlush(self.display)
+        self._lock = threading.RLock()
+        self._window_pids = {}
+
+    def _get_property(self, window: int, atom: int, property_type: int) -> list:
+        """Returns a property of 32 bits items as a list of ints."""
+        actual_type = _Atom()
+        actual_format = ctypes.c_int()
+        n_items = ctypes.c_ulong()
+        bytes_after = ctypes.c_ulong()
+        data = ctypes.c_void_p()
+        status = self.xlib.XGetWindowProperty(
+            self.display, window, atom, 0, 2 ** 16, 0, property_type,
+            ctypes.byref(actual_type), ctypes.byref(actual_format),
+            ctypes.byref(n_items), ctypes.byref(bytes_after), ctypes.byref(data))
+        if status != Success or not data.value:
+            return []
+        try:
+            if actual_format.value != 32:
+                return []
+            # Xlib returns 32 bits items as C longs
+            items = ctypes.cast(data, ctypes.POINTER(ctypes.c_ulong))
+            return [items[i] for i in range(n_items.value)]
+        finally:
+            self.xlib.XFree(data)
+
+    def client_windows(self) -> list:
+        with self._lock:
+            return self._get_property(self.root, self._client_list_atom, XA_WINDOW)
+
+    def window_pid(self, window: int) -> int or None:
+        with self._lock:
+            pids = self._get_property(window, self._pid_atom, XA_CARDINAL)
+        return pids[0] if pids else None
+
+    def refresh(self) -> dict:
+        """Rebuilds the PID to windows index, querying only new windows."""
+        with self._lock:
+            window_pids = {}
+            for window in self.client_windows():
+                if window in self._window_pids:
+                    window_pids[window] = self._window_pids[window]
+                else:
+                    window_pids[window] = self.window_pid(window)
+
+            index = {}
+            for window, pid in window_pids.items():
+                if pid is not None:
+                    index.setdefault(pid, []).append(window)
+
+            self._window_pids = window_pids
+            return index
+
+    def poll_changes(self) -> bool:
+        """Drains the pending events, True if the list of windows changed."""
+        changed = False
+        event = _XEvent()
+        with self._lock:
+            while self.xlib.XPending(self.display):
+                self.xlib.XNextEvent(self.display, ctypes.byref(event))
+                if (event.type == PropertyNotify
+                        and event.xproperty.atom == self._client_list_atom):
+                    changed = True
+        return changed
+
+    def minimize(self, windows):
+        """Iconifies several windows with a single round trip to the server."""
+        with self._lock:
+            for window in windows:
+                self.xlib.XIconifyWindow(self.display, window, self.screen)
+            self.xlib.XFlush(self.display)
+
+    def restore(self, windows):
+        """Maps several windows with a single round trip to the server."""
+        with self._lock:
+            for window in windows:
+                self.xlib.XMapWindow(self.display, window)
+            self.xlib.XFlush(self.display)
+
+    def close(self):
+        with self._lock:
+            if self.display:
+                self.xlib.XCloseDisplay(self.display)
+                self.display = None
+
+
+_backend = None
+_backend_error = None
+
+
+def get_window_backend() -> X11WindowBackend or None:
+    """Returns the shared backend, or None if X11 can't be used here."""
+    global _backend, _backend_error
+    if _backend is None and _backend_error is None:
+        try:
+            _backend = X11WindowBackend()
+        except (X11Error, OSError) as e:
+            logger.info("Native X11 window backend not available: {}".format(e))
+            _backend_error = e
+    return _backend
@@ -0,0 +1,337 @@
+"""Zygote launch mode, for groups of Python processes.
+
+A group with a ``zygote`` starts, on its first launch, a Python process that
+imports the ``preload`` modules once and then forks a child for each launch
+of a process of the group run by the same ``python``::
+
+    "zygote": {"python": "python3", "preload": ["numpy", "myapp.server"]}
+
+Those processes skip the start of the interpreter and the imports, which
+makes launching them, restarting them and launching the instances of a
+matrix take a few milliseconds. Only ``python -m module``, ``python
+script.py`` and ``python -c code`` are run like this, optionally with
+``-u``. Processes with limits, see limits.py, and processes with
+``"zygote": false`` are spawned as usual.
+
+The children are forks of the zygote: preloaded modules must not start
+threads or open connections, and the environment given to a process doesn't
+change what was imported before. The zygote, see zygote_server.py, runs
+with the environment of the launcher and reports the exit code of its
+children, as they aren't children of the launcher. Only on Linux.
+"""
+import os
+import sys
+import json
+import time
+import array
+import atexit
+import select
+import signal
+import socket
+import asyncio
+import threading
+import subprocess
+
+from . import proctree
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zygote_server.py")
+
+DEFAULT_PYTHON = "python3"
+
+START_TIMEOUT = 120.0
+"""Seconds to wait for the zygote to import the preloaded modules."""
+
+SPAWN_TIMEOUT = 10.0
+
+EXIT_REPORT_TIMEOUT = 1.0
+"""Seconds to wait for the exit code of a child that is known to be dead."""
+
+UNKNOWN_EXIT_CODE = 255
+"""Exit code of a child whose zygote died before reporting it."""
+
+MAX_MESSAGE_SIZE = 64 * 1024
+
+_zygotes = {}
+_zygotes_lock = threading.Lock()
+_shutdown_registered = False
+
+
+class ZygoteError(ValueError):
+    pass
+
+
+def _is_alive(pid: int) -> bool:
+    stat = proctree.read_stat(pid)
+    return stat is not None and stat[0] != b'Z'
+
+
+class ZygoteSpec(object):
+    """The ``zygote`` of a group of a profile."""
+
+    __slots__ = ('python', 'preload', 'dir')
+
+    def __init__(self, python=DEFAULT_PYTHON, preload=None, dir=None):
+        if not isinstance(python, str) or not python:
+            raise ZygoteError("zygote.python: expected a command")
+        if preload is not None and (not isinstance(preload, list) or not all(
+                isinstance(module, str) and module for module in preload)):
+            raise ZygoteError("zygote.preload: expected a list of modules")
+        if dir is not None and not isinstance(dir, str):
+            raise ZygoteError("zygote.dir: expected a folder")
+        self.python = python
+        self.preload = tuple(preload or ())
+        # Where the modules are imported from, the launcher's folder by default
+        self.dir = dir
+
+    @classmethod
+    def from_dict(cls, data: dict or None):
+        """The zygote of a group entry, None if it has none."""
+        zygote = data.get("zygote") if data else None
+        if zygote is None:
+            return None
+        if not isinstance(zygote, dict):
+            raise ZygoteError("zygote: expected an object")
+        unknown = sorted(set(zygote) - set(cls.__slots__))
+        if unknown:
+            raise ZygoteError("zygote: unknown {}".format(", ".join(unknown)))
+        return cls(**zygote)
+
+    def toJSON(self) -> dict:
+        ret = {"python": self.python, "preload": list(self.preload)}
+        if self.dir:
+            ret["dir"] = self.dir
+        return ret
+
+    @property
+    def key(self) -> tuple:
+        return (self.python, self.preload, self.dir)
+
+    def parse(self, args) -> dict or None:
+        """What the zygote runs for ``args``, None if it can't run them."""
+        if len(args) < 2 or args[0] != self.python:
+            return None
+        unbuffered = args[1] == "-u"
+        options = args[2:] if unbuffered else args[1:]
+        if not options:
+            return None
+        if options[0] in ("-m", "-c"):
+            if len(options) < 2:
+                return None
+            kind = "module" if options[0] == "-m" else "code"
+            return {"kind": kind, "target": options[1], "unbuffered": unbuffered,
+                    "argv": [options[0]] + list(options[2:])}
+        if options[0].startswith("-"):
+            # Other options of the interpreter
+            return None
+        return {"kind": "path", "target": options[0], "unbuffered": unbuffered,
+                "argv": list(options)}
+
+
+def _receive(sock: socket.socket, timeout: float) -> dict or None:
+    """A message, None on timeout. Raises EOFError once the peer is gone."""
+    if not select.select([sock], [], [], timeout)[0]:
+        return None
+    data = sock.recv(MAX_MESSAGE_SIZE)
+    if not data:
+        raise EOFError()
+    return json.loads(data.decode("utf-8"))
+
+
+class ZygoteChild(object):
+    """A process forked by a zygote.
+
+    Has the parts of subprocess.Popen used by the processes: ``pid``,
+    ``returncode``, ``poll``, ``wait``, ``kill`` and ``terminate``, and
+    ``wait_async`` for asyncio. The exit code comes from the zygote.
+    """
+
+    def __init__(self, pid: int, channel: socket.socket, args):
+        super(ZygoteChild, self).__init__()
+        self.pid = pid
+        self.args = list(args)
+        self.returncode = None
+        self._channel = channel
+        self._channel.setblocking(False)
+        # Set if the zygote died before reporting the exit
+        self._orphan = False
+        self._lock = threading.Lock()
+
+    def _read_exit(self, timeout: float):
+        with self._lock:
+            if self.returncode is not None or self._orphan:
+                return
+            try:
+                message = _receive(self._channel, timeout)
+            except (EOFError, OSError):
+                self._orphan = True
+                message = None
+            if message is not None and "exit" in message:
+                self.returncode = message["exit"]
+                self._channel.close()
+
+    def poll(self) -> int or None:
+        self._read_exit(0)
+        if self.returncode is None and not _is_alive(self.pid):
+            # Reaped by the zygote at any moment now
+            self._read_exit(EXIT_REPORT_TIMEOUT)
+            if self.returncode is None:
+                self.returncode = UNKNOWN_EXIT_CODE
+        return self.returncode
+
+    def wait(self, timeout=None) -> int:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            if self._orphan:
+                select.select([], [], [], EXIT_REPORT_TIMEOUT)
+            else:
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                select.select([self._channel], [], [], remaining)
+        return self.returncode
+
+    async def wait_async(self) -> int:
+        loop = asyncio.get_running_loop()
+        while self.poll() is None:
+            if self._orphan:
+                await asyncio.sleep(EXIT_REPORT_TIMEOUT)
+                continue
+            readable = loop.create_future()
+            loop.add_reader(self._channel, lambda: readable.done() or readable.set_result(None))
+            try:
+                await readable
+            finally:
+                loop.remove_reader(self._channel)
+        return self.returncode
+
+    def send_signal(self, signum: int):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class Zygote(object):
+    """Launcher side of a zygote, started on the first spawn.
+
+    Shared by the groups with the same ZygoteSpec, see get_zygote.
+    """
+
+    def __init__(self, spec: ZygoteSpec):
+        super(Zygote, self).__init__()
+        self.spec = spec
+        self._popen = None
+        self._control = None
+        self._lock = threading.Lock()
+
+    def can_run(self, command) -> bool:
+        return self.spec.parse(command.args) is not None
+
+    def _start(self):
+        control, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            self._popen = subprocess.Popen(
+                [self.spec.python, SERVER_PATH, str(theirs.fileno())] + list(self.spec.preload),
+                cwd=os.path.expanduser(self.spec.dir) if self.spec.dir else None,
+                stdin=subprocess.DEVNULL, pass_fds=(theirs.fileno(),),
+                # Out of the way of Ctrl+C, it exits when the launcher does
+                start_new_session=True)
+        finally:
+            theirs.close()
+        try:
+            message = _receive(control, START_TIMEOUT)
+        except EOFError:
+            message = {"error": "the zygote exited with code {}".format(self._popen.wait())}
+        if message is None or "ready" not in message:
+            control.close()
+            self._popen.kill()
+            self._popen.wait()
+            raise ZygoteError("Could not start the zygote of {}: {}".format(
+                self.spec.python, message["error"] if message else "timed out"))
+        self._control = control
+
+    def spawn(self, command, stdio) -> ZygoteChild:
+        """Forks a child running ``command``, with ``stdio`` as its standard
+        input, output and error. Starts the zygote if needed.
+        """
+        request = self.spec.parse(command.args)
+        if request is None:
+            raise ZygoteError("The zygote of {} can't run {}".format(
+                self.spec.python, command.command_line))
+        environ = command.environ()
+        request["cwd"] = command.cwd
+        request["env"] = dict(environ) if environ is not None else None
+        data = json.dumps(request).encode("utf-8")
+
+        channel, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            fds = array.array("i", list(stdio) + [theirs.fileno()])
+            with self._lock:
+                for attempt in (0, 1):
+                    if self._control is None or self._popen.poll() is not None:
+                        self._start()
+                    try:
+                        self._control.sendmsg(
+                            [data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+                        break
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The zygote died since the last spawn
+                        self._control.close()
+                        self._control = None
+                        if attempt:
+                            raise
+        finally:
+            theirs.close()
+        try:
+            reply = _receive(channel, SPAWN_TIMEOUT)
+        except EOFError:
+            reply = {"error": "the zygote exited"}
+        if reply is None or "pid" not in reply:
+            channel.close()
+            raise ZygoteError("Could not launch {}: {}".format(
+                command.command_line, reply["error"] if reply else "timed out"))
+        return ZygoteChild(reply["pid"], channel, command.args)
+
+    def close(self):
+        """The zygote exits once its children have exited."""
+        with self._lock:
+            if self._control is not None:
+                self._control.close()
+                self._control = None
+
+
+def get_zygote(spec: ZygoteSpec or None) -> Zygote or None:
+    """The zygote of a spec, shared by the groups with the same one."""
+    if spec is None:
+        return None
+    global _shutdown_registered
+    with _zygotes_lock:
+        if not _shutdown_registered:
+            atexit.register(shutdown_zygotes)
+            _shutdown_registered = True
+        zygote = _zygotes.get(spec.key)
+        if zygote is None:
+            zygote = _zygotes[spec.key] = Zygote(spec)
+        return zygote
+
+
+def shutdown_zygotes():
+    """Closes every zygote, e.g. before opening another profile. The next
+    launches start new ones, which import the modules again."""
+    with _zygotes_lock:
+        zygotes = list(_zygotes.values())
+        _zygotes.clear()
+    for zygote in zygotes:
+        zygote.close()
+
+
+def is_supported() -> bool:
+    # The state of the children is read from /proc
+    return sys.platform.startswith("linux")
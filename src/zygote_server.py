@@ -0,0 +1,236 @@
+"""The zygote itself, see zygote.py.
+
+Run as a script by the Python of the processes, which may not have the
+launcher installed, so it only uses the standard library::
+
+    python3 zygote_server.py FD [MODULE ...]
+
+It imports the modules, says it's ready on the socket FD and forks a child
+for every request received on it. Each request is a JSON message with the
+standard input, output and error of the child and a socket of its own
+attached, on which the PID of the child is sent back, and later its exit
+code, as the zygote reaps it. The zygote exits once the launcher closes FD
+and all its children have exited.
+"""
+import os
+import sys
+import json
+import array
+import runpy
+import atexit
+import signal
+import socket
+import selectors
+import threading
+import traceback
+
+MAX_MESSAGE_SIZE = 1024 * 1024
+N_FDS = 4
+
+
+def send(sock: socket.socket, message: dict):
+    try:
+        sock.send(json.dumps(message).encode("utf-8"))
+    except OSError:
+        # The launcher stopped listening to this child
+        pass
+
+
+def receive_request(control: socket.socket):
+    """A request and its descriptors, None at the end."""
+    fds = array.array("i")
+    data, ancdata, _flags, _address = control.recvmsg(
+        MAX_MESSAGE_SIZE, socket.CMSG_LEN(N_FDS * fds.itemsize))
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) - len(cmsg_data) % fds.itemsize])
+    if not data:
+        for fd in fds:
+            os.close(fd)
+        return None
+    return json.loads(data.decode("utf-8")), list(fds)
+
+
+def exit_code(e: SystemExit) -> int:
+    """Like the interpreter does with the code of SystemExit."""
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+def run_child(request: dict) -> int:
+    """Runs the command of a request like ``python3 ...`` would, in the child."""
+    if request["cwd"]:
+        os.chdir(request["cwd"])
+    if request["env"] is not None:
+        python_path = os.environ.get("PYTHONPATH")
+        os.environ.clear()
+        os.environ.update(request["env"])
+        if os.environ.get("PYTHONPATH") != python_path:
+            # Read by the interpreter at startup, so only added here
+            sys.path[1:1] = [path for path in os.environ.get("PYTHONPATH", "").split(os.pathsep)
+                             if path and path not in sys.path]
+    write_through = request["unbuffered"] or bool(os.environ.get("PYTHONUNBUFFERED"))
+    for stream in (sys.stdout, sys.stderr):
+        stream.reconfigure(line_buffering=stream.isatty(), write_through=write_through)
+    if "random" in sys.modules:
+        # Or every child would draw the same numbers
+        sys.modules["random"].seed()
+
+    kind, target = request["kind"], request["target"]
+    sys.argv = list(request["argv"])
+    if kind == "module":
+        sys.path[0] = os.getcwd()
+        runpy.run_module(target, run_name="__main__", alter_sys=True)
+    elif kind == "path":
+        sys.path[0] = os.path.dirname(os.path.abspath(target))
+        runpy.run_path(target, run_name="__main__")
+    else:
+        sys.path[0] = ""
+        exec(compile(target, "<string>", "exec"), {"__name__": "__main__"})
+    return 0
+
+
+def print_exception():
+    """Without the frames of the zygote, like the interpreter would."""
+    exc_type, value, tb = sys.exc_info()
+    while tb is not None and tb.tb_frame.f_code.co_filename == __file__:
+        tb = tb.tb_next
+    traceback.print_exception(exc_type, value, tb)
+
+
+def child_main(request: dict, fds: list):
+    """Never returns."""
+    code = 1
+    try:
+        os.setsid()
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for target_fd, fd in enumerate(fds[:3]):
+            os.dup2(fd, target_fd)
+        for fd in fds:
+            os.close(fd)
+        try:
+            code = run_child(request)
+        except SystemExit as e:
+            code = exit_code(e)
+        except KeyboardInterrupt:
+            print_exception()
+            # Like the interpreter, exit as killed by SIGINT
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGINT)
+        except BaseException:
+            print_exception()
+        # What the interpreter does before exiting
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread() and not thread.daemon:
+                thread.join()
+        atexit._run_exitfuncs()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+class Zygote(object):
+
+    def __init__(self, control: socket.socket):
+        super(Zygote, self).__init__()
+        self.control = control
+        self.children = {}
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_sockets = socket.socketpair()
+
+    def serve(self):
+        for s in self.wakeup_sockets:
+            s.setblocking(False)
+        signal.set_wakeup_fd(self.wakeup_sockets[1].fileno(), warn_on_full_buffer=False)
+        # A Python handler is needed for the wakeup fd to be written
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        self.selector.register(self.control, selectors.EVENT_READ)
+        self.selector.register(self.wakeup_sockets[0], selectors.EVENT_READ)
+        send(self.control, {"ready": os.getpid()})
+
+        listening = True
+        while listening or self.children:
+            for key, _events in self.selector.select():
+                if key.fileobj is self.control:
+                    listening = self.on_request()
+                else:
+                    self.on_wakeup()
+
+    def on_request(self) -> bool:
+        """False once the launcher has closed the socket."""
+        try:
+            received = receive_request(self.control)
+        except OSError:
+            received = None
+        if received is None:
+            self.selector.unregister(self.control)
+            return False
+        request, fds = received
+        channel = socket.socket(fileno=fds[3])
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            pid = os.fork()
+        except OSError as e:
+            send(channel, {"error": "fork failed: {}".format(e)})
+            channel.close()
+            pid = None
+        if pid == 0:
+            # The child doesn't need the sockets of the zygote
+            self.selector.close()
+            for s in (self.control, *self.wakeup_sockets):
+                s.close()
+            for other_channel in self.children.values():
+                other_channel.close()
+            child_main(request, fds[:3] + [channel.detach()])
+        for fd in fds[:3]:
+            os.close(fd)
+        if pid is not None:
+            self.children[pid] = channel
+            send(channel, {"pid": pid})
+        return True
+
+    def on_wakeup(self):
+        try:
+            while self.wakeup_sockets[0].recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            channel = self.children.pop(pid, None)
+            if channel is not None:
+                send(channel, {"exit": os.waitstatus_to_exitcode(status)})
+                channel.close()
+
+
+def main():
+    # The folder of this script would shadow modules, e.g. profile
+    sys.path[0] = os.getcwd()
+    control = socket.socket(fileno=int(sys.argv[1]))
+    for module in sys.argv[2:]:
+        try:
+            __import__(module)
+        except BaseException:
+            send(control, {"error": "Could not import {}:\n{}".format(
+                module, traceback.format_exc())})
+            return 1
+    Zygote(control).serve()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())